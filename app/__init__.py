@@ -1,35 +1,45 @@
+import logging
+import time
+
 from flask import Flask
 from flask_login import LoginManager
 from config import Config
 
+# Momento de inicio del proceso, para medir el arranque en frío
+_import_started_at = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Por favor inicia sesión para acceder a esta página.'
 login_manager.login_message_category = 'info'
 
 def create_app():
+    # Logging asíncrono (cola + hilo escritor) antes de que nada emita registros
+    from app.services.logging_config import configure_logging
+    configure_logging()
+
     app = Flask(__name__)
     app.config.from_object(Config)
 
     login_manager.init_app(app)
 
-    # Importar e inicializar la base de datos
+    # Histogramas por ruta y cabecera Server-Timing
+    from app.services.metrics import metrics
+    metrics.init_app(app)
+
+    # Span raíz por petición (cabecera X-Trace-Id)
+    from app.services.tracing import tracer
+    tracer.init_app(app)
+
+    # Perfilador por muestreo (inactivo hasta que un admin lo arma)
+    from app.services.profiler import profiler
+    profiler.init_app(app)
+
+    # Importar la base de datos (sin llamadas a AWS; las tablas se crean con bootstrap.py)
     from app.models import DynamoDB
     db = DynamoDB()
-    
-    # Inicializar tablas necesarias
-    try:
-        print("📋 Inicializando tablas de DynamoDB...")
-        db.create_documents_table()
-        print("✅ Tabla 'documents' inicializada")
-    except Exception as e:
-        print(f"⚠️  Error inicializando tabla documents: {e}")
-    
-    try:
-        db.create_chat_table()
-        print("✅ Tabla 'chat_messages' inicializada")
-    except Exception as e:
-        print(f"⚠️  Error inicializando tabla chat_messages: {e}")
 
     # Importar blueprints
     from app.routes.auth import auth_bp
@@ -45,6 +55,10 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return db.get_user_by_id(user_id)
+        with metrics.timed('load_user'):
+            return db.get_user_by_id(user_id)
+
+    app.config['STARTUP_SECONDS'] = round(time.perf_counter() - _import_started_at, 4)
+    logger.info(f"Aplicación inicializada en {app.config['STARTUP_SECONDS']}s")
 
-    return app
\ No newline at end of file
+    return app
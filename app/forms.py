@@ -2,7 +2,26 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo, Length
 from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, SelectField, SubmitField, TextAreaField
+from wtforms import StringField, SelectField, SubmitField, TextAreaField, MultipleFileField
+from wtforms.validators import ValidationError
+
+
+# Extensiones y categorías permitidas para documentos
+ALLOWED_EXTENSIONS = [
+    'pdf', 'doc', 'docx', 'txt', 
+    'jpg', 'jpeg', 'png', 'gif',
+    'xls', 'xlsx', 'ppt', 'pptx'
+]
+
+CATEGORY_CHOICES = [
+    ('', 'Seleccionar categoría'),
+    ('reportes', '📊 Reportes'),
+    ('manuales', '📖 Manuales'),
+    ('contratos', '📝 Contratos'),
+    ('facturas', '🧾 Facturas'),
+    ('imagenes', '🖼️ Imágenes'),
+    ('otros', '📁 Otros')
+]
 
 
 class LoginForm(FlaskForm):
@@ -25,23 +44,33 @@ class RegistrationForm(FlaskForm):
 class DocumentUploadForm(FlaskForm):
     document = FileField('Documento', validators=[
         FileRequired(message='Por favor selecciona un archivo'),
-        FileAllowed([
-            'pdf', 'doc', 'docx', 'txt', 
-            'jpg', 'jpeg', 'png', 'gif',
-            'xls', 'xlsx', 'ppt', 'pptx'
-        ], 'Solo se permiten documentos e imágenes')
+        FileAllowed(ALLOWED_EXTENSIONS, 'Solo se permiten documentos e imágenes')
     ])
     description = StringField('Descripción', validators=[
         DataRequired(message='La descripción es requerida'),
         Length(max=200, message='La descripción no puede tener más de 200 caracteres')
     ])
-    category = SelectField('Categoría', choices=[
-        ('', 'Seleccionar categoría'),
-        ('reportes', '📊 Reportes'),
-        ('manuales', '📖 Manuales'),
-        ('contratos', '📝 Contratos'),
-        ('facturas', '🧾 Facturas'),
-        ('imagenes', '🖼️ Imágenes'),
-        ('otros', '📁 Otros')
-    ], validators=[DataRequired(message='La categoría es requerida')])
-    submit = SubmitField('📤 Subir Documento')
\ No newline at end of file
+    category = SelectField('Categoría', choices=CATEGORY_CHOICES,
+                           validators=[DataRequired(message='La categoría es requerida')])
+    submit = SubmitField('📤 Subir Documento')
+
+class BulkDocumentUploadForm(FlaskForm):
+    documents = MultipleFileField('Documentos')
+    description = StringField('Descripción', validators=[
+        DataRequired(message='La descripción es requerida'),
+        Length(max=200, message='La descripción no puede tener más de 200 caracteres')
+    ])
+    category = SelectField('Categoría', choices=CATEGORY_CHOICES,
+                           validators=[DataRequired(message='La categoría es requerida')])
+    submit = SubmitField('📤 Subir Documentos')
+
+    def validate_documents(self, field):
+        files = [f for f in field.data or [] if f and f.filename]
+        if not files:
+            raise ValidationError('Por favor selecciona al menos un archivo')
+        invalid = [
+            f.filename for f in files
+            if f.filename.rsplit('.', 1)[-1].lower() not in ALLOWED_EXTENSIONS
+        ]
+        if invalid:
+            raise ValidationError(f'Solo se permiten documentos e imágenes: {", ".join(invalid)}')
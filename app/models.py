@@ -1,11 +1,25 @@
 import boto3
 from flask_login import UserMixin
 from botocore.exceptions import ClientError
+import base64
+import json
+import logging
+import threading
+import time
 import uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
 from config import Config
+from app.services.cache import TTLCache
+from app.services.aws_clients import get_resource
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 class User(UserMixin):
+    # chat_epoch no forma parte del usuario cacheado: se lee con DynamoDB.get_conversation_id
     def __init__(self, user_id, email, password, role='user', created_at=None):
         self.id = user_id
         self.email = email
@@ -32,30 +46,184 @@ class User(UserMixin):
             created_at=data.get('created_at')
         )
 
+STATS_TABLE = 'app_stats'
+# Estado compartido por todos los workers: Idempotency-Key, límites de ritmo y sesiones del agente
+COORDINATION_TABLE = 'coordination'
+CHAT_TABLE = Config.CHAT_TABLE_NAME
+DEFAULT_CONVERSATION = '000000'
+STATS_GLOBAL_ID = 'global'
+
+
+def _conversation_id(chat_epoch):
+    """Conversación actual: limpiar el historial solo incrementa chat_epoch"""
+    return f"{int(chat_epoch or 0):06d}"
+
+
+class UserCache:
+    """
+    Caché en proceso de usuarios por ID y por email, compartida por todas las
+    instancias de DynamoDB. Guarda también los IDs desconocidos (caché negativa).
+    """
+    _NOT_FOUND = object()
+
+    def __init__(self):
+        self.cache = TTLCache(maxsize=Config.USER_CACHE_MAX_ENTRIES, ttl=Config.USER_CACHE_TTL)
+        self.negative_ttl = Config.USER_CACHE_NEGATIVE_TTL
+        self._lock = threading.Lock()
+        self.dynamodb_reads = 0
+
+    def get(self, kind, value):
+        """Devuelve (encontrado_en_cache, usuario_o_None)"""
+        entry = self.cache.get((kind, value))
+        if entry is None:
+            return False, None
+        if entry is self._NOT_FOUND:
+            return True, None
+        return True, entry
+
+    def record_read(self, kind):
+        """Contar una lectura en DynamoDB (fallo de caché); se llama desde varios hilos"""
+        with self._lock:
+            self.dynamodb_reads += 1
+        metrics.inc('bmc_user_cache_dynamodb_reads_total', 'Lecturas de usuarios en DynamoDB (fallos de la caché)',
+                    ('lookup',), (kind,))
+
+    def put(self, user):
+        self.cache.set(('id', user.id), user)
+        self.cache.set(('email', user.email), user)
+
+    def put_missing(self, kind, value):
+        self.cache.set((kind, value), self._NOT_FOUND, ttl=self.negative_ttl)
+
+    def invalidate(self, user_id=None, email=None):
+        if user_id:
+            self.cache.delete(('id', user_id))
+        if email:
+            self.cache.delete(('email', email))
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['dynamodb_reads'] = self.dynamodb_reads
+        stats['dynamodb_reads_saved'] = stats['hits']
+        return stats
+
+
+user_cache = UserCache()
+
+
+class PendingStats:
+    """
+    Contadores de app_stats acumulados en el proceso hasta el siguiente volcado
+    (DynamoDB.flush_chat_stats), para no hacer un UpdateItem por mensaje.
+    """
+
+    def __init__(self):
+        self._counters = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def add(self, stat_id, counters):
+        with self._lock:
+            self._counters[stat_id].update(counters)
+
+    def drain(self):
+        """Devolver {stat_id: contadores} y empezar de cero"""
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(Counter)
+        return counters
+
+    def stats(self):
+        with self._lock:
+            return {'pending_items': len(self._counters)}
+
+
+pending_chat_stats = PendingStats()
+
 class DynamoDB:
     def __init__(self):
+        # No se hacen llamadas a AWS al construir; las tablas se crean con bootstrap.py
         self.table_name = 'users'
-        self.dynamodb = boto3.resource(
-            'dynamodb',
-            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-            region_name=Config.AWS_REGION
-        )
-        self.table = self.dynamodb.Table(self.table_name)
-        self._ensure_table_exists()
+
+    @property
+    def dynamodb(self):
+        return get_resource('dynamodb')
+
+    @property
+    def table(self):
+        return self.dynamodb.Table(self.table_name)
 
     def _ensure_table_exists(self):
         try:
             # Intentar describir la tabla para ver si existe
             self.table.table_status
-            print(f"Tabla DynamoDB '{self.table_name}' existe y está accesible")
+            logger.debug("Tabla DynamoDB '%s' existe y está accesible", self.table_name)
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceNotFoundException':
-                print(f"Creando tabla DynamoDB '{self.table_name}'...")
+                logger.info(f"Creando tabla DynamoDB '{self.table_name}'...")
                 self._create_table()
             else:
                 raise e
 
+#Paginación de scans y queries
+
+    @staticmethod
+    def encode_cursor(last_evaluated_key):
+        """Convertir un LastEvaluatedKey en un cursor opaco para URLs"""
+        if not last_evaluated_key:
+            return None
+        raw = json.dumps(last_evaluated_key, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor, key_fields=()):
+        """
+        Convertir un cursor en ExclusiveStartKey. Devuelve None si no es válido:
+        tiene que ser un objeto de cadenas con (al menos) los campos key_fields.
+        """
+        if not cursor:
+            return None
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (ValueError, UnicodeError):
+            return None
+        if not isinstance(key, dict) or not key or not all(isinstance(v, str) for v in key.values()):
+            return None
+        if any(not key.get(field) for field in key_fields):
+            return None
+        return key
+
+    def _paginate(self, operation, **kwargs):
+        """Recorrer todas las páginas de un scan/query siguiendo LastEvaluatedKey"""
+        items = []
+        while True:
+            response = operation(**kwargs)
+            items.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return items
+            kwargs['ExclusiveStartKey'] = last_key
+
+    def _page(self, operation, limit, cursor=None, key_fields=(), **kwargs):
+        """Leer una sola página; devuelve (items, cursor_siguiente). Un cursor no válido lee la primera"""
+        start_key = self.decode_cursor(cursor, key_fields)
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        response = operation(Limit=limit, **kwargs)
+        return response.get('Items', []), self.encode_cursor(response.get('LastEvaluatedKey'))
+
+    def parallel_scan(self, table_name, total_segments=None, **kwargs):
+        """Scan completo de una tabla dividido en segmentos leídos en paralelo"""
+        total_segments = total_segments or Config.DYNAMODB_SCAN_SEGMENTS
+        table = self.dynamodb.Table(table_name)
+        if total_segments <= 1:
+            return self._paginate(table.scan, **kwargs)
+
+        def scan_segment(segment):
+            return self._paginate(table.scan, Segment=segment, TotalSegments=total_segments, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=total_segments) as executor:
+            segments = list(executor.map(scan_segment, range(total_segments)))
+        return [item for segment in segments for item in segment]
+
 #Tablas y gestion de usuarios
 
     def _create_table(self):
@@ -102,9 +270,9 @@ class DynamoDB:
                 }
             )
             table.wait_until_exists()
-            print(f"Tabla '{self.table_name}' creada exitosamente")
+            logger.info(f"Tabla '{self.table_name}' creada exitosamente")
         except ClientError as e:
-            print(f"Error creando tabla: {e}")
+            logger.error(f"Error creando tabla: {e}")
             raise e
 
     def create_user(self, user):
@@ -114,48 +282,125 @@ class DynamoDB:
                 Item=user_data,
                 ConditionExpression='attribute_not_exists(email)'
             )
-            print(f"Usuario {user.email} creado exitosamente")
+            user_cache.invalidate(user_id=user.id, email=user.email)
+            self._increment_stats(STATS_GLOBAL_ID, {'users_total': 1, f'users_{user.role}': 1})
+            logger.info(f"Usuario {user.email} creado exitosamente")
             return True
         except ClientError as e:
             if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                print(f"Usuario {user.email} ya existe")
+                logger.info(f"Usuario {user.email} ya existe")
                 return False
-            print(f"Error creando usuario: {e}")
+            logger.error(f"Error creando usuario: {e}")
             return False
 
     def get_user_by_email(self, email):
+        cached, user = user_cache.get('email', email)
+        if cached:
+            return user
         try:
+            user_cache.record_read('email')
             response = self.table.query(
                 IndexName='email-index',
                 KeyConditionExpression=boto3.dynamodb.conditions.Key('email').eq(email)
             )
             if response['Items']:
-                print(f"Usuario {email} encontrado")
-                return User.from_dict(response['Items'][0])
-            print(f"Usuario {email} no encontrado")
+                logger.debug("Usuario %s encontrado", email)
+                user = User.from_dict(response['Items'][0])
+                user_cache.put(user)
+                return user
+            logger.debug("Usuario %s no encontrado", email)
             return None
         except ClientError as e:
-            print(f"Error buscando usuario por email: {e}")
+            logger.error(f"Error buscando usuario por email: {e}")
             return None
 
     def get_user_by_id(self, user_id):
+        cached, user = user_cache.get('id', user_id)
+        if cached:
+            return user
         try:
+            user_cache.record_read('id')
             response = self.table.get_item(Key={'user_id': user_id})
             if 'Item' in response:
-                return User.from_dict(response['Item'])
+                user = User.from_dict(response['Item'])
+                user_cache.put(user)
+                return user
+            user_cache.put_missing('id', user_id)
             return None
         except ClientError as e:
-            print(f"Error buscando usuario por ID: {e}")
+            logger.error(f"Error buscando usuario por ID: {e}")
+            return None
+
+    def update_user_role(self, user_id, role):
+        """Cambiar el rol de un usuario e invalidar su entrada en caché"""
+        try:
+            response = self.table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET #role = :role',
+                ConditionExpression='attribute_exists(user_id)',
+                ExpressionAttributeNames={'#role': 'role'},
+                ExpressionAttributeValues={':role': role},
+                ReturnValues='ALL_OLD'
+            )
+            old_user = response['Attributes']
+            user_cache.invalidate(user_id=user_id, email=old_user.get('email'))
+            old_role = old_user.get('role', 'user')
+            if old_role != role:
+                self._increment_stats(STATS_GLOBAL_ID, {f'users_{old_role}': -1, f'users_{role}': 1})
+            return True
+        except ClientError as e:
+            logger.error(f"Error actualizando rol de usuario: {e}")
+            return False
+
+    def get_conversation_id(self, user_id):
+        """
+        Conversación actual del usuario. Se lee con ConsistentRead y nunca de
+        user_cache: tras limpiar el historial todos los procesos deben usar la
+        nueva enseguida (si no, guardarían mensajes que el purgado borraría).
+        Los errores de DynamoDB se propagan.
+        """
+        response = self.table.get_item(
+            Key={'user_id': user_id},
+            ProjectionExpression='chat_epoch',
+            ConsistentRead=True
+        )
+        return _conversation_id(response.get('Item', {}).get('chat_epoch'))
+
+    def start_new_conversation(self, user_id):
+        """
+        Incrementar chat_epoch del usuario (O(1)): las lecturas pasan a ignorar
+        los mensajes anteriores. Devuelve la nueva conversation_id o None.
+        """
+        try:
+            response = self.table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='ADD chat_epoch :one',
+                ConditionExpression='attribute_exists(user_id)',
+                ExpressionAttributeValues={':one': 1},
+                ReturnValues='UPDATED_NEW'
+            )
+            return _conversation_id(response['Attributes']['chat_epoch'])
+        except ClientError as e:
+            logger.error(f"Error iniciando nueva conversación: {e}")
             return None
 
     def list_users(self):
+        """Todos los usuarios (scan paralelo y paginado completo)"""
         try:
-            response = self.table.scan()
-            return [User.from_dict(item) for item in response.get('Items', [])]
+            return [User.from_dict(item) for item in self.parallel_scan(self.table_name)]
         except ClientError as e:
-            print(f"Error listando usuarios: {e}")
+            logger.error(f"Error listando usuarios: {e}")
             return []
 
+    def list_users_page(self, limit=50, cursor=None):
+        """Una página de usuarios; devuelve (usuarios, cursor_siguiente)"""
+        try:
+            items, next_cursor = self._page(self.table.scan, limit, cursor, key_fields=('user_id',))
+            return [User.from_dict(item) for item in items], next_cursor
+        except ClientError as e:
+            logger.error(f"Error listando usuarios: {e}")
+            return [], None
+
 #Tablas y gestion de documentos
 
     def create_documents_table(self):
@@ -203,148 +448,651 @@ class DynamoDB:
                 }
             )
             table.wait_until_exists()
-            print("Tabla 'documents' creada exitosamente")
+            logger.info("Tabla 'documents' creada exitosamente")
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceInUseException':
-                print("Tabla 'documents' ya existe")
+                logger.info("Tabla 'documents' ya existe")
             else:
-                print(f"Error creando tabla documents: {e}")
+                logger.error(f"Error creando tabla documents: {e}")
 
     def save_document(self, document):
         """Guardar documento en DynamoDB"""
         try:
-            self.dynamodb.Table('documents').put_item(Item=document.to_dict())
+            response = self.dynamodb.Table('documents').put_item(
+                Item=document.to_dict(),
+                ReturnValues='ALL_OLD'
+            )
+            # Si se sobrescribe un documento existente se descuenta el anterior
+            old = response.get('Attributes')
+            self._record_documents([document], sign=1)
+            if old:
+                self._record_documents([Document.from_dict(old)], sign=-1)
+            return True
+        except ClientError as e:
+            logger.error(f"Error guardando documento: {e}")
+            return False
+
+    def save_documents_batch(self, documents):
+        """Guardar varios documentos con BatchWriteItem (lotes de 25 con reintentos)"""
+        try:
+            with self.dynamodb.Table('documents').batch_writer() as batch:
+                for document in documents:
+                    batch.put_item(Item=document.to_dict())
+            self._record_documents(documents, sign=1)
             return True
         except ClientError as e:
-            print(f"Error guardando documento: {e}")
+            logger.error(f"Error guardando documentos en lote: {e}")
             return False
 
     def get_user_documents(self, user_id):
         """Obtener documentos de un usuario"""
         try:
-            response = self.dynamodb.Table('documents').query(
+            items = self._paginate(
+                self.dynamodb.Table('documents').query,
                 IndexName='user-id-index',
                 KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id)
             )
-            return [Document.from_dict(item) for item in response.get('Items', [])]
+            return [Document.from_dict(item) for item in items]
         except ClientError as e:
-            print(f"Error obteniendo documentos: {e}")
+            logger.error(f"Error obteniendo documentos: {e}")
             return []
 
     def get_all_documents(self):
-        """Obtener todos los documentos (para admin)"""
+        """Obtener todos los documentos (scan paralelo y paginado completo)"""
         try:
-            response = self.dynamodb.Table('documents').scan()
-            return [Document.from_dict(item) for item in response.get('Items', [])]
+            return [Document.from_dict(item) for item in self.parallel_scan('documents')]
         except ClientError as e:
-            print(f"Error obteniendo todos los documentos: {e}")
+            logger.error(f"Error obteniendo todos los documentos: {e}")
             return []
 
+    def get_documents_page(self, limit=50, cursor=None):
+        """Una página de documentos; devuelve (documentos, cursor_siguiente)"""
+        try:
+            items, next_cursor = self._page(self.dynamodb.Table('documents').scan, limit, cursor,
+                                            key_fields=('document_id',))
+            return [Document.from_dict(item) for item in items], next_cursor
+        except ClientError as e:
+            logger.error(f"Error obteniendo documentos: {e}")
+            return [], None
+
+    def update_document_ingestion(self, document_id, status, job_id=None):
+        """Actualizar el estado de indexación de un documento"""
+        try:
+            self.dynamodb.Table('documents').update_item(
+                Key={'document_id': document_id},
+                UpdateExpression='SET ingestion_status = :status, ingestion_job_id = :job_id',
+                ConditionExpression='attribute_exists(document_id)',
+                ExpressionAttributeValues={':status': status, ':job_id': job_id}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Error actualizando estado de indexación: {e}")
+            return False
+
     def delete_document(self, document_id):
         """Eliminar documento de DynamoDB"""
         try:
-            self.dynamodb.Table('documents').delete_item(Key={'document_id': document_id})
+            response = self.dynamodb.Table('documents').delete_item(
+                Key={'document_id': document_id},
+                ReturnValues='ALL_OLD'
+            )
+            if response.get('Attributes'):
+                self._record_documents([Document.from_dict(response['Attributes'])], sign=-1)
             return True
         except ClientError as e:
-            print(f"Error eliminando documento: {e}")
+            logger.error(f"Error eliminando documento: {e}")
             return False
 
 #Tablas y gestion de chat
 
     def create_chat_table(self):
-        """Crear tabla para historial de chat si no existe"""
+        """
+        Crear tabla para historial de chat si no existe.
+        Clave: user_id (HASH) + sort_key (RANGE) = '<conversación>#<timestamp>#<message_id>',
+        así el historial de un usuario se lee en orden con una query a una sola partición.
+        """
         try:
             table = self.dynamodb.create_table(
-                TableName='chat_messages',
+                TableName=CHAT_TABLE,
                 KeySchema=[
                     {
-                        'AttributeName': 'message_id',
+                        'AttributeName': 'user_id',
                         'KeyType': 'HASH'
+                    },
+                    {
+                        'AttributeName': 'sort_key',
+                        'KeyType': 'RANGE'
                     }
                 ],
                 AttributeDefinitions=[
                     {
-                        'AttributeName': 'message_id',
+                        'AttributeName': 'user_id',
                         'AttributeType': 'S'
                     },
                     {
-                        'AttributeName': 'user_id',
+                        'AttributeName': 'sort_key',
                         'AttributeType': 'S'
                     }
                 ],
-                GlobalSecondaryIndexes=[
-                    {
-                        'IndexName': 'user-id-index',
-                        'KeySchema': [
-                            {
-                                'AttributeName': 'user_id',
-                                'KeyType': 'HASH'
-                            }
-                        ],
-                        'Projection': {
-                            'ProjectionType': 'ALL'
-                        },
-                        'ProvisionedThroughput': {
-                            'ReadCapacityUnits': 5,
-                            'WriteCapacityUnits': 5
-                        }
-                    }
-                ],
                 ProvisionedThroughput={
                     'ReadCapacityUnits': 5,
                     'WriteCapacityUnits': 5
                 }
             )
             table.wait_until_exists()
-            print("Tabla 'chat_messages' creada exitosamente")
+            logger.info(f"Tabla '{CHAT_TABLE}' creada exitosamente")
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceInUseException':
-                print("Tabla 'chat_messages' ya existe")
+                logger.info(f"Tabla '{CHAT_TABLE}' ya existe")
             else:
-                print(f"Error creando tabla chat_messages: {e}")
+                logger.error(f"Error creando tabla {CHAT_TABLE}: {e}")
 
     def save_chat_message(self, message):
         """Guardar mensaje de chat en DynamoDB"""
         try:
-            self.dynamodb.Table('chat_messages').put_item(Item=message.to_dict())
+            self.dynamodb.Table(CHAT_TABLE).put_item(Item=message.to_dict())
+            self._record_chat_messages([message])
             return True
         except ClientError as e:
-            print(f"Error guardando mensaje de chat: {e}")
+            logger.error(f"Error guardando mensaje de chat: {e}")
             return False
 
-    def get_user_chat_history(self, user_id, limit=50):
-        """Obtener historial de chat de un usuario"""
+    def batch_save_chat_messages(self, messages, max_attempts=5):
+        """
+        Guardar mensajes de chat con BatchWriteItem (máximo 25 por llamada),
+        reintentando los UnprocessedItems con espera exponencial.
+        Devuelve la lista de mensajes que no se pudieron guardar.
+        """
+        failed = []
+        for start in range(0, len(messages), 25):
+            group = messages[start:start + 25]
+            request_items = {
+                CHAT_TABLE: [{'PutRequest': {'Item': message.to_dict()}} for message in group]
+            }
+            attempt = 0
+            try:
+                while request_items:
+                    attempt += 1
+                    response = self.dynamodb.batch_write_item(RequestItems=request_items)
+                    request_items = response.get('UnprocessedItems') or {}
+                    if request_items:
+                        if attempt >= max_attempts:
+                            pending_ids = {
+                                r['PutRequest']['Item']['message_id']
+                                for r in request_items.get(CHAT_TABLE, [])
+                            }
+                            failed.extend(m for m in group if m.message_id in pending_ids)
+                            break
+                        time.sleep(min(0.05 * (2 ** attempt), 2))
+            except ClientError as e:
+                logger.error(f"Error guardando lote de mensajes de chat: {e}")
+                failed.extend(group)
+        
+        failed_ids = {message.message_id for message in failed}
+        self._record_chat_messages([m for m in messages if m.message_id not in failed_ids])
+        return failed
+
+    def get_user_chat_history(self, user_id, limit=50, before=None, after=None,
+                              conversation_id=None):
+        """
+        Obtener historial de chat de un usuario en orden cronológico.
+        
+        Sin cursores devuelve los `limit` mensajes más recientes. `before` / `after`
+        son cursores (sort_key codificado) para leer mensajes anteriores o
+        posteriores. Devuelve (mensajes, cursores) donde cursores tiene
+        'before' (None si no hay más antiguos) y 'after'.
+        """
+        conversation_id = conversation_id or DEFAULT_CONVERSATION
+        prefix = f"{conversation_id}#"
+        key_condition = (
+            boto3.dynamodb.conditions.Key('user_id').eq(user_id)
+            & boto3.dynamodb.conditions.Key('sort_key').begins_with(prefix)
+        )
+        kwargs = {
+            'KeyConditionExpression': key_condition,
+            'Limit': limit,
+            'ScanIndexForward': after is not None  # Descendente salvo al pedir mensajes nuevos
+        }
+        raw_cursor = after if after is not None else before
+        if raw_cursor:
+            # Un cursor no válido o de otra conversación no devuelve mensajes
+            cursor = self.decode_cursor(raw_cursor, ('sort_key',))
+            if cursor is None or not cursor['sort_key'].startswith(prefix):
+                return [], {'before': None, 'after': after}
+            kwargs['ExclusiveStartKey'] = {'user_id': user_id, 'sort_key': cursor['sort_key']}
+        
         try:
-            response = self.dynamodb.Table('chat_messages').query(
-                IndexName='user-id-index',
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id),
-                Limit=limit,
-                ScanIndexForward=False  # Orden descendente (más recientes primero)
+            response = self.dynamodb.Table(CHAT_TABLE).query(**kwargs)
+        except ClientError as e:
+            logger.error(f"Error obteniendo historial de chat: {e}")
+            return [], {'before': None, 'after': None}
+        
+        items = response.get('Items', [])
+        has_more = 'LastEvaluatedKey' in response
+        if after is None:
+            items.reverse()  # Más antiguo primero para la conversación
+        messages = [ChatMessage.from_dict(item) for item in items]
+        
+        cursors = {'before': None, 'after': after}
+        if messages:
+            oldest, newest = messages[0], messages[-1]
+            if after is None and has_more:
+                cursors['before'] = self.encode_cursor({'sort_key': oldest.sort_key})
+            cursors['after'] = self.encode_cursor({'sort_key': newest.sort_key})
+        return messages, cursors
+
+    def get_conversation_opening(self, user_id, conversation_id=None, limit=3):
+        """
+        Primeros mensajes de la conversación (más antiguo primero) o None si
+        falla la lectura. Basta para saber si el siguiente es el primer turno y
+        si el único turno previo se sirvió desde la caché de respuestas.
+        """
+        conversation_id = conversation_id or DEFAULT_CONVERSATION
+        try:
+            response = self.dynamodb.Table(CHAT_TABLE).query(
+                KeyConditionExpression=(
+                    boto3.dynamodb.conditions.Key('user_id').eq(user_id)
+                    & boto3.dynamodb.conditions.Key('sort_key').begins_with(f"{conversation_id}#")
+                ),
+                Limit=limit
             )
-            messages = [ChatMessage.from_dict(item) for item in response.get('Items', [])]
-            # Ordenar por timestamp (más antiguo primero para conversación)
-            messages.sort(key=lambda x: x.timestamp)
-            return messages
+            return [ChatMessage.from_dict(item) for item in response.get('Items', [])]
         except ClientError as e:
-            print(f"Error obteniendo historial de chat: {e}")
-            return []
+            logger.error(f"Error consultando historial de chat: {e}")
+            return None
+
+    def batch_delete_chat_messages(self, keys, max_attempts=5):
+        """
+        Borrar mensajes por clave con BatchWriteItem (máximo 25 por llamada),
+        reintentando los UnprocessedItems. Devuelve cuántos no se pudieron borrar.
+        """
+        failed = 0
+        for start in range(0, len(keys), 25):
+            request_items = {
+                CHAT_TABLE: [{'DeleteRequest': {'Key': key}} for key in keys[start:start + 25]]
+            }
+            attempt = 0
+            try:
+                while request_items:
+                    attempt += 1
+                    response = self.dynamodb.batch_write_item(RequestItems=request_items)
+                    request_items = response.get('UnprocessedItems') or {}
+                    if request_items:
+                        if attempt >= max_attempts:
+                            failed += len(request_items.get(CHAT_TABLE, []))
+                            break
+                        time.sleep(min(0.05 * (2 ** attempt), 2))
+            except ClientError as e:
+                logger.error(f"Error borrando lote de mensajes de chat: {e}")
+                failed += len(keys[start:start + 25])
+        return failed
+
+    def purge_chat_history(self, user_id, before_conversation_id, max_workers=None):
+        """
+        Borrar los mensajes de las conversaciones anteriores a before_conversation_id.
+        Lee las claves página a página y borra cada página con BatchWriteItem en paralelo.
+        Devuelve (borrados, fallidos).
+        """
+        table = self.dynamodb.Table(CHAT_TABLE)
+        kwargs = {
+            'KeyConditionExpression': (
+                boto3.dynamodb.conditions.Key('user_id').eq(user_id)
+                & boto3.dynamodb.conditions.Key('sort_key').lt(f"{before_conversation_id}#")
+            ),
+            'ProjectionExpression': 'user_id, sort_key'
+        }
+        deleted = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max_workers or Config.CHAT_PURGE_MAX_WORKERS) as executor:
+            while True:
+                response = table.query(**kwargs)
+                keys = [{'user_id': item['user_id'], 'sort_key': item['sort_key']}
+                        for item in response.get('Items', [])]
+                groups = [keys[start:start + 25] for start in range(0, len(keys), 25)]
+                page_failed = sum(executor.map(self.batch_delete_chat_messages, groups))
+                deleted += len(keys) - page_failed
+                failed += page_failed
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return deleted, failed
+
+    def enable_chat_ttl(self):
+        """Activar el TTL de DynamoDB sobre expires_at (solo si CHAT_MESSAGE_TTL_DAYS > 0)"""
+        if Config.CHAT_MESSAGE_TTL_DAYS <= 0:
+            logger.info(f"TTL de '{CHAT_TABLE}' desactivado (CHAT_MESSAGE_TTL_DAYS=0)")
+            return
+        try:
+            self.dynamodb.meta.client.update_time_to_live(
+                TableName=CHAT_TABLE,
+                TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'}
+            )
+            logger.info(f"TTL activado en '{CHAT_TABLE}' (expires_at)")
+        except ClientError as e:
+            if 'already enabled' in str(e):
+                logger.info(f"TTL ya activo en '{CHAT_TABLE}'")
+            else:
+                logger.error(f"Error activando TTL en {CHAT_TABLE}: {e}")
+
+#Estadísticas materializadas
+
+    def create_stats_table(self):
+        """Crear tabla de estadísticas si no existe"""
+        try:
+            table = self.dynamodb.create_table(
+                TableName=STATS_TABLE,
+                KeySchema=[
+                    {
+                        'AttributeName': 'stat_id',
+                        'KeyType': 'HASH'
+                    }
+                ],
+                AttributeDefinitions=[
+                    {
+                        'AttributeName': 'stat_id',
+                        'AttributeType': 'S'
+                    }
+                ],
+                ProvisionedThroughput={
+                    'ReadCapacityUnits': 5,
+                    'WriteCapacityUnits': 5
+                }
+            )
+            table.wait_until_exists()
+            logger.info(f"Tabla '{STATS_TABLE}' creada exitosamente")
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceInUseException':
+                logger.info(f"Tabla '{STATS_TABLE}' ya existe")
+            else:
+                logger.error(f"Error creando tabla {STATS_TABLE}: {e}")
 
-    def clear_user_chat_history(self, user_id):
-        """Eliminar historial de chat de un usuario"""
+    def _increment_stats(self, stat_id, counters):
+        """
+        Sumar contadores de forma atómica con ADD (las estadísticas nunca
+        bloquean la escritura principal). Devuelve False si la escritura falla.
+        """
+        counters = {name: value for name, value in counters.items() if value}
+        if not counters:
+            return True
+        names = {f'#c{i}': name for i, name in enumerate(counters)}
+        values = {f':v{i}': Decimal(value) for i, value in enumerate(counters.values())}
         try:
-            messages = self.get_user_chat_history(user_id)
-            with self.dynamodb.Table('chat_messages').batch_writer() as batch:
-                for message in messages:
-                    batch.delete_item(Key={'message_id': message.message_id})
+            self.dynamodb.Table(STATS_TABLE).update_item(
+                Key={'stat_id': stat_id},
+                UpdateExpression='ADD ' + ', '.join(f'#c{i} :v{i}' for i in range(len(counters))),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
             return True
         except ClientError as e:
-            print(f"Error eliminando historial de chat: {e}")
+            logger.error(f"Error actualizando estadísticas: {e}")
             return False
+
+    def _record_documents(self, documents, sign=1):
+        counters = Counter()
+        for document in documents:
+            counters['documents_total'] += sign
+            counters['documents_bytes'] += sign * int(document.file_size or 0)
+            counters[f'category_{document.category or "sin_categoria"}'] += sign
+        self._increment_stats(STATS_GLOBAL_ID, counters)
+
+    def _record_chat_messages(self, messages):
+        """Acumular los mensajes guardados en el proceso; se escriben con flush_chat_stats"""
+        if not messages:
+            return
+        pending_chat_stats.add(STATS_GLOBAL_ID, {'messages_total': len(messages)})
+        per_day = Counter(message.timestamp[:10] for message in messages)
+        for day, count in per_day.items():
+            pending_chat_stats.add(f'messages#{day}', {'count': count})
+
+    def flush_chat_stats(self):
+        """Escribir los contadores de mensajes acumulados: un ADD por elemento (los fallidos se conservan)"""
+        for stat_id, counters in pending_chat_stats.drain().items():
+            if not self._increment_stats(stat_id, counters):
+                pending_chat_stats.add(stat_id, counters)
+
+    def get_stats(self, days=7):
+        """Leer las estadísticas materializadas: un GetItem global y un BatchGetItem de los últimos días"""
+        empty = {
+            'users_total': 0, 'users_admin': 0, 'users_user': 0,
+            'documents_total': 0, 'documents_bytes': 0, 'messages_total': 0,
+            'documents_by_category': {}, 'messages_per_day': []
+        }
+        try:
+            item = self.dynamodb.Table(STATS_TABLE).get_item(
+                Key={'stat_id': STATS_GLOBAL_ID}
+            ).get('Item', {})
+            
+            today = datetime.utcnow().date()
+            day_keys = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+            response = self.dynamodb.batch_get_item(RequestItems={
+                STATS_TABLE: {'Keys': [{'stat_id': f'messages#{day}'} for day in day_keys]}
+            })
+            per_day = {
+                row['stat_id'].split('#', 1)[1]: int(row.get('count', 0))
+                for row in response.get('Responses', {}).get(STATS_TABLE, [])
+            }
+        except ClientError as e:
+            logger.error(f"Error leyendo estadísticas: {e}")
+            return empty
+        
+        stats = dict(empty)
+        for name in ('users_total', 'users_admin', 'users_user', 'documents_total', 'documents_bytes', 'messages_total'):
+            stats[name] = int(item.get(name, 0))
+        stats['documents_by_category'] = {
+            name[len('category_'):]: int(value)
+            for name, value in item.items()
+            if name.startswith('category_') and int(value)
+        }
+        stats['messages_per_day'] = [{'day': day, 'count': per_day.get(day, 0)} for day in day_keys]
+        return stats
+
+    def rebuild_stats(self):
+        """Recalcular todas las estadísticas desde cero con scans paralelos (backfill)"""
+        users = self.parallel_scan(self.table_name)
+        documents = [Document.from_dict(item) for item in self.parallel_scan('documents')]
+        messages = self.parallel_scan(CHAT_TABLE, ProjectionExpression='#ts', ExpressionAttributeNames={'#ts': 'timestamp'})
+        
+        global_item = {'stat_id': STATS_GLOBAL_ID}
+        global_item['users_total'] = len(users)
+        for role, count in Counter(user.get('role', 'user') for user in users).items():
+            global_item[f'users_{role}'] = count
+        global_item['documents_total'] = len(documents)
+        global_item['documents_bytes'] = sum(int(document.file_size or 0) for document in documents)
+        for category, count in Counter(document.category or 'sin_categoria' for document in documents).items():
+            global_item[f'category_{category}'] = count
+        global_item['messages_total'] = len(messages)
+        
+        with self.dynamodb.Table(STATS_TABLE).batch_writer() as batch:
+            batch.put_item(Item=global_item)
+            for day, count in Counter(m['timestamp'][:10] for m in messages if m.get('timestamp')).items():
+                batch.put_item(Item={'stat_id': f'messages#{day}', 'count': count})
+        return global_item
+
+#Coordinación entre workers
+
+    def create_coordination_table(self):
+        """Crear la tabla de coordinación (clave pk, TTL sobre expires_at) si no existe"""
+        try:
+            table = self.dynamodb.create_table(
+                TableName=COORDINATION_TABLE,
+                KeySchema=[
+                    {
+                        'AttributeName': 'pk',
+                        'KeyType': 'HASH'
+                    }
+                ],
+                AttributeDefinitions=[
+                    {
+                        'AttributeName': 'pk',
+                        'AttributeType': 'S'
+                    }
+                ],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            table.wait_until_exists()
+            logger.info(f"Tabla '{COORDINATION_TABLE}' creada exitosamente")
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceInUseException':
+                logger.info(f"Tabla '{COORDINATION_TABLE}' ya existe")
+            else:
+                logger.error(f"Error creando tabla {COORDINATION_TABLE}: {e}")
+                return
+        
+        # Los elementos caducados se borran solos; las condiciones ya los tratan como inexistentes
+        try:
+            self.dynamodb.meta.client.update_time_to_live(
+                TableName=COORDINATION_TABLE,
+                TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'}
+            )
+        except ClientError as e:
+            if 'already enabled' not in str(e):
+                logger.error(f"Error activando TTL en {COORDINATION_TABLE}: {e}")
+
+    def claim_idempotency_key(self, pk, request_hash, claim_timeout):
+        """
+        Reservar una Idempotency-Key con una escritura condicional. Devuelve
+        (estado, resultado): 'claimed' (quien llama ejecuta y luego completa),
+        'replay' con el resultado guardado, 'mismatch' si la clave se usó con
+        otra petición o 'in_progress' si otro worker la está procesando.
+        Una reserva abandonada caduca tras claim_timeout segundos.
+        """
+        table = self.dynamodb.Table(COORDINATION_TABLE)
+        for _ in range(3):
+            now = int(time.time())
+            try:
+                table.put_item(
+                    Item={
+                        'pk': pk,
+                        'request_hash': request_hash,
+                        'status': 'IN_PROGRESS',
+                        'expires_at': now + int(claim_timeout)
+                    },
+                    ConditionExpression='attribute_not_exists(pk) OR expires_at < :now',
+                    ExpressionAttributeValues={':now': now}
+                )
+                return 'claimed', None
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    # Sin la tabla se procesa igualmente (sin protección frente a duplicados)
+                    logger.error(f"Error reservando Idempotency-Key: {e}")
+                    return 'claimed', None
+            
+            item = table.get_item(Key={'pk': pk}, ConsistentRead=True).get('Item')
+            if item is None:
+                continue  # Se liberó entre la escritura y la lectura
+            if item.get('request_hash') != request_hash:
+                return 'mismatch', None
+            if item.get('status') == 'COMPLETE':
+                return 'replay', json.loads(item['result'])
+            return 'in_progress', None
+        return 'in_progress', None
+
+    def complete_idempotency_key(self, pk, result, ttl):
+        """Guardar el resultado exitoso durante ttl segundos, o liberar la clave si falló"""
+        table = self.dynamodb.Table(COORDINATION_TABLE)
+        try:
+            if result is not None and result.get('success'):
+                table.update_item(
+                    Key={'pk': pk},
+                    UpdateExpression='SET #status = :complete, #result = :result, expires_at = :expires_at',
+                    ConditionExpression='attribute_exists(pk)',
+                    ExpressionAttributeNames={'#status': 'status', '#result': 'result'},
+                    ExpressionAttributeValues={
+                        ':complete': 'COMPLETE',
+                        ':result': json.dumps(result, ensure_ascii=False, default=str),
+                        ':expires_at': int(time.time()) + int(ttl)
+                    }
+                )
+            else:
+                table.delete_item(
+                    Key={'pk': pk},
+                    ConditionExpression='#status = :in_progress',
+                    ExpressionAttributeNames={'#status': 'status'},
+                    ExpressionAttributeValues={':in_progress': 'IN_PROGRESS'}
+                )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Error completando Idempotency-Key: {e}")
+
+    def take_rate_token(self, pk, interval, burst):
+        """
+        Límite de ritmo compartido (GCRA): admite una petición cada interval
+        segundos con ráfagas de burst. Devuelve 0 si se admite o los segundos
+        hasta la siguiente plaza. El estado es un único instante teórico de
+        llegada (tat) que se actualiza con una escritura condicional.
+        """
+        table = self.dynamodb.Table(COORDINATION_TABLE)
+        try:
+            for _ in range(3):
+                now = time.time()
+                item = table.get_item(Key={'pk': pk}, ConsistentRead=True).get('Item')
+                previous = item.get('tat') if item else None
+                tat = max(float(previous), now) if previous is not None else now
+                wait = tat - now - (burst - 1) * interval
+                if wait > 0:
+                    return wait
+                
+                new_tat = tat + interval
+                params = {
+                    'Item': {
+                        'pk': pk,
+                        'tat': Decimal(f'{new_tat:.3f}'),
+                        'expires_at': int(new_tat) + 1
+                    }
+                }
+                if previous is None:
+                    params['ConditionExpression'] = 'attribute_not_exists(pk)'
+                else:
+                    params['ConditionExpression'] = 'tat = :previous'
+                    params['ExpressionAttributeValues'] = {':previous': previous}
+                try:
+                    table.put_item(**params)
+                    return 0
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+            # Otro worker ganó las tres carreras: el usuario está enviando en paralelo
+            return interval
+        except ClientError as e:
+            # Sin la tabla no se limita el ritmo
+            logger.error(f"Error en el límite de ritmo: {e}")
+            return 0
+
+    def acquire_lease(self, pk, owner, ttl):
+        """Reservar pk para owner durante ttl segundos (False si otro la tiene)"""
+        now = int(time.time())
+        try:
+            self.dynamodb.Table(COORDINATION_TABLE).put_item(
+                Item={'pk': pk, 'lease_owner': owner, 'expires_at': now + int(ttl)},
+                ConditionExpression='attribute_not_exists(pk) OR expires_at < :now',
+                ExpressionAttributeValues={':now': now}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            logger.error(f"Error reservando {pk}: {e}")
+            return True
+
+    def release_lease(self, pk, owner):
+        """Liberar la reserva solo si sigue siendo de owner"""
+        try:
+            self.dynamodb.Table(COORDINATION_TABLE).delete_item(
+                Key={'pk': pk},
+                ConditionExpression='lease_owner = :owner',
+                ExpressionAttributeValues={':owner': owner}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Error liberando {pk}: {e}")
         
 class Document:
     def __init__(self, document_id, filename, original_filename, s3_key, file_url, 
                  file_size, file_type, user_id, description=None, category=None, 
-                 created_at=None):
+                 created_at=None, ingestion_status=None, ingestion_since=None,
+                 ingestion_job_id=None, checksum=None):
         self.document_id = document_id
         self.filename = filename
         self.original_filename = original_filename
@@ -352,10 +1100,15 @@ class Document:
         self.file_url = file_url
         self.file_size = file_size
         self.file_type = file_type
+        self.checksum = checksum  # SHA-256 del contenido
         self.user_id = user_id
         self.description = description
         self.category = category
         self.created_at = created_at or datetime.utcnow().isoformat()
+        # Estado de indexación en la Knowledge Base: PENDING, INDEXING, INDEXED, FAILED, UNCONFIRMED
+        self.ingestion_status = ingestion_status
+        self.ingestion_since = ingestion_since
+        self.ingestion_job_id = ingestion_job_id
 
     def to_dict(self):
         return {
@@ -366,10 +1119,14 @@ class Document:
             'file_url': self.file_url,
             'file_size': self.file_size,
             'file_type': self.file_type,
+            'checksum': self.checksum,
             'user_id': self.user_id,
             'description': self.description,
             'category': self.category,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'ingestion_status': self.ingestion_status,
+            'ingestion_since': self.ingestion_since,
+            'ingestion_job_id': self.ingestion_job_id
         }
 
     @staticmethod
@@ -382,30 +1139,55 @@ class Document:
             file_url=data.get('file_url'),
             file_size=data.get('file_size'),
             file_type=data.get('file_type'),
+            checksum=data.get('checksum'),
             user_id=data.get('user_id'),
             description=data.get('description'),
             category=data.get('category'),
-            created_at=data.get('created_at')
+            created_at=data.get('created_at'),
+            ingestion_status=data.get('ingestion_status'),
+            ingestion_since=data.get('ingestion_since'),
+            ingestion_job_id=data.get('ingestion_job_id')
         )
 
 class ChatMessage:
-    def __init__(self, message_id, user_id, role, content, timestamp=None, model_used=None):
+    def __init__(self, message_id, user_id, role, content, timestamp=None, model_used=None,
+                 conversation_id=None):
         self.message_id = message_id
         self.user_id = user_id
         self.role = role  # 'user' or 'assistant'
         self.content = content
         self.timestamp = timestamp or datetime.utcnow().isoformat()
         self.model_used = model_used
+        self.conversation_id = conversation_id or DEFAULT_CONVERSATION
+
+    @property
+    def expires_at(self):
+        """Época de expiración para el TTL de DynamoDB (None salvo que se configure CHAT_MESSAGE_TTL_DAYS)"""
+        if not Config.CHAT_MESSAGE_TTL_DAYS:
+            return None
+        created = datetime.fromisoformat(self.timestamp)
+        return int((created - datetime(1970, 1, 1)).total_seconds()) + Config.CHAT_MESSAGE_TTL_DAYS * 86400
+
+    @property
+    def sort_key(self):
+        """Clave de orden: '<conversación>#<timestamp con microsegundos>#<message_id>'"""
+        timestamp = datetime.fromisoformat(self.timestamp).strftime('%Y-%m-%dT%H:%M:%S.%f')
+        return f"{self.conversation_id}#{timestamp}#{self.message_id}"
 
     def to_dict(self):
-        return {
+        data = {
             'message_id': self.message_id,
             'user_id': self.user_id,
+            'sort_key': self.sort_key,
+            'conversation_id': self.conversation_id,
             'role': self.role,
             'content': self.content,
             'timestamp': self.timestamp,
             'model_used': self.model_used
         }
+        if self.expires_at:
+            data['expires_at'] = self.expires_at
+        return data
 
     @staticmethod
     def from_dict(data):
@@ -415,7 +1197,6 @@ class ChatMessage:
             role=data.get('role'),
             content=data.get('content'),
             timestamp=data.get('timestamp'),
-            model_used=data.get('model_used')
+            model_used=data.get('model_used'),
+            conversation_id=data.get('conversation_id')
         )
-
-
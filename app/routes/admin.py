@@ -1,16 +1,35 @@
-from flask import Blueprint, render_template, flash, redirect, url_for, request, jsonify
+from flask import Blueprint, render_template, flash, redirect, url_for, request, jsonify, Response, stream_with_context, send_file, abort
 from flask_login import login_required, current_user
+import math
+import queue
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
 
-from app.models import DynamoDB, Document
-from app.forms import DocumentUploadForm
-from app.services.s3_service import S3Service
+from app.models import DynamoDB, Document, user_cache, pending_chat_stats
+from app.forms import DocumentUploadForm, BulkDocumentUploadForm, ALLOWED_EXTENSIONS, CATEGORY_CHOICES
+from config import Config
+from app.services.s3_service import S3Service, upload_progress, kb_status_cache, kb_status_calls
+from app.services.response_cache import response_cache
+from app.services.chat_writer import chat_writer
+from app.services.chat_purger import chat_purger
+from app.services.sync_watcher import sync_watcher
+from app.services.bedrock_agent_service import agent_metadata
+from app.services.idempotency import idempotency_store
+from app.services.admission import admission
+from app.services.metrics import metrics
+from app.services.profiler import profiler
+from app.services.tracing import tracer
+from app.services.logging_config import logging_stats
+from app.services.ingestion_tracker import ingestion_tracker, FINAL_STATES
 
 admin_bp = Blueprint('admin', __name__)
 db = DynamoDB()
 s3_service = S3Service()
 
+def _user_counts(stats):
+    return {'total': stats['users_total'], 'admin': stats['users_admin'], 'user': stats['users_user']}
+
 @admin_bp.route('/dashboard')
 @login_required
 def dashboard():
@@ -18,10 +37,12 @@ def dashboard():
         flash('No tienes permisos para acceder a esta página', 'danger')
         return redirect(url_for('main.home'))
     
-    users = db.list_users()
-    documents = db.get_all_documents()
+    # Estadísticas materializadas (lecturas O(1)) y una página corta de usuarios
+    stats = db.get_stats()
+    users, next_cursor = db.list_users_page(limit=5)
     
-    return render_template('admin/dashboard.html', users=users, documents=documents)
+    return render_template('admin/dashboard.html', users=users, stats=stats,
+                           counts=_user_counts(stats), has_more=bool(next_cursor))
 
 @admin_bp.route('/upload', methods=['GET', 'POST'])
 @login_required
@@ -42,7 +63,8 @@ def upload_ui():
             upload_result = s3_service.upload_file(
                 file=file,
                 folder=category,
-                user_id=current_user.id
+                user_id=current_user.id,
+                upload_id=request.form.get('upload_id') or None
             )
             
             if upload_result['success']:
@@ -57,11 +79,15 @@ def upload_ui():
                     file_type=file.content_type,
                     user_id=current_user.id,
                     description=description,
-                    category=category
+                    category=category,
+                    checksum=upload_result['checksum'],
+                    ingestion_status=upload_result['ingestion']['status'],
+                    ingestion_since=upload_result['ingestion']['since']
                 )
                 
                 if db.save_document(document):
-                    flash(f'Documento "{upload_result["original_filename"]}" subido exitosamente', 'success')
+                    ingestion_tracker.track(document.ingestion_since, document_id=document.document_id)
+                    flash(f'Documento "{upload_result["original_filename"]}" subido exitosamente; indexación en curso', 'success')
                     return redirect(url_for('admin.upload_ui'))
                 else:
                     flash('Error guardando metadata del documento', 'danger')
@@ -74,17 +100,188 @@ def upload_ui():
     # Obtener documentos del usuario actual
     documents = db.get_user_documents(current_user.id)
     
+    # Retomar el seguimiento de los documentos aún sin indexar (p. ej. tras un reinicio)
+    for doc in documents:
+        if doc.ingestion_since and doc.ingestion_status and doc.ingestion_status not in FINAL_STATES:
+            handle = ingestion_tracker.track(doc.ingestion_since, document_id=doc.document_id)
+            doc.ingestion_status = handle['status']
+    
     return render_template('admin/upload.html', form=form, documents=documents)
 
-@admin_bp.route('/users')
+@admin_bp.route('/upload/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk_upload_ui():
+    if current_user.role != 'admin':
+        flash('No tienes permisos para acceder a esta página', 'danger')
+        return redirect(url_for('main.home'))
+    
+    form = BulkDocumentUploadForm()
+    report = None
+    
+    if form.validate_on_submit():
+        files = [f for f in form.documents.data if f and f.filename]
+        description = form.description.data
+        category = form.category.data
+        user_id = current_user.id
+        
+        def upload(file):
+            return s3_service.upload_file(file=file, folder=category, user_id=user_id)
+        
+        # Subir a S3 en paralelo con un pool acotado
+        with ThreadPoolExecutor(max_workers=Config.BULK_UPLOAD_MAX_WORKERS) as executor:
+            results = list(executor.map(tracer.wrap(upload), files))
+        
+        report = []
+        documents = []
+        for file, upload_result in zip(files, results):
+            if not upload_result['success']:
+                report.append({'filename': file.filename, 'success': False, 'error': upload_result['error']})
+                continue
+            
+            document = Document(
+                document_id=str(uuid.uuid4()),
+                filename=upload_result['filename'],
+                original_filename=upload_result['original_filename'],
+                s3_key=upload_result['s3_key'],
+                file_url=upload_result['file_url'],
+                file_size=upload_result['file_size'],
+                file_type=file.content_type,
+                user_id=user_id,
+                description=description,
+                category=category,
+                checksum=upload_result['checksum'],
+                # Cada archivo se resuelve con el primer job que empezó tras terminar su subida
+                ingestion_status='PENDING',
+                ingestion_since=upload_result['ingestion']['since']
+            )
+            documents.append(document)
+            report.append({'filename': file.filename, 'success': True, 'file_size': document.file_size})
+        
+        # Guardar toda la metadata con BatchWriteItem
+        if documents and not db.save_documents_batch(documents):
+            for entry in report:
+                if entry['success']:
+                    entry.update(success=False, error='Subido a S3 pero no se pudo guardar la metadata')
+            documents = []
+        
+        for document in documents:
+            ingestion_tracker.track(document.ingestion_since, document_id=document.document_id)
+        
+        succeeded = sum(1 for entry in report if entry['success'])
+        flash(f'{succeeded} de {len(report)} documentos subidos; indexación en curso',
+              'success' if succeeded == len(report) else 'warning')
+    
+    return render_template('admin/bulk_upload.html', form=form, report=report)
+
+@admin_bp.route('/api/uploads/presign', methods=['POST'])
+@login_required
+def api_presign_upload():
+    """API para obtener un POST firmado y subir el archivo directamente a S3"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename', ''))
+    category = data.get('category', '')
+    
+    if not filename or filename.rsplit('.', 1)[-1].lower() not in ALLOWED_EXTENSIONS:
+        return jsonify({'success': False, 'error': 'Solo se permiten documentos e imágenes'}), 400
+    if category not in [value for value, _ in CATEGORY_CHOICES if value]:
+        return jsonify({'success': False, 'error': 'La categoría es requerida'}), 400
+    
+    presigned = s3_service.create_presigned_upload(
+        filename=filename,
+        content_type=data.get('content_type'),
+        folder=category,
+        user_id=current_user.id
+    )
+    if not presigned['success']:
+        return jsonify(presigned), 500
+    presigned['max_size'] = Config.S3_DIRECT_UPLOAD_MAX_SIZE
+    return jsonify(presigned)
+
+@admin_bp.route('/api/uploads/complete', methods=['POST'])
+@login_required
+def api_complete_upload():
+    """API para registrar en DynamoDB un archivo ya subido directamente a S3"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    s3_key = data.get('s3_key', '')
+    category = data.get('category', '')
+    description = (data.get('description') or '').strip()[:200]
+    
+    # Solo se pueden registrar keys propias bajo uploads/<categoría>/<user_id>/
+    expected_prefix = f"{Config.S3_UPLOAD_FOLDER}/{category}/{current_user.id}/"
+    if not category or not s3_key.startswith(expected_prefix) or '/' in s3_key[len(expected_prefix):]:
+        return jsonify({'success': False, 'error': 'Key de S3 no válida'}), 400
+    if not description:
+        return jsonify({'success': False, 'error': 'La descripción es requerida'}), 400
+    
+    object_info = s3_service.get_object_info(s3_key)
+    if not object_info['success']:
+        return jsonify(object_info), 404
+    
+    last_modified = object_info['last_modified']
+    document = Document(
+        # ID derivado de la key: registrar dos veces el mismo archivo no lo duplica
+        document_id=str(uuid.uuid5(uuid.NAMESPACE_URL, s3_key)),
+        filename=s3_key.rsplit('/', 1)[-1],
+        original_filename=object_info['metadata'].get('original_filename', s3_key.rsplit('/', 1)[-1]),
+        s3_key=s3_key,
+        file_url=s3_service.get_public_url(s3_key),
+        file_size=object_info['size'],
+        file_type=object_info['content_type'],
+        user_id=current_user.id,
+        description=description,
+        category=category,
+        ingestion_status='PENDING',
+        ingestion_since=last_modified.replace(microsecond=0).isoformat() if last_modified else None
+    )
+    
+    if not db.save_document(document):
+        return jsonify({'success': False, 'error': 'Error guardando metadata del documento'}), 500
+    
+    ingestion = None
+    if document.ingestion_since:
+        ingestion = ingestion_tracker.track(document.ingestion_since, document_id=document.document_id)
+    return jsonify({
+        'success': True,
+        'document_id': document.document_id,
+        'original_filename': document.original_filename,
+        'file_size': document.file_size,
+        'ingestion': ingestion
+    })
+
+@admin_bp.route('/users', methods=['GET', 'POST'])
 @login_required
 def manage_users():
     if current_user.role != 'admin':
         flash('No tienes permisos para acceder a esta página', 'danger')
         return redirect(url_for('main.home'))
     
-    users = db.list_users()
-    return render_template('admin/users.html', users=users)
+    if request.method == 'POST':
+        # Cambiar rol de un usuario
+        user_email = request.form.get('user_email', '').strip()
+        new_role = request.form.get('new_role')
+        user = db.get_user_by_email(user_email) if user_email else None
+        
+        if not user or new_role not in ('user', 'admin'):
+            flash('Selecciona un usuario y un rol válidos', 'danger')
+        elif user.id == current_user.id:
+            flash('No puedes cambiar tu propio rol', 'danger')
+        elif db.update_user_role(user.id, new_role):
+            flash(f'Rol de {user.email} cambiado a {new_role}', 'success')
+        else:
+            flash('Error cambiando el rol del usuario', 'danger')
+        return redirect(url_for('admin.manage_users'))
+    
+    cursor = request.args.get('cursor')
+    users, next_cursor = db.list_users_page(limit=Config.ADMIN_PAGE_SIZE, cursor=cursor)
+    counts = _user_counts(db.get_stats(days=1))
+    return render_template('admin/users.html', users=users, counts=counts,
+                           cursor=cursor, next_cursor=next_cursor)
 
 @admin_bp.route('/documents')
 @login_required
@@ -93,8 +290,10 @@ def manage_documents():
         flash('No tienes permisos para acceder a esta página', 'danger')
         return redirect(url_for('main.home'))
     
-    documents = db.get_all_documents()
-    return render_template('admin/documents.html', documents=documents)
+    cursor = request.args.get('cursor')
+    documents, next_cursor = db.get_documents_page(limit=Config.ADMIN_PAGE_SIZE, cursor=cursor)
+    return render_template('admin/documents.html', documents=documents,
+                           cursor=cursor, next_cursor=next_cursor)
 
 @admin_bp.route('/delete-document/<document_id>', methods=['POST'])
 @login_required
@@ -120,7 +319,8 @@ def delete_document(document_id):
         
         # Eliminar de DynamoDB
         if db.delete_document(document_id):
-            return jsonify({'success': True, 'message': 'Documento eliminado'})
+            ingestion = ingestion_tracker.track(s3_result['ingestion']['since'])
+            return jsonify({'success': True, 'message': 'Documento eliminado', 'ingestion': ingestion})
         else:
             return jsonify({'success': False, 'error': 'Error eliminando de la base de datos'}), 500
             
@@ -131,8 +331,6 @@ def delete_document(document_id):
 @login_required
 def sync_status():
     """Ruta para verificar estado de sincronización"""
-    s3_service = S3Service()
-    
     # Obtener estado de sync
     sync_status = s3_service.get_sync_status()
     
@@ -147,6 +345,143 @@ def sync_status():
 @login_required
 def api_sync_status():
     """API endpoint para estado de sincronización"""
-    s3_service = S3Service()
     sync_status = s3_service.get_sync_status()
-    return jsonify(sync_status)
\ No newline at end of file
+    return jsonify(sync_status)
+
+@admin_bp.route('/api/sync-status/stream')
+@login_required
+def sync_status_stream():
+    """Server-Sent Events con los cambios de estado de sincronización"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    def generate():
+        subscriber = sync_watcher.subscribe()
+        try:
+            current = sync_watcher.current()
+            if current:
+                yield f"event: status\ndata: {current}\n\n"
+            while True:
+                try:
+                    message = subscriber.get(timeout=Config.SYNC_WATCH_KEEPALIVE)
+                    yield f"event: status\ndata: {message}\n\n"
+                except queue.Empty:
+                    # Comentario SSE para mantener viva la conexión a través de proxies
+                    yield ": keepalive\n\n"
+        finally:
+            sync_watcher.unsubscribe(subscriber)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@admin_bp.route('/api/upload-progress/<upload_id>')
+@login_required
+def api_upload_progress(upload_id):
+    """API endpoint con el progreso de la transferencia a S3 de una subida"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    progress = upload_progress.get(upload_id)
+    if progress is None:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    return jsonify({'success': True, 'progress': progress})
+
+@admin_bp.route('/api/ingestion/<handle_id>')
+@login_required
+def api_ingestion_status(handle_id):
+    """API endpoint con el estado de indexación de una subida o borrado"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    handle = ingestion_tracker.describe(handle_id)
+    if handle is None:
+        return jsonify({'success': False, 'error': 'Handle de ingestión no encontrado'}), 404
+    return jsonify({'success': True, 'ingestion': handle})
+
+def _positive_number(value, cast):
+    """Número positivo de un campo opcional del formulario (None si está vacío)"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    number = cast(value)
+    # float() acepta 'nan' e 'inf', que ninguna ventana de perfilado admite
+    if not math.isfinite(number) or number <= 0:
+        raise ValueError(value)
+    return number
+
+@admin_bp.route('/profiler', methods=['GET', 'POST'])
+@login_required
+def profiler_ui():
+    """Perfilador por muestreo: armarlo sobre un patrón de ruta y descargar los perfiles"""
+    if current_user.role != 'admin':
+        flash('No tienes permisos para acceder a esta página', 'danger')
+        return redirect(url_for('main.home'))
+    
+    if request.method == 'POST':
+        if request.form.get('action') == 'stop':
+            if profiler.stop():
+                flash('Perfilador detenido; el perfil se está guardando', 'info')
+            return redirect(url_for('admin.profiler_ui'))
+        
+        try:
+            max_requests = _positive_number(request.form.get('max_requests'), int)
+            seconds = _positive_number(request.form.get('seconds'), float)
+        except ValueError:
+            flash('Peticiones y segundos deben ser números positivos', 'danger')
+            return redirect(url_for('admin.profiler_ui'))
+        
+        if max_requests is None and seconds is None:
+            flash('Indica un número de peticiones o una ventana de tiempo', 'danger')
+        elif profiler.arm(request.form.get('pattern', '').strip(), max_requests, seconds):
+            flash('Perfilador armado', 'success')
+        else:
+            flash('Ya hay una sesión de perfilado en curso', 'danger')
+        return redirect(url_for('admin.profiler_ui'))
+    
+    return render_template('admin/profiler.html', active=profiler.status(),
+                           history=profiler.history, profiles=profiler.list_profiles(),
+                           max_seconds=Config.PROFILER_MAX_SECONDS)
+
+@admin_bp.route('/profiler/<filename>')
+@login_required
+def download_profile(filename):
+    """Descargar un perfil en formato collapsed"""
+    if current_user.role != 'admin':
+        abort(403)
+    
+    path = profiler.profile_path(filename)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=filename)
+
+@admin_bp.route('/api/performance')
+@login_required
+def api_performance():
+    """API endpoint con contadores de rendimiento (cachés, colas)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    return jsonify({
+        'success': True,
+        'response_cache': response_cache.stats(),
+        'chat_writer': chat_writer.stats(),
+        'chat_purger': chat_purger.stats(),
+        'user_cache': user_cache.stats(),
+        'pending_chat_stats': pending_chat_stats.stats(),
+        'ingestion_tracker': ingestion_tracker.stats(),
+        'sync_watcher': sync_watcher.stats(),
+        'agent_metadata': agent_metadata.stats(),
+        'idempotency': idempotency_store.stats(),
+        'admission': admission.stats(),
+        'kb_status_cache': dict(kb_status_cache.stats(), **kb_status_calls.stats()),
+        'metrics': metrics.stats(),
+        'profiler': profiler.stats(),
+        'tracing': tracer.stats(),
+        'logging': logging_stats()
+    })
\ No newline at end of file
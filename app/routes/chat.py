@@ -1,10 +1,16 @@
-from flask import Blueprint, render_template, request, jsonify, session
+from flask import Blueprint, render_template, request, jsonify, session, Response, stream_with_context
 from flask_login import login_required, current_user
+import json
 import uuid
 from datetime import datetime
 
+from config import Config
 from app.models import DynamoDB, ChatMessage
 from app.services.bedrock_agent_service import BMCCustomAgent
+from app.services.chat_writer import chat_writer
+from app.services.chat_purger import chat_purger
+from app.services.idempotency import idempotency_store, CLAIMED, REPLAY, MISMATCH
+from app.services.admission import admission, AdmissionRejected
 
 chat_bp = Blueprint('chat', __name__)
 db = DynamoDB()
@@ -13,20 +19,52 @@ bmc_custom_agent = BMCCustomAgent()
 @chat_bp.route('/chat')
 @login_required
 def chat_ui():
-    """Página principal del chat con agente personalizado"""
-    chat_history = db.get_user_chat_history(current_user.id)
+    """
+    Página principal del chat con agente personalizado.
+    El historial y la información del agente van incrustados en la página,
+    así no hacen falta peticiones adicionales al cargarla.
+    """
+    chat_history, cursors = db.get_user_chat_history(
+        current_user.id,
+        limit=Config.CHAT_HISTORY_PAGE_SIZE,
+        conversation_id=db.get_conversation_id(current_user.id)
+    )
     
-    # Obtener información del agente para mostrar
+    # Información del agente desde la caché del proceso
     agent_info = bmc_custom_agent.get_agent_status()
     
-    return render_template('user/chat.html', 
-                         chat_history=chat_history,
-                         agent_info=agent_info)
+    chat_bootstrap = {
+        'agent_info': agent_info,
+        'history': _history_payload(chat_history),
+        'cursors': cursors
+    }
+    return render_template('user/chat.html', chat_bootstrap=chat_bootstrap)
+
+def _history_payload(chat_history):
+    """Mensajes en el formato que espera chat.html"""
+    return [
+        {
+            'id': msg.message_id,
+            'role': msg.role,
+            'content': msg.content,
+            'timestamp': msg.timestamp,
+            'is_user': msg.role == 'user'
+        }
+        for msg in chat_history
+    ]
+
+def _idempotency_key(data):
+    """Clave de idempotencia enviada por el cliente (cabecera o cuerpo)"""
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    return key[:128] if key else None
 
 @chat_bp.route('/api/chat/send', methods=['POST'])
 @login_required
 def send_message():
-    """API para enviar mensaje al agente personalizado"""
+    """
+    API para enviar mensaje al agente personalizado.
+    Con Idempotency-Key, los reintentos devuelven el resultado ya guardado.
+    """
     try:
         data = request.get_json()
         user_message = data.get('message', '').strip()
@@ -34,62 +72,267 @@ def send_message():
         if not user_message:
             return jsonify({'success': False, 'error': 'El mensaje no puede estar vacío'})
         
-        # Usar session_id único por usuario para mantener contexto
-        session_id = f"user_{current_user.id}"
+        user_id = current_user.id
+        conversation_id = db.get_conversation_id(user_id)
+        key = _idempotency_key(data)
+        if not key:
+            return jsonify(_send(user_id, conversation_id, user_message))
+        
+        status, stored = idempotency_store.claim(user_id, key, user_message)
+        if status == REPLAY:
+            response = jsonify(stored)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if status != CLAIMED:
+            return _idempotency_conflict(status)
+        
+        result = None
+        try:
+            result = _send(user_id, conversation_id, user_message)
+        finally:
+            idempotency_store.complete(user_id, key, result)
+        return jsonify(result)
+    
+    except AdmissionRejected as e:
+        return _rejected(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Error procesando mensaje: {str(e)}'})
+
+def _idempotency_conflict(status):
+    """422 si la Idempotency-Key ya se usó con otro mensaje, 409 si sigue en curso"""
+    if status == MISMATCH:
+        return jsonify({'success': False, 'error': 'La Idempotency-Key ya se usó con otro mensaje'}), 422
+    return jsonify({'success': False, 'error': 'Este mensaje ya se está procesando'}), 409
+
+def _rejected(error):
+    """Respuesta 429 con Retry-After para una petición no admitida"""
+    response = jsonify({'success': False, 'error': str(error), 'reason': error.reason})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def _session_id(user_id, conversation_id):
+    """
+    Sesión de Bedrock de la conversación: mantiene el contexto entre turnos y
+    limpiar el historial empieza una sesión nueva
+    """
+    return f"user_{user_id}_{conversation_id}"
+
+# model_used de las respuestas servidas desde la caché (la sesión de Bedrock no las ha visto)
+CACHED_MODEL = "Bedrock Agent (caché)"
+
+def _turn_context(user_id, conversation_id):
+    """
+    (first_turn, history) del siguiente turno. Sin mensajes previos la sesión no
+    tiene contexto y la respuesta se puede cachear. Si el único turno previo se
+    respondió desde la caché, se envía a Bedrock como historial de la sesión.
+    """
+    opening = db.get_conversation_opening(user_id, conversation_id)
+    if opening is None:
+        # Ante la duda se trata como conversación con contexto
+        return False, None
+    if not opening:
+        return True, None
+    if len(opening) == 2 and opening[1].model_used == CACHED_MODEL:
+        return False, [(message.role, message.content) for message in opening]
+    return False, None
+
+def _send(user_id, conversation_id, user_message):
+    """Guardar el mensaje, invocar al agente y guardar su respuesta"""
+    session_id = _session_id(user_id, conversation_id)
+    
+    with admission.acquire(user_id, session_id):
+        return _send_admitted(user_id, conversation_id, session_id, user_message)
+
+def _send_admitted(user_id, conversation_id, session_id, user_message):
+    """Cuerpo de _send una vez admitida la petición"""
+    first_turn, history = _turn_context(user_id, conversation_id)
+    
+    # Guardar mensaje del usuario
+    user_msg = ChatMessage(
+        message_id=str(uuid.uuid4()),
+        user_id=user_id,
+        conversation_id=conversation_id,
+        role='user',
+        content=user_message
+    )
+    chat_writer.save(user_msg)
+    
+    # Obtener respuesta del agente personalizado
+    agent_response = bmc_custom_agent.process_message(user_message, session_id, first_turn=first_turn,
+                                                      history=history)
+    
+    if agent_response['success']:
+        # Preparar respuesta con citaciones si existen
+        response_text = agent_response['response']
+        if agent_response.get('has_citations'):
+            response_text += "*Basado en la documentación del sistema*"
+        
+        # Guardar respuesta del agente
+        assistant_msg = ChatMessage(
+            message_id=str(uuid.uuid4()),
+            user_id=user_id,
+            conversation_id=conversation_id,
+            role='assistant',
+            content=response_text,
+            model_used=CACHED_MODEL if agent_response.get('cached') else "Bedrock Agent"
+        )
+        chat_writer.save(assistant_msg)
+        
+        return {
+            'success': True,
+            'response': response_text,
+            'message_id': assistant_msg.message_id,
+            'timestamp': assistant_msg.timestamp,
+            'has_citations': agent_response.get('has_citations', False),
+            'citations_count': len(agent_response.get('citations', []))
+        }
+    
+    # En caso de error, proporcionar respuesta de fallback
+    error_msg = ChatMessage(
+        message_id=str(uuid.uuid4()),
+        user_id=user_id,
+        conversation_id=conversation_id,
+        role='assistant',
+        content=f"⚠️ Lo siento, hubo un error: {agent_response['error']}. Por favor, intenta de nuevo."
+    )
+    chat_writer.save(error_msg)
+    
+    return {
+        'success': False,
+        'error': agent_response['error']
+    }
+
+def _sse(event, data):
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@chat_bp.route('/api/chat/stream', methods=['POST'])
+@login_required
+def stream_message():
+    """API para enviar mensaje al agente recibiendo la respuesta por Server-Sent Events"""
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '').strip()
+    
+    if not user_message:
+        return jsonify({'success': False, 'error': 'El mensaje no puede estar vacío'}), 400
+    
+    user_id = current_user.id
+    try:
+        conversation_id = db.get_conversation_id(user_id)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Error procesando mensaje: {str(e)}'}), 500
+    session_id = _session_id(user_id, conversation_id)
+    
+    key = _idempotency_key(data)
+    if key:
+        status, stored = idempotency_store.claim(user_id, key, user_message)
+        if status == REPLAY:
+            # Reintento de un envío ya completado: repetir la respuesta sin invocar al agente
+            replay = _sse('chunk', {'text': stored['response']}) + _sse('done', stored)
+            return Response(replay, mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'Idempotent-Replayed': 'true'})
+        if status != CLAIMED:
+            return _idempotency_conflict(status)
+    
+    finished = []
+    
+    def finish(result=None):
+        """Liberar la plaza y completar la clave una sola vez (fin del stream o desconexión)"""
+        if finished:
+            return
+        finished.append(True)
+        ticket.release()
+        if key:
+            idempotency_store.complete(user_id, key, result)
+    
+    try:
+        ticket = admission.acquire(user_id, session_id)
+    except AdmissionRejected as e:
+        if key:
+            idempotency_store.complete(user_id, key)
+        return _rejected(e)
+    
+    try:
+        first_turn, history = _turn_context(user_id, conversation_id)
         
         # Guardar mensaje del usuario
         user_msg = ChatMessage(
             message_id=str(uuid.uuid4()),
-            user_id=current_user.id,
+            user_id=user_id,
+            conversation_id=conversation_id,
             role='user',
             content=user_message
         )
-        db.save_chat_message(user_msg)
-        
-        # Obtener respuesta del agente personalizado
-        agent_response = bmc_custom_agent.process_message(user_message, session_id)
-        
-        if agent_response['success']:
-            # Preparar respuesta con citaciones si existen
-            response_text = agent_response['response']
-            if agent_response.get('has_citations'):
-                response_text += "*Basado en la documentación del sistema*"
-            
-            # Guardar respuesta del agente
-            assistant_msg = ChatMessage(
-                message_id=str(uuid.uuid4()),
-                user_id=current_user.id,
-                role='assistant',
-                content=response_text,
-                model_used="Bedrock Agent"
-            )
-            db.save_chat_message(assistant_msg)
-            
-            return jsonify({
-                'success': True,
-                'response': response_text,
-                'message_id': assistant_msg.message_id,
-                'timestamp': assistant_msg.timestamp,
-                'has_citations': agent_response.get('has_citations', False),
-                'citations_count': len(agent_response.get('citations', []))
-            })
-        else:
-            # En caso de error, proporcionar respuesta de fallback
-            error_msg = ChatMessage(
-                message_id=str(uuid.uuid4()),
-                user_id=current_user.id,
-                role='assistant',
-                content=f"⚠️ Lo siento, hubo un error: {agent_response['error']}. Por favor, intenta de nuevo."
-            )
-            db.save_chat_message(error_msg)
-            
-            return jsonify({
-                'success': False,
-                'error': agent_response['error']
-            })
-            
+        chat_writer.save(user_msg)
     except Exception as e:
-        return jsonify({'success': False, 'error': f'Error procesando mensaje: {str(e)}'})
+        # Sin stream no hay finally que libere la plaza, la sesión ni la clave
+        finish()
+        return jsonify({'success': False, 'error': f'Error procesando mensaje: {str(e)}'}), 500
+    
+    def generate():
+        result = None
+        try:
+            for event in bmc_custom_agent.process_message_stream(user_message, session_id,
+                                                                  first_turn=first_turn, history=history):
+                if event['type'] == 'chunk':
+                    yield _sse('chunk', {'text': event['text']})
+                
+                elif event['type'] == 'citation':
+                    yield _sse('citation', event['citation'])
+                
+                elif event['type'] == 'done':
+                    response_text = event['response']
+                    if event['has_citations']:
+                        response_text += "*Basado en la documentación del sistema*"
+                    
+                    # Guardar respuesta del agente
+                    assistant_msg = ChatMessage(
+                        message_id=str(uuid.uuid4()),
+                        user_id=user_id,
+                        conversation_id=conversation_id,
+                        role='assistant',
+                        content=response_text,
+                        model_used=CACHED_MODEL if event.get('cached') else "Bedrock Agent"
+                    )
+                    chat_writer.save(assistant_msg)
+                    
+                    result = {
+                        'success': True,
+                        'response': response_text,
+                        'message_id': assistant_msg.message_id,
+                        'timestamp': assistant_msg.timestamp,
+                        'has_citations': event['has_citations'],
+                        'citations_count': len(event['citations'])
+                    }
+                    yield _sse('done', result)
+                
+                elif event['type'] == 'error':
+                    error_msg = ChatMessage(
+                        message_id=str(uuid.uuid4()),
+                        user_id=user_id,
+                        conversation_id=conversation_id,
+                        role='assistant',
+                        content=f"⚠️ Lo siento, hubo un error: {event['error']}. Por favor, intenta de nuevo."
+                    )
+                    chat_writer.save(error_msg)
+                    yield _sse('error', {'success': False, 'error': event['error']})
+        except Exception as e:
+            yield _sse('error', {'success': False, 'error': f'Error procesando mensaje: {str(e)}'})
+        finally:
+            finish(result)
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    # Si el cliente se desconecta antes de empezar el stream, liberar igualmente la plaza
+    response.call_on_close(finish)
+    return response
 
 @chat_bp.route('/api/chat/agent-info', methods=['GET'])
 @login_required
@@ -104,29 +347,40 @@ def get_agent_info():
 @chat_bp.route('/api/chat/history', methods=['GET'])
 @login_required
 def get_chat_history():
-    """API para obtener historial de chat"""
+    """
+    API para obtener historial de chat por páginas.
+    Sin parámetros devuelve los mensajes más recientes; `before` pide la página
+    anterior y `after` los mensajes nuevos desde un cursor.
+    """
     try:
-        chat_history = db.get_user_chat_history(current_user.id)
-        history_data = [
-            {
-                'id': msg.message_id,
-                'role': msg.role,
-                'content': msg.content,
-                'timestamp': msg.timestamp,
-                'is_user': msg.role == 'user'
-            }
-            for msg in chat_history
-        ]
-        return jsonify({'success': True, 'history': history_data})
+        limit = min(request.args.get('limit', Config.CHAT_HISTORY_PAGE_SIZE, type=int), 100)
+        chat_history, cursors = db.get_user_chat_history(
+            current_user.id,
+            limit=max(limit, 1),
+            before=request.args.get('before') or None,
+            after=request.args.get('after') or None,
+            conversation_id=db.get_conversation_id(current_user.id)
+        )
+        return jsonify({
+            'success': True,
+            'history': _history_payload(chat_history),
+            'cursors': cursors,
+            'has_more': cursors['before'] is not None
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @chat_bp.route('/api/chat/clear', methods=['POST'])
 @login_required
 def clear_chat_history():
-    """API para limpiar historial de chat"""
+    """
+    API para limpiar historial de chat: empieza una conversación nueva y los
+    mensajes anteriores se borran en segundo plano.
+    """
     try:
-        if db.clear_user_chat_history(current_user.id):
+        conversation_id = db.start_new_conversation(current_user.id)
+        if conversation_id:
+            chat_purger.purge(current_user.id, conversation_id)
             return jsonify({'success': True, 'message': 'Historial limpiado'})
         else:
             return jsonify({'success': False, 'error': 'Error limpiando historial'})
@@ -1,25 +1,63 @@
-from flask import Blueprint, render_template
+import hmac
+
+from flask import Blueprint, render_template, jsonify, current_app, request, Response, redirect, url_for
 from flask_login import login_required, current_user
 
+from config import Config
+from app.services.metrics import metrics
+
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def home():
     return render_template('home.html')
 
+@main_bp.route('/healthz')
+def healthz():
+    """Chequeo de vida: no toca AWS"""
+    return jsonify({
+        'status': 'ok',
+        'startup_seconds': current_app.config.get('STARTUP_SECONDS')
+    })
+
+@main_bp.route('/readyz')
+def readyz():
+    """Chequeo de disponibilidad: solo valida configuración, no toca AWS"""
+    missing = [
+        name for name in ('BEDROCK_AGENT_ID', 'BEDROCK_KNOWLEDGE_BASE_ID', 'S3_BUCKET_NAME')
+        if not getattr(Config, name)
+    ]
+    if missing:
+        return jsonify({'status': 'not_ready', 'missing_config': missing}), 503
+    return jsonify({'status': 'ready'})
+
+def _metrics_authorized():
+    if Config.METRICS_TOKEN:
+        expected = f'Bearer {Config.METRICS_TOKEN}'.encode()
+        if hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+            return True
+    return current_user.is_authenticated and current_user.role == 'admin'
+
+@main_bp.route('/metrics')
+def prometheus_metrics():
+    """
+    Métricas de este proceso en formato Prometheus. Acceso con
+    'Authorization: Bearer <METRICS_TOKEN>' o con sesión de administrador;
+    sin METRICS_TOKEN configurado solo pueden verlas los administradores.
+    """
+    if not _metrics_authorized():
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
     if current_user.role == 'admin':
-        return render_template('admin/dashboard.html')
+        # El panel de administración necesita estadísticas y usuarios: lo construye admin.dashboard
+        return redirect(url_for('admin.dashboard'))
     else:
         return render_template('user/dashboard.html')
 
-@main_bp.route('/chat')
-@login_required
-def user_chat():
-    return render_template('user/chat.html')
-
 # Ruta para crear un usuario admin por defecto (solo para desarrollo)
 @main_bp.route('/create-admin')
 def create_admin():
@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+
+from config import Config
+from app.services.tracing import tracer
+
+
+class AdmissionRejected(Exception):
+    """Petición rechazada por el control de admisión (se responde 429)"""
+
+    MESSAGES = {
+        'rate_limited': 'Demasiados mensajes seguidos, espera unos segundos',
+        'session_busy': 'Ya hay un mensaje en curso en esta conversación',
+        'overloaded': 'El agente está saturado, inténtalo de nuevo en unos segundos',
+        'queue_timeout': 'El agente está saturado, inténtalo de nuevo en unos segundos'
+    }
+
+    def __init__(self, reason, retry_after):
+        super().__init__(self.MESSAGES.get(reason, reason))
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Ticket:
+    """Plaza concedida; release() es idempotente"""
+
+    def __init__(self, controller, session_id, owner):
+        self._controller = controller
+        self._session_id = session_id
+        self._owner = owner
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self._session_id, self._owner)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Control de admisión para las invocaciones del agente de Bedrock.
+
+    - Límite de ritmo por usuario (AGENT_RATE_PER_MINUTE, ráfaga AGENT_RATE_BURST),
+      compartido por todos los workers en la tabla de coordinación.
+    - Una sola invocación a la vez por sesión de Bedrock, también entre workers:
+      la sesión de una conversación no admite turnos en paralelo, y un segundo
+      turno mientras hay otro en curso se rechaza al momento (no ocupa un hilo
+      esperando).
+    - Como mucho AGENT_MAX_CONCURRENCY invocaciones y AGENT_MAX_QUEUE esperando
+      por proceso: protegen los hilos de cada worker, así que el total del
+      servidor es WEB_WORKERS veces esos valores. Con la cola llena se rechaza
+      al momento.
+    """
+
+    def __init__(self, max_concurrency=None, max_queue=None, queue_timeout=None,
+                 rate_per_minute=None, burst=None):
+        self.max_concurrency = max_concurrency or Config.AGENT_MAX_CONCURRENCY
+        self.max_queue = Config.AGENT_MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or Config.AGENT_QUEUE_TIMEOUT
+        self.rate = (rate_per_minute or Config.AGENT_RATE_PER_MINUTE) / 60.0
+        self.burst = burst or Config.AGENT_RATE_BURST
+        # Una reserva de sesión cuyo worker murió caduca sola
+        self.lease_ttl = Config.BEDROCK_READ_TIMEOUT * 2 + self.queue_timeout
+        self._db = None
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self._leases = set()
+        self._leases_lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = Counter()
+        self.peak_waiting = 0
+        self.total_wait = 0.0
+
+    @property
+    def db(self):
+        if self._db is None:
+            from app.models import DynamoDB
+            self._db = DynamoDB()
+        return self._db
+
+    def _take_token(self, user_id):
+        """Consumir una plaza del usuario; devuelve 0 o los segundos hasta la siguiente"""
+        return self.db.take_rate_token(f'rate#{user_id}', 1 / self.rate, self.burst)
+
+    def _lock_session(self, session_id):
+        """Reservar la sesión; devuelve el dueño de la reserva o None si está ocupada"""
+        owner = uuid.uuid4().hex
+        if not self.db.acquire_lease(f'session#{session_id}', owner, self.lease_ttl):
+            return None
+        with self._leases_lock:
+            self._leases.add(owner)
+        return owner
+
+    def _unlock_session(self, session_id, owner):
+        self.db.release_lease(f'session#{session_id}', owner)
+        with self._leases_lock:
+            self._leases.discard(owner)
+
+    def _reject(self, reason, retry_after):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def acquire(self, user_id, session_id):
+        """
+        Esperar turno para invocar al agente. Devuelve un ticket que hay que
+        liberar (también sirve como context manager) o lanza AdmissionRejected.
+        """
+        # La espera en cola queda como span; un rechazo no marca la traza como error
+        span = tracer.start_span('admission.acquire', attributes={'session_id': session_id})
+        try:
+            return self._acquire(user_id, session_id)
+        except AdmissionRejected as e:
+            span.set_attribute('rejected', e.reason)
+            raise
+        finally:
+            span.end()
+
+    def _acquire(self, user_id, session_id):
+        retry_after = self._take_token(user_id)
+        if retry_after:
+            self._reject('rate_limited', retry_after)
+
+        started_at = time.monotonic()
+        deadline = started_at + self.queue_timeout
+
+        owner = self._lock_session(session_id)
+        if owner is None:
+            self._reject('session_busy', Config.AGENT_RETRY_AFTER)
+
+        try:
+            with self._cond:
+                if self.active >= self.max_concurrency:
+                    if self.waiting >= self.max_queue:
+                        self._reject('overloaded', Config.AGENT_RETRY_AFTER)
+                    self.waiting += 1
+                    self.peak_waiting = max(self.peak_waiting, self.waiting)
+                    try:
+                        while self.active >= self.max_concurrency:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                self._reject('queue_timeout', Config.AGENT_RETRY_AFTER)
+                            self._cond.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                self.active += 1
+                self.admitted += 1
+                self.total_wait += time.monotonic() - started_at
+        except AdmissionRejected:
+            self._unlock_session(session_id, owner)
+            raise
+
+        return _Ticket(self, session_id, owner)
+
+    def _release(self, session_id, owner):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+        self._unlock_session(session_id, owner)
+
+    def stats(self):
+        with self._cond:
+            active, waiting = self.active, self.waiting
+        return {
+            'active': active,
+            'queue_depth': waiting,
+            'peak_queue_depth': self.peak_waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'avg_wait_seconds': round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            'rejected': dict(self.rejected),
+            'sessions': len(self._leases)
+        }
+
+
+admission = AdmissionController()
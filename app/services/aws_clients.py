@@ -0,0 +1,98 @@
+import threading
+
+import boto3
+from botocore.config import Config as BotoConfig
+
+from config import Config
+from app.services.metrics import metrics
+from app.services.tracing import tracer
+
+# Registro único por proceso de sesión, clientes y recursos de boto3.
+# Los clientes de boto3 son seguros entre hilos; los recursos se comparten
+# porque solo se usan sus acciones (Table.*), que delegan en el cliente.
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_resources = {}
+
+# Las generaciones del agente pueden tardar mucho más que una llamada normal
+_READ_TIMEOUT_OVERRIDES = {
+    'bedrock-agent-runtime': lambda: Config.BEDROCK_READ_TIMEOUT
+}
+
+
+def get_session():
+    """Sesión boto3 compartida (resuelve credenciales una sola vez)"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session(
+                    aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
+                    region_name=Config.AWS_REGION
+                )
+                # Latencia por operación para /metrics y Server-Timing, y un span por llamada
+                metrics.instrument_session(_session)
+                tracer.instrument_session(_session)
+    return _session
+
+
+def _client_config(service_name):
+    read_timeout = _READ_TIMEOUT_OVERRIDES.get(service_name, lambda: Config.AWS_READ_TIMEOUT)()
+    return BotoConfig(
+        max_pool_connections=Config.AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=Config.AWS_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        tcp_keepalive=Config.AWS_TCP_KEEPALIVE,
+        retries={'max_attempts': Config.AWS_MAX_ATTEMPTS, 'mode': 'standard'}
+    )
+
+
+def get_client(service_name):
+    """Cliente boto3 compartido para el servicio"""
+    client = _clients.get(service_name)
+    if client is None:
+        session = get_session()
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = session.client(service_name, config=_client_config(service_name))
+                _clients[service_name] = client
+    return client
+
+
+def get_resource(service_name):
+    """Recurso boto3 compartido para el servicio (p. ej. 'dynamodb')"""
+    resource = _resources.get(service_name)
+    if resource is None:
+        session = get_session()
+        with _lock:
+            resource = _resources.get(service_name)
+            if resource is None:
+                resource = session.resource(service_name, config=_client_config(service_name))
+                _resources[service_name] = resource
+    return resource
+
+
+def register(service_name, client=None, resource=None):
+    """
+    Instalar un cliente y/o recurso ya construido para un servicio (p. ej. los
+    sustitutos en memoria de benchmarks/). get_client/get_resource lo devolverán
+    en lugar de crear uno de boto3.
+    """
+    with _lock:
+        if client is not None:
+            _clients[service_name] = client
+        if resource is not None:
+            _resources[service_name] = resource
+
+
+def reset():
+    """Descartar sesión, clientes y recursos (p. ej. tras un fork)"""
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+        _resources.clear()
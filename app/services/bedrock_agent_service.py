@@ -1,20 +1,22 @@
-import boto3
+import codecs
 import json
+import logging
 import uuid
 import os
+import time
 from botocore.exceptions import ClientError, BotoCoreError
 from config import Config
+from app.services.aws_clients import get_client
+from app.services.response_cache import response_cache
+from app.services.cache import RefreshingValue
+from app.services.metrics import metrics
+from app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 
 class BedrockAgentService:
     def __init__(self):
-        self.agent_client = boto3.client(
-            'bedrock-agent-runtime',
-            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-            region_name=Config.AWS_REGION
-        )
-        
         # Configuración del agente específico
         self.agent_id = os.environ.get('BEDROCK_AGENT_ID')
         self.agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID') or 'TSTALIASID'
@@ -23,60 +25,137 @@ class BedrockAgentService:
         if not self.agent_id:
             raise ValueError("BEDROCK_AGENT_ID must be set in environment variables")
 
-    def invoke_agent(self, prompt, session_id=None):
+    @property
+    def agent_client(self):
+        return get_client('bedrock-agent-runtime')
+
+    def invoke_agent(self, prompt, session_id=None, history=None):
         """
         Invocar tu agente personalizado de Bedrock con Knowledge Base
         """
+        result = None
+        for event in self.invoke_agent_stream(prompt, session_id, history):
+            if event['type'] in ('done', 'error'):
+                result = event
+        
+        if result['type'] == 'error':
+            return {'success': False, 'error': result['error']}
+        
+        return {
+            'success': True,
+            'response': result['response'],
+            'session_id': result['session_id'],
+            'citations': result['citations'],
+            'has_citations': result['has_citations']
+        }
+
+    def invoke_agent_stream(self, prompt, session_id=None, history=None):
+        """
+        Invocar el agente y producir los eventos a medida que llegan del stream.
+        history: turnos previos [(rol, texto)] que la sesión de Bedrock no ha
+        visto; se envían como sessionState.conversationHistory.
+        
+        Genera diccionarios con 'type':
+        - 'chunk': fragmento de texto ('text')
+        - 'citation': citación de la Knowledge Base ('citation')
+        - 'done': respuesta completa, igual que invoke_agent
+        - 'error': mensaje de error ('error')
+        """
+        # Span propio con eventos first_chunk / citation / end_of_stream (no se activa entre yields)
+        span = tracer.start_span('bedrock.invoke_agent_stream', attributes={
+            'bedrock.agent_id': self.agent_id,
+            'bedrock.prompt_chars': len(prompt)
+        })
         try:
             if not session_id:
                 session_id = str(uuid.uuid4())
+            span.set_attribute('bedrock.session_id', session_id)
             
             # Invocar el agente
-            response = self.agent_client.invoke_agent(
-                agentId=self.agent_id,
-                agentAliasId=self.agent_alias_id,
-                sessionId=session_id,
-                inputText=prompt
-            )
+            started_at = time.perf_counter()
+            first_token = True
+            request = {
+                'agentId': self.agent_id,
+                'agentAliasId': self.agent_alias_id,
+                'sessionId': session_id,
+                'inputText': prompt
+            }
+            if history:
+                request['sessionState'] = {'conversationHistory': {'messages': [
+                    {'role': role, 'content': [{'text': text}]} for role, text in history
+                ]}}
+                span.set_attribute('bedrock.seeded_messages', len(history))
+            with tracer.use(span):
+                response = self.agent_client.invoke_agent(**request)
             
-            # Procesar la respuesta stream
-            completion = ""
+            # Procesar la respuesta stream evento a evento
+            parts = []
             citations = []
+            decoder = codecs.getincrementaldecoder('utf-8')()
             
             for event in response['completion']:
                 if 'chunk' in event:
-                    chunk = event['chunk']
-                    completion += chunk['bytes'].decode('utf-8')
+                    text = decoder.decode(event['chunk']['bytes'])
+                    if text:
+                        if first_token:
+                            metrics.record_segment('bedrock_first_token', time.perf_counter() - started_at)
+                            span.add_event('first_chunk')
+                            first_token = False
+                        parts.append(text)
+                        yield {'type': 'chunk', 'text': text}
                 
                 elif 'citation' in event:
                     citation = event['citation']
-                    citations.append({
+                    citation_info = {
                         'generated_response_part': citation.get('generatedResponsePart', {}).get('text', ''),
                         'retrieved_references': citation.get('retrievedReferences', [])
-                    })
+                    }
+                    citations.append(citation_info)
+                    span.add_event('citation', references=len(citation_info['retrieved_references']))
+                    yield {'type': 'citation', 'citation': citation_info}
             
-            return {
-                'success': True,
-                'response': completion.strip(),
+            metrics.record_segment('bedrock_generation', time.perf_counter() - started_at)
+            span.add_event('end_of_stream', chars=sum(len(part) for part in parts), citations=len(citations))
+            logger.debug("Respuesta del agente en %.2fs: %d fragmentos, %d citaciones",
+                         time.perf_counter() - started_at, len(parts), len(citations),
+                         extra={'session_id': session_id})
+            
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                parts.append(tail)
+                yield {'type': 'chunk', 'text': tail}
+            
+            yield {
+                'type': 'done',
+                'response': ''.join(parts).strip(),
                 'session_id': session_id,
                 'citations': citations,
                 'has_citations': len(citations) > 0
             }
             
         except ClientError as e:
+            span.record_error(e)
             error_code = e.response['Error']['Code']
+            logger.warning("Error del agente Bedrock (%s): %s", error_code, e)
             if error_code == 'AccessDeniedException':
-                return {'success': False, 'error': 'Acceso denegado al agente Bedrock. Verifica los permisos IAM.'}
+                yield {'type': 'error', 'error': 'Acceso denegado al agente Bedrock. Verifica los permisos IAM.'}
             elif error_code == 'ResourceNotFoundException':
-                return {'success': False, 'error': f'Agente {self.agent_id} no encontrado.'}
+                yield {'type': 'error', 'error': f'Agente {self.agent_id} no encontrado.'}
             else:
-                return {'success': False, 'error': f'Error del agente Bedrock: {str(e)}'}
+                yield {'type': 'error', 'error': f'Error del agente Bedrock: {str(e)}'}
                 
         except BotoCoreError as e:
-            return {'success': False, 'error': f'Error de conexión AWS: {str(e)}'}
+            span.record_error(e)
+            logger.warning("Error de conexión con Bedrock: %s", e)
+            yield {'type': 'error', 'error': f'Error de conexión AWS: {str(e)}'}
             
         except Exception as e:
-            return {'success': False, 'error': f'Error inesperado: {str(e)}'}
+            span.record_error(e)
+            logger.exception("Error inesperado invocando el agente")
+            yield {'type': 'error', 'error': f'Error inesperado: {str(e)}'}
+        
+        finally:
+            span.end()
 
     def retrieve_and_generate(self, query, prompt, retrieval_config=None):
         """
@@ -152,12 +231,7 @@ class BedrockAgentService:
         Obtener información sobre el agente configurado
         """
         try:
-            agent_client = boto3.client(
-                'bedrock-agent',
-                aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-                region_name=Config.AWS_REGION
-            )
+            agent_client = get_client('bedrock-agent')
             
             response = agent_client.get_agent(agentId=self.agent_id)
             agent_alias = agent_client.get_agent_alias(
@@ -180,6 +254,7 @@ class BedrockAgentService:
 class BMCCustomAgent:
     def __init__(self):
         self.agent_service = BedrockAgentService()
+        self.response_cache = response_cache
         self.system_context = """
         Eres un agente especializado para BMC (Bolsa Mercantil de Colombia) 
         que tiene acceso a una Knowledge Base con documentación específica de procesos disciplinarios.
@@ -197,19 +272,55 @@ class BMCCustomAgent:
         usando la documentación oficial del sistema.
         """
     
-    def process_message(self, user_message, session_id=None):
+    def process_message(self, user_message, session_id=None, first_turn=False, history=None):
         """
-        Procesar mensaje usando tu agente personalizado con Knowledge Base
+        Procesar mensaje usando tu agente personalizado con Knowledge Base.
+        La caché de respuestas solo se usa en el primer turno de la sesión; una
+        respuesta cacheada no pasa por Bedrock, así que quien llama debe enviar
+        ese turno como history en la siguiente invocación.
         """
+        if first_turn:
+            cached, tag = self.response_cache.get(user_message)
+            if cached:
+                return dict(cached, session_id=session_id, cached=True)
+        
         # Primero intentar con el agente completo
-        result = self.agent_service.invoke_agent(user_message, session_id)
+        result = self.agent_service.invoke_agent(user_message, session_id, history)
         
         # Si falla, intentar con RetrieveAndGenerate directo
         #if not result['success'] and self.agent_service.knowledge_base_id:
         #    result = self.agent_service.retrieve_and_generate(user_message)
         
+        if first_turn:
+            self.response_cache.set(user_message, result, tag)
         return result
     
+    def process_message_stream(self, user_message, session_id=None, first_turn=False, history=None):
+        """
+        Procesar mensaje devolviendo los eventos del agente a medida que llegan
+        """
+        if first_turn:
+            cached, tag = self.response_cache.get(user_message)
+            if cached:
+                yield {'type': 'chunk', 'text': cached['response']}
+                for citation in cached['citations']:
+                    yield {'type': 'citation', 'citation': citation}
+                yield dict(cached, type='done', session_id=session_id, cached=True)
+                return
+        
+        for event in self.agent_service.invoke_agent_stream(user_message, session_id, history):
+            if event['type'] == 'done' and first_turn:
+                self.response_cache.set(user_message, dict(event, success=True), tag)
+            yield event
+    
     def get_agent_status(self):
-        """Verificar estado del agente"""
-        return self.agent_service.get_agent_info()
\ No newline at end of file
+        """Verificar estado del agente (metadatos cacheados en el proceso)"""
+        return agent_metadata.get()
+
+
+# Metadatos del agente (get_agent + get_agent_alias) compartidos por el proceso
+agent_metadata = RefreshingValue(
+    lambda: BedrockAgentService().get_agent_info(),
+    ttl=Config.AGENT_INFO_CACHE_TTL,
+    error_ttl=Config.AGENT_INFO_ERROR_TTL
+)
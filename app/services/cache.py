@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Caché en memoria con expulsión LRU y expiración por TTL, segura entre hilos"""
+
+    def __init__(self, maxsize=1000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Obtener un valor; cuenta como acierto o fallo"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Guardar un valor, expulsando el menos usado si se supera maxsize"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """Contadores para dimensionar la caché"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: solo la primera ejecuta la
+    función y el resto espera y recibe el mismo resultado (o la misma excepción).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['done'].set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {'executed': self.executed, 'shared': self.shared, 'in_flight': in_flight}
+
+
+class RefreshingValue:
+    """
+    Valor único cacheado en proceso con refresco en segundo plano.
+
+    La primera lectura carga el valor (las concurrentes esperan a la misma
+    carga). Cuando caduca se sigue sirviendo el valor anterior mientras un hilo
+    lo recarga, así las lecturas nunca esperan a AWS tras la primera carga.
+    Los resultados sin éxito se guardan solo error_ttl segundos.
+    """
+
+    def __init__(self, loader, ttl=300, error_ttl=30):
+        self.loader = loader
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._value = None
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.loads = 0
+        self.stale_reads = 0
+
+    def _load(self):
+        try:
+            value = self.loader()
+        except Exception as e:
+            value = {'success': False, 'error': str(e)}
+        self.loads += 1
+        if not value.get('success') and self._value is not None and self._value.get('success'):
+            # Mantener el último valor bueno si la recarga falla
+            value = self._value
+            ttl = self.error_ttl
+        else:
+            ttl = self.ttl if value.get('success') else self.error_ttl
+        with self._lock:
+            self._value = value
+            self._expires_at = time.monotonic() + ttl
+            self._refreshing = False
+        return value
+
+    def get(self):
+        with self._lock:
+            value = self._value
+            fresh = time.monotonic() < self._expires_at
+            start_refresh = value is not None and not fresh and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+
+        if value is None:
+            return self._flight.do('load', self._load)
+        if start_refresh:
+            threading.Thread(target=self._load, name='refreshing-value', daemon=True).start()
+        if not fresh:
+            self.stale_reads += 1
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._expires_at = 0.0
+
+    def stats(self):
+        return {
+            'loaded': self._value is not None,
+            'loads': self.loads,
+            'stale_reads': self.stale_reads,
+            'ttl': self.ttl
+        }
@@ -0,0 +1,92 @@
+import logging
+import queue
+import threading
+
+from app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHistoryPurger:
+    """
+    Borrado en segundo plano de conversaciones antiguas.
+
+    Limpiar el historial solo cambia la conversación actual del usuario; este
+    hilo elimina después los mensajes anteriores (DynamoDB.purge_chat_history).
+    Si el proceso termina antes, el siguiente purgado del usuario recoge lo que
+    quedara: borra todas las conversaciones anteriores, no solo la última.
+    """
+
+    def __init__(self, db=None):
+        self._db = db
+        self.queue = queue.Queue()
+        self._pending = {}
+        # Span de la petición que pidió el purgado (para colgar de él el trabajo)
+        self._origins = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.scheduled = 0
+        self.completed = 0
+        self.deleted = 0
+        self.failed = 0
+
+    @property
+    def db(self):
+        if self._db is None:
+            from app.models import DynamoDB
+            self._db = DynamoDB()
+        return self._db
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='chat-history-purger', daemon=True)
+            self._thread.start()
+
+    def purge(self, user_id, before_conversation_id):
+        """Programar el borrado de las conversaciones anteriores a before_conversation_id"""
+        with self._lock:
+            # Varias limpiezas seguidas del mismo usuario se agrupan en un solo purgado
+            queued = user_id in self._pending
+            self._pending[user_id] = max(self._pending.get(user_id, ''), before_conversation_id)
+            self._origins[user_id] = tracer.current()
+        self.scheduled += 1
+        if not queued:
+            self.queue.put(user_id)
+        self._ensure_started()
+
+    def _run(self):
+        while True:
+            user_id = self.queue.get()
+            with self._lock:
+                before_conversation_id = self._pending.pop(user_id, None)
+                origin = self._origins.pop(user_id, None)
+            if before_conversation_id is None:
+                continue
+            with tracer.span('chat_purger.purge', parent=origin, user_id=user_id) as span:
+                try:
+                    deleted, failed = self.db.purge_chat_history(user_id, before_conversation_id)
+                    self.deleted += deleted
+                    self.failed += failed
+                    span.set_attribute('deleted', deleted)
+                    span.set_attribute('failed', failed)
+                except Exception as e:
+                    logger.error(f"Error purgando historial de chat de {user_id}: {e}")
+                    span.record_error(e)
+                    self.failed += 1
+            self.completed += 1
+
+    def stats(self):
+        return {
+            'pending_users': len(self._pending),
+            'scheduled': self.scheduled,
+            'completed': self.completed,
+            'deleted': self.deleted,
+            'failed': self.failed
+        }
+
+
+chat_purger = ChatHistoryPurger()
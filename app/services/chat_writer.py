@@ -0,0 +1,214 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from config import Config
+from app.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageWriter:
+    """
+    Persistencia write-behind de ChatMessage.
+
+    Los hilos de las peticiones solo encolan; un hilo en segundo plano agrupa
+    los mensajes y los escribe con BatchWriteItem en lotes de hasta 25. Cada
+    elemento de la cola es (mensaje, span de la petición que lo encoló).
+    Los mensajes que el lote no consigue guardar se reintentan uno a uno; si
+    aun así fallan se registran como ERROR y se añaden a CHAT_DEAD_LETTER_FILE.
+    Tras cada lote se escriben también los contadores de mensajes acumulados
+    (DynamoDB.flush_chat_stats).
+    """
+
+    BATCH_SIZE = 25
+
+    def __init__(self, db=None, max_queue_size=None, flush_interval=None, dead_letter_file=None):
+        self._db = db
+        self.dead_letter_file = dead_letter_file or Config.CHAT_DEAD_LETTER_FILE
+        self.queue = queue.Queue(maxsize=max_queue_size or Config.CHAT_WRITE_QUEUE_SIZE)
+        self.flush_interval = Config.CHAT_WRITE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.rescued = 0
+        self.sync_fallbacks = 0
+
+    @property
+    def db(self):
+        if self._db is None:
+            from app.models import DynamoDB
+            self._db = DynamoDB()
+        return self._db
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='chat-message-writer', daemon=True)
+            self._thread.start()
+
+    def save(self, message):
+        """Encolar un mensaje para guardarlo en segundo plano"""
+        if self._stopping.is_set():
+            return self.db.save_chat_message(message)
+
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((message, tracer.current()))
+            self.enqueued += 1
+            return True
+        except queue.Full:
+            # Cola llena: se escribe de forma síncrona para no perder el mensaje
+            self.sync_fallbacks += 1
+            return self.db.save_chat_message(message)
+
+    def _collect_batch(self):
+        """Esperar el primer mensaje y agrupar los que lleguen durante flush_interval"""
+        try:
+            first = self.queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        messages = [message for message, _ in batch]
+        # El lote es una traza propia enlazada con las peticiones de sus mensajes
+        with tracer.span('chat_writer.batch', parent=None, links=[origin for _, origin in batch],
+                         messages=len(messages)) as span:
+            try:
+                failed = self.db.batch_save_chat_messages(messages)
+            except Exception as e:
+                logger.error(f"Error en escritura de mensajes de chat: {e}")
+                span.record_error(e)
+                failed = messages
+            if failed:
+                lost = self._rescue(failed)
+                self.rescued += len(failed) - len(lost)
+                failed = lost
+            span.set_attribute('failed', len(failed))
+        self.batches += 1
+        self.written += len(batch) - len(failed)
+        self.failed += len(failed)
+        self._flush_stats()
+        for _ in batch:
+            self.queue.task_done()
+
+    def _flush_stats(self):
+        try:
+            self.db.flush_chat_stats()
+        except Exception as e:
+            logger.error(f"Error escribiendo estadísticas de mensajes: {e}")
+
+    def _rescue(self, messages):
+        """Reintentar uno a uno los mensajes no guardados; devuelve los que se pierden"""
+        lost = []
+        for message in messages:
+            try:
+                saved = self.db.save_chat_message(message)
+            except Exception as e:
+                logger.error(f"Error guardando mensaje de chat: {e}")
+                saved = False
+            if not saved:
+                lost.append(message)
+        for message in lost:
+            logger.error(f"Mensaje de chat no guardado: user_id={message.user_id} sort_key={message.sort_key}", extra={
+                'user_id': message.user_id,
+                'sort_key': message.sort_key,
+                'message_id': message.message_id
+            })
+        if lost:
+            self._dead_letter(lost)
+        return lost
+
+    def _dead_letter(self, messages):
+        """Añadir los mensajes perdidos al fichero JSONL (un elemento de la tabla por línea)"""
+        lines = ''.join(json.dumps(message.to_dict(), ensure_ascii=False, default=str) + '\n'
+                        for message in messages)
+        try:
+            directory = os.path.dirname(self.dead_letter_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.dead_letter_file, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError as e:
+            logger.error(f"Error escribiendo {self.dead_letter_file}: {e}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+        self._drain()
+
+    def _drain(self):
+        """Escribir todo lo que quede en la cola"""
+        while True:
+            batch = []
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def flush(self, timeout=None):
+        """Bloquear hasta que la cola esté vacía y escrita"""
+        if not self._thread or not self._thread.is_alive():
+            self._drain()
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(0.05)
+
+    def shutdown(self, timeout=10):
+        """Detener el hilo escribiendo los mensajes pendientes"""
+        self._stopping.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        else:
+            self._drain()
+        # Contadores de los mensajes guardados de forma síncrona
+        self._flush_stats()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_size': self.queue.maxsize,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'batches': self.batches,
+            'failed': self.failed,
+            'rescued': self.rescued,
+            'sync_fallbacks': self.sync_fallbacks,
+            'dead_letter_file': self.dead_letter_file
+        }
+
+
+chat_writer = ChatMessageWriter()
+atexit.register(chat_writer.shutdown)
@@ -0,0 +1,79 @@
+import hashlib
+import threading
+
+from config import Config
+
+CLAIMED = 'claimed'
+REPLAY = 'replay'
+MISMATCH = 'mismatch'
+IN_PROGRESS = 'in_progress'
+
+
+class IdempotencyStore:
+    """
+    Resultados de peticiones con Idempotency-Key, por usuario.
+
+    Las claves viven en la tabla de coordinación de DynamoDB, compartida por
+    todos los workers, junto con el hash del mensaje: un reintento con la misma
+    clave y el mismo mensaje recibe el resultado guardado (en /send o en
+    /stream), y la misma clave con otro mensaje se rechaza. Solo se guardan los
+    resultados exitosos: tras un error se puede reintentar.
+    """
+
+    def __init__(self, ttl=None, claim_timeout=None):
+        self.ttl = ttl or Config.IDEMPOTENCY_TTL
+        # Una reserva cuyo worker murió sin completarla caduca tras claim_timeout
+        self.claim_timeout = claim_timeout or Config.BEDROCK_READ_TIMEOUT * 2
+        self._db = None
+        self._lock = threading.Lock()
+        self.claims = 0
+        self.replays = 0
+        self.conflicts = 0
+        self.mismatches = 0
+
+    @property
+    def db(self):
+        if self._db is None:
+            from app.models import DynamoDB
+            self._db = DynamoDB()
+        return self._db
+
+    @staticmethod
+    def request_hash(message):
+        return hashlib.sha256(message.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _pk(scope, key):
+        return f'idem#{scope}#{key}'
+
+    def claim(self, scope, key, message):
+        """
+        Reservar (scope, key) para el mensaje. Devuelve (estado, resultado):
+        CLAIMED (ejecutar y llamar a complete), REPLAY con el resultado guardado,
+        MISMATCH o IN_PROGRESS.
+        """
+        status, result = self.db.claim_idempotency_key(
+            self._pk(scope, key), self.request_hash(message), self.claim_timeout
+        )
+        counter = {CLAIMED: 'claims', REPLAY: 'replays', MISMATCH: 'mismatches', IN_PROGRESS: 'conflicts'}[status]
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        return status, result
+
+    def complete(self, scope, key, result=None):
+        """Guardar el resultado si fue exitoso; si no, liberar la clave para reintentar"""
+        self.db.complete_idempotency_key(self._pk(scope, key), result, self.ttl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'claims': self.claims,
+                'replays': self.replays,
+                'conflicts': self.conflicts,
+                'mismatches': self.mismatches,
+                'ttl': self.ttl,
+                'claim_timeout': self.claim_timeout
+            }
+
+
+idempotency_store = IdempotencyStore()
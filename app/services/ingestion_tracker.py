@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'PENDING'
+INDEXING = 'INDEXING'
+INDEXED = 'INDEXED'
+FAILED = 'FAILED'
+UNCONFIRMED = 'UNCONFIRMED'
+
+FINAL_STATES = (INDEXED, FAILED, UNCONFIRMED)
+
+
+def _parse_since(since):
+    if isinstance(since, datetime):
+        value = since
+    else:
+        value = datetime.fromisoformat(since)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class IngestionTracker:
+    """
+    Seguimiento asíncrono de la indexación en la Knowledge Base.
+
+    Cada subida o borrado registra un handle con el momento en que S3 confirmó
+    el cambio (al terminar la subida, no al empezarla). Un hilo en segundo plano consulta los jobs de ingestión
+    (S3Service.list_recent_ingestion_jobs) mientras haya handles pendientes y
+    resuelve cada uno con el primer job que empezó después de ese momento.
+    """
+
+    def __init__(self, s3_service=None, db=None, poll_interval=None, timeout=None):
+        self._s3_service = s3_service
+        self._db = db
+        self.poll_interval = poll_interval or Config.INGESTION_POLL_INTERVAL
+        self.timeout = timeout or Config.INGESTION_TRACK_TIMEOUT
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def s3_service(self):
+        if self._s3_service is None:
+            from app.services.s3_service import S3Service
+            self._s3_service = S3Service()
+        return self._s3_service
+
+    @property
+    def db(self):
+        if self._db is None:
+            from app.models import DynamoDB
+            self._db = DynamoDB()
+        return self._db
+
+    def track(self, since, document_id=None, handle_id=None):
+        """Registrar un cambio pendiente de indexar y devolver su handle"""
+        handle_id = handle_id or document_id or str(uuid.uuid4())
+        with self._lock:
+            handle = self._handles.get(handle_id)
+            if handle is None:
+                handle = {
+                    'handle_id': handle_id,
+                    'document_id': document_id,
+                    'since': _parse_since(since),
+                    'registered_at': time.monotonic(),
+                    'status': PENDING,
+                    'job_id': None
+                }
+                self._handles[handle_id] = handle
+        self._ensure_started()
+        self._wakeup.set()
+        return self.describe(handle_id)
+
+    def describe(self, handle_id):
+        """Estado actual de un handle (o None si no se conoce)"""
+        with self._lock:
+            handle = self._handles.get(handle_id)
+            if handle is None:
+                return None
+            return {
+                'handle_id': handle['handle_id'],
+                'document_id': handle['document_id'],
+                'status': handle['status'],
+                'job_id': handle['job_id'],
+                'since': handle['since'].isoformat()
+            }
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='ingestion-tracker', daemon=True)
+            self._thread.start()
+
+    def _pending(self):
+        with self._lock:
+            return [dict(h) for h in self._handles.values() if h['status'] not in FINAL_STATES]
+
+    def _run(self):
+        while True:
+            if not self._pending():
+                # Sin trabajo pendiente: no se hacen llamadas a AWS
+                self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error consultando jobs de ingestión: {e}")
+            self._wakeup.wait(self.poll_interval)
+
+    def _prune(self):
+        """Olvidar los handles resueltos hace más de una hora"""
+        cutoff = time.monotonic() - 3600
+        with self._lock:
+            for handle_id in [
+                h['handle_id'] for h in self._handles.values()
+                if h.get('resolved_at') and h['resolved_at'] < cutoff
+            ]:
+                del self._handles[handle_id]
+
+    def poll(self):
+        """Consultar los jobs de ingestión una vez y resolver los handles pendientes"""
+        self._prune()
+        pending = self._pending()
+        if not pending:
+            return
+
+        jobs_result = self.s3_service.list_recent_ingestion_jobs()
+        if not jobs_result['success']:
+            return
+        jobs = sorted(
+            (job for job in jobs_result['jobs'] if job.get('started_at')),
+            key=lambda job: job['started_at']
+        )
+
+        for handle in pending:
+            status, job_id = self._resolve(handle, jobs)
+            if status != handle['status'] or job_id != handle['job_id']:
+                self._update(handle, status, job_id)
+
+    def _resolve(self, handle, jobs):
+        """Estado del handle según los jobs que empezaron después del cambio"""
+        candidates = [job for job in jobs if job['started_at'] >= handle['since']]
+        for job in candidates:
+            if job['status'] == 'COMPLETE':
+                return INDEXED, job['job_id']
+        for job in candidates:
+            if job['status'] in ('STARTING', 'IN_PROGRESS'):
+                return INDEXING, job['job_id']
+        for job in candidates:
+            if job['status'] == 'FAILED':
+                return FAILED, job['job_id']
+        if time.monotonic() - handle['registered_at'] > self.timeout:
+            return UNCONFIRMED, None
+        return handle['status'], handle['job_id']
+
+    def _update(self, handle, status, job_id):
+        with self._lock:
+            current = self._handles.get(handle['handle_id'])
+            if current is None:
+                return
+            current['status'] = status
+            current['job_id'] = job_id
+            if status in FINAL_STATES:
+                current['resolved_at'] = time.monotonic()
+        if handle['document_id']:
+            self.db.update_document_ingestion(handle['document_id'], status, job_id)
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for handle in self._handles.values():
+                by_status[handle['status']] = by_status.get(handle['status'], 0) + 1
+            return {'tracked': len(self._handles), 'by_status': by_status}
+
+
+ingestion_tracker = IngestionTracker()
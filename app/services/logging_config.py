@@ -0,0 +1,213 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from config import Config
+
+# Clases de servicio cuyo logging DEBUG se muestrea (LOG_DEBUG_SAMPLE_RATE)
+SAMPLED_DEBUG_LOGGERS = ('app.models', 'app.services.s3_service', 'app.services.bedrock_agent_service')
+
+# Atributos propios de LogRecord: el resto son campos estructurados (extra={...})
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+_lock = threading.Lock()
+# (handler, listener) de cada cola de logging del proceso
+_queues = []
+_configured_pid = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con los campos de extra={...} al primer nivel"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _TraceContextFilter(logging.Filter):
+    """Añade trace_id/span_id del span activo (se ejecuta en el hilo que emite)"""
+
+    def filter(self, record):
+        from app.services.tracing import tracer
+        span = tracer.current()
+        if span is not None and span.recording:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Deja pasar todos los registros INFO+ y una fracción de los DEBUG"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.sampled = 0
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if random.random() < self.rate:
+            self.sampled += 1
+            return True
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler con cola acotada que nunca bloquea: si la cola está llena el
+    registro se descarta y se cuenta. El formateo y la escritura ocurren en el
+    hilo del QueueListener.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolver mensaje y traza aquí (los argumentos pueden cambiar después)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def async_handler(*handlers, queue_size=None):
+    """Handler no bloqueante que entrega los registros a handlers en un hilo propio"""
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size or Config.LOG_QUEUE_SIZE))
+    listener = QueueListener(handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    with _lock:
+        _queues.append((handler, listener))
+    return handler
+
+
+def _parse_levels(spec):
+    """'app.models=DEBUG,botocore=WARNING' -> {'app.models': 'DEBUG', 'botocore': 'WARNING'}"""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _explicit_level(name, levels):
+    """True si LOG_LEVELS fija el nivel de name o de alguno de sus padres"""
+    return any(name == configured or name.startswith(configured + '.') for configured in levels)
+
+
+def configure_logging(fmt=None):
+    """
+    Configurar el logging del proceso (idempotente; se repite tras un fork).
+    Todos los registros pasan por una cola acotada hacia stdout (y LOG_FILE
+    si se define), en JSON o texto según LOG_FORMAT.
+    """
+    global _configured_pid
+    if _configured_pid == os.getpid():
+        return
+    _configured_pid = os.getpid()
+
+    fmt = fmt or Config.LOG_FORMAT
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    outputs = [logging.StreamHandler(sys.stdout)]
+    if Config.LOG_FILE:
+        outputs.append(RotatingFileHandler(Config.LOG_FILE, maxBytes=Config.LOG_FILE_MAX_BYTES,
+                                           backupCount=Config.LOG_FILE_BACKUP_COUNT, encoding='utf-8'))
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    # Tras un fork los hilos de los listeners heredados ya no existen
+    with _lock:
+        _queues[:] = [(h, l) for h, l in _queues if l._thread is not None and l._thread.is_alive()]
+
+    handler = async_handler(*outputs)
+    handler.addFilter(_TraceContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(Config.LOG_LEVEL.upper())
+
+    # Con nivel INFO o más detallado, los servicios emiten también una muestra de su DEBUG.
+    # Un logger (o un padre suyo) con nivel explícito en LOG_LEVELS no se muestrea.
+    levels = _parse_levels(Config.LOG_LEVELS)
+    sample_debug = Config.LOG_DEBUG_SAMPLE_RATE > 0 and root.level <= logging.INFO
+    for name in SAMPLED_DEBUG_LOGGERS:
+        logger = logging.getLogger(name)
+        for existing in [f for f in logger.filters if isinstance(f, DebugSampler)]:
+            logger.removeFilter(existing)
+        if _explicit_level(name, levels):
+            # Hereda el nivel configurado (el propio se fija más abajo)
+            logger.setLevel(logging.NOTSET)
+            continue
+        logger.addFilter(DebugSampler(Config.LOG_DEBUG_SAMPLE_RATE))
+        if sample_debug:
+            logger.setLevel(logging.DEBUG)
+
+    # Niveles por módulo (prevalecen sobre lo anterior)
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def shutdown_logging():
+    """Vaciar las colas y detener los listeners (al salir del proceso)"""
+    with _lock:
+        queues = list(_queues)
+        _queues.clear()
+    for _, listener in queues:
+        if listener._thread is not None:
+            listener.stop()
+
+
+def logging_stats():
+    samplers = [f for name in SAMPLED_DEBUG_LOGGERS for f in logging.getLogger(name).filters
+                if isinstance(f, DebugSampler)]
+    with _lock:
+        handlers = [handler for handler, _ in _queues]
+    return {
+        'queue_depth': sum(h.queue.qsize() for h in handlers),
+        'dropped': sum(h.dropped for h in handlers),
+        'debug_sampled': sum(s.sampled for s in samplers),
+        'debug_dropped': sum(s.dropped for s in samplers)
+    }
+
+
+atexit.register(shutdown_logging)
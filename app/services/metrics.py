@@ -0,0 +1,236 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites (segundos) de los histogramas de latencia
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Nombre corto de cada servicio de AWS en métricas y en Server-Timing
+_SERVICE_SEGMENTS = {
+    'dynamodb': 'dynamodb',
+    's3': 's3',
+    'bedrock-agent-runtime': 'bedrock',
+    'bedrock-agent': 'bedrock_control',
+    'bedrock': 'bedrock_control'
+}
+
+# Fuera de una petición (hilos de fondo, s3transfer, etc.)
+BACKGROUND_ROUTE = 'background'
+
+
+def _segment_for(service_name):
+    return _SERVICE_SEGMENTS.get(service_name, service_name.replace('-', '_'))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Histograma acumulativo estilo Prometheus (no seguro entre hilos: lo protege el registro)"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTimings:
+    """Tiempo acumulado por segmento dentro de una petición (para Server-Timing)"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.segments = {}
+
+    def add(self, segment, seconds):
+        entry = self.segments.setdefault(segment, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def server_timing(self):
+        parts = [
+            f'{segment};dur={total * 1000:.1f};desc="{count} {"llamada" if count == 1 else "llamadas"}"'
+            for segment, (total, count) in self.segments.items()
+        ]
+        parts.append(f'app;dur={(time.perf_counter() - self.started_at) * 1000:.1f}')
+        return ', '.join(parts)
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def current_route():
+    timings = _current.get()
+    return timings.route if timings is not None else BACKGROUND_ROUTE
+
+
+class MetricsRegistry:
+    """
+    Histogramas y contadores por proceso. Cada worker de gunicorn tiene los
+    suyos: /metrics expone solo los del worker que atiende el scrape.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # nombre -> (tipo, ayuda, nombres de etiquetas, {valores de etiquetas: Histogram | número})
+        self._metrics = {}
+
+    def _define(self, kind, name, help_text, labels):
+        if name not in self._metrics:
+            self._metrics[name] = (kind, help_text, labels, {})
+        return self._metrics[name][3]
+
+    def observe(self, name, help_text, labels, values, seconds):
+        with self._lock:
+            series = self._define('histogram', name, help_text, labels)
+            histogram = series.get(values)
+            if histogram is None:
+                histogram = series[values] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, help_text, labels, values, amount=1):
+        with self._lock:
+            series = self._define('counter', name, help_text, labels)
+            series[values] = series.get(values, 0) + amount
+
+    def render(self):
+        """Exposición en formato de texto de Prometheus (0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, labels, series) in sorted(self._metrics.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for values, metric in sorted(series.items()):
+                    if kind == 'counter':
+                        lines.append(f'{name}{_format_labels(labels, values)} {metric}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + ('+Inf',), metric.counts):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f'{name}_bucket{_format_labels(labels, values, le)} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels, values)} {metric.sum:.6f}')
+                    lines.append(f'{name}_count{_format_labels(labels, values)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+    def stats(self):
+        with self._lock:
+            requests = self._metrics.get('bmc_http_request_duration_seconds')
+            return {
+                'series': sum(len(series) for _, _, _, series in self._metrics.values()),
+                'requests': sum(h.count for h in requests[3].values()) if requests else 0
+            }
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    # --- Segmentos de la aplicación y llamadas a AWS ---
+
+    def record_segment(self, segment, seconds):
+        """Tiempo de un tramo con nombre (load_user, bedrock_first_token...)"""
+        self.observe('bmc_segment_duration_seconds', 'Duración de tramos instrumentados de la aplicación',
+                     ('segment', 'route'), (segment, current_route()), seconds)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(segment, seconds)
+
+    @contextmanager
+    def timed(self, segment):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_segment(segment, time.perf_counter() - started_at)
+
+    def record_aws_call(self, service_name, operation, seconds, error=False):
+        values = (_segment_for(service_name), operation, current_route())
+        labels = ('service', 'operation', 'route')
+        self.observe('bmc_aws_call_duration_seconds', 'Duración de las llamadas a AWS', labels, values, seconds)
+        if error:
+            self.inc('bmc_aws_call_errors_total', 'Llamadas a AWS con error', labels, values)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(values[0], seconds)
+
+    # --- Eventos de botocore ---
+
+    def instrument_session(self, session):
+        """Registrar los hooks before-call/after-call en una sesión boto3 (antes de crear clientes)"""
+        session.events.register('before-call', self._before_call, unique_id='bmc-metrics-before')
+        session.events.register('after-call', self._after_call, unique_id='bmc-metrics-after')
+        session.events.register('after-call-error', self._after_call_error, unique_id='bmc-metrics-error')
+
+    def _before_call(self, model, context, **kwargs):
+        context['metrics_started_at'] = time.perf_counter()
+
+    def _finish_call(self, model_service, operation, context, error):
+        started_at = context.pop('metrics_started_at', None)
+        if started_at is not None:
+            self.record_aws_call(model_service, operation, time.perf_counter() - started_at, error)
+
+    def _after_call(self, http_response, model, context, **kwargs):
+        self._finish_call(model.service_model.service_name, model.name, context,
+                          http_response.status_code >= 300)
+
+    def _after_call_error(self, context, event_name, **kwargs):
+        # after-call-error.<service-id>.<Operation>
+        _, service_id, operation = event_name.split('.', 2)
+        self._finish_call(service_id, operation, context, True)
+
+    # --- Peticiones de Flask ---
+
+    def init_app(self, app):
+        from flask import g, request
+
+        @app.before_request
+        def _start_request_timing():
+            rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            g.request_timings = RequestTimings(rule)
+            g.request_timings_token = _current.set(g.request_timings)
+
+        @app.after_request
+        def _finish_request_timing(response):
+            timings = g.get('request_timings')
+            if timings is None:
+                return response
+            # En respuestas en streaming solo cubre hasta el envío de cabeceras
+            self.observe('bmc_http_request_duration_seconds', 'Duración de las peticiones HTTP',
+                         ('route', 'method', 'status'),
+                         (timings.route, request.method, str(response.status_code)),
+                         time.perf_counter() - timings.started_at)
+            response.headers['Server-Timing'] = timings.server_timing()
+            return response
+
+        @app.teardown_request
+        def _clear_request_timing(exc):
+            token = g.pop('request_timings_token', None)
+            if token is not None:
+                try:
+                    _current.reset(token)
+                except ValueError:
+                    # Contexto distinto (p. ej. stream consumido en otro contexto)
+                    _current.set(None)
+
+
+metrics = MetricsRegistry()
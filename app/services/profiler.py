@@ -0,0 +1,220 @@
+import fnmatch
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Profundidad máxima de pila que se guarda por muestra
+MAX_STACK_DEPTH = 128
+
+_PROFILE_NAME = re.compile(r'^[\w.-]+\.folded$')
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_name}"
+
+
+def _collapse(frame):
+    """Pila de un hilo en formato collapsed (raíz primero, separada por ';')"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+class _ProfileSession:
+    def __init__(self, pattern, max_requests, duration, interval):
+        self.id = uuid.uuid4().hex[:8]
+        self.pattern = pattern
+        self.max_requests = max_requests
+        self.interval = interval
+        self.started_at = datetime.now(timezone.utc)
+        self.deadline = time.monotonic() + min(duration or Config.PROFILER_MAX_SECONDS,
+                                               Config.PROFILER_MAX_SECONDS)
+        self.filename = f"{self.started_at:%Y%m%d-%H%M%S}-{self.id}.folded"
+        self.requests = 0
+        self.samples = 0
+        self.stacks = Counter()
+        # ident del hilo -> etiqueta de la petición ("GET /auth/login")
+        self.targets = {}
+        self.stopped = threading.Event()
+
+    def accepting(self):
+        return self.max_requests is None or self.requests < self.max_requests
+
+    def finished(self):
+        if self.stopped.is_set() or time.monotonic() >= self.deadline:
+            return True
+        return not self.accepting() and not self.targets
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'pattern': self.pattern,
+            'max_requests': self.max_requests,
+            'requests': self.requests,
+            'samples': self.samples,
+            'active_requests': len(self.targets),
+            'started_at': self.started_at.isoformat(),
+            'seconds_left': max(0, round(self.deadline - time.monotonic(), 1)),
+            'filename': self.filename
+        }
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo bajo demanda. Mientras está armado, un hilo toma la
+    pila de los hilos que atienden peticiones cuya ruta coincide con el patrón
+    (fnmatch sobre request.path) cada PROFILER_SAMPLE_INTERVAL segundos, y al
+    terminar escribe las pilas agregadas en PROFILER_DIR en formato collapsed
+    (compatible con flamegraph.pl / speedscope).
+
+    Desarmado, el coste por petición es comprobar un atributo. Afecta solo al
+    proceso que recibe la orden (cada worker de gunicorn tiene el suyo).
+    """
+
+    def __init__(self, output_dir=None):
+        self.output_dir = output_dir or Config.PROFILER_DIR
+        self._lock = threading.Lock()
+        self._session = None
+        self.history = []
+
+    @property
+    def armed(self):
+        return self._session is not None
+
+    def arm(self, pattern, max_requests=None, duration=None, interval=None):
+        """Armar el perfilador; devuelve el resumen de la sesión o None si ya hay una activa"""
+        session = _ProfileSession(pattern or '*', max_requests, duration,
+                                  interval or Config.PROFILER_SAMPLE_INTERVAL)
+        with self._lock:
+            if self._session is not None:
+                return None
+            self._session = session
+        threading.Thread(target=self._run, args=(session,), daemon=True,
+                         name=f'profiler-{session.id}').start()
+        return session.summary()
+
+    def stop(self):
+        session = self._session
+        if session is not None:
+            session.stopped.set()
+        return session is not None
+
+    def status(self):
+        session = self._session
+        return session.summary() if session is not None else None
+
+    # --- Hooks de petición ---
+
+    def start_request(self, label, path):
+        session = self._session
+        if session is None or not fnmatch.fnmatchcase(path, session.pattern):
+            return False
+        with self._lock:
+            if self._session is not session or not session.accepting():
+                return False
+            session.requests += 1
+            session.targets[threading.get_ident()] = label
+        return True
+
+    def finish_request(self):
+        session = self._session
+        if session is not None:
+            with self._lock:
+                session.targets.pop(threading.get_ident(), None)
+
+    def init_app(self, app):
+        from flask import g, request
+
+        # Cada muestra empieza por el método y la regla de la ruta ("POST /auth/login")
+        @app.before_request
+        def _start_profiling():
+            if self._session is not None:
+                rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+                g.profiled = self.start_request(f'{request.method} {rule}', request.path)
+
+        @app.teardown_request
+        def _finish_profiling(exc):
+            if g.pop('profiled', False):
+                self.finish_request()
+
+    # --- Muestreo ---
+
+    def _run(self, session):
+        try:
+            while not session.finished():
+                with self._lock:
+                    targets = dict(session.targets)
+                if targets:
+                    frames = sys._current_frames()
+                    for ident, label in targets.items():
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            session.stacks[f'{label};{_collapse(frame)}'] += 1
+                            session.samples += 1
+                    del frames
+                session.stopped.wait(session.interval)
+            self._write(session)
+        except Exception as e:
+            logger.error(f"Error en el perfilador {session.id}: {e}")
+        finally:
+            with self._lock:
+                self._session = None
+                session.targets.clear()
+                self.history.insert(0, session.summary())
+                del self.history[20:]
+
+    def _write(self, session):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, session.filename)
+        with open(path, 'w') as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        logger.info(f"Perfil {session.id}: {session.requests} peticiones, {session.samples} muestras -> {path}")
+
+    # --- Ficheros ---
+
+    def list_profiles(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.output_dir):
+            if not _PROFILE_NAME.match(name):
+                continue
+            stat = os.stat(os.path.join(self.output_dir, name))
+            profiles.append({
+                'filename': name,
+                'size': stat.st_size,
+                'created_at': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()
+            })
+        return sorted(profiles, key=lambda p: p['created_at'], reverse=True)
+
+    def profile_path(self, filename):
+        """Ruta de un perfil existente, o None si el nombre no es válido"""
+        if not _PROFILE_NAME.match(filename):
+            return None
+        path = os.path.join(self.output_dir, filename)
+        return path if os.path.isfile(path) else None
+
+    def stats(self):
+        return {
+            'armed': self.armed,
+            'session': self.status(),
+            'profiles': len(self.list_profiles())
+        }
+
+
+profiler = SamplingProfiler()
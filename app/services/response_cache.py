@@ -0,0 +1,154 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from config import Config
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def completed_job_tag(jobs):
+    """ID del job de ingestión COMPLETE más reciente (por started_at), o None"""
+    completed = [job for job in jobs if job.get('status') == 'COMPLETE']
+    if not completed:
+        return None
+    latest = max(completed, key=lambda job: (job.get('started_at') is not None, job.get('started_at') or 0))
+    return latest.get('job_id')
+
+
+class ResponseCache:
+    """
+    Caché de respuestas exactas del agente, compartida entre usuarios.
+
+    La clave es solo el prompt normalizado, así que únicamente se usa en el
+    primer turno de una sesión de Bedrock (sin contexto previo la respuesta no
+    depende de la conversación); quien llama decide si el turno es cacheable.
+
+    Las entradas se etiquetan con el último job de ingestión COMPLETE de la
+    Knowledge Base: cuando termina uno nuevo se descartan todas las respuestas
+    anteriores. La etiqueta se refresca en segundo plano cada tag_refresh
+    segundos (y desde sync_watcher cuando ya está consultando los jobs); las
+    peticiones nunca esperan a la API de Bedrock.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, tag_refresh=None):
+        self.cache = TTLCache(
+            maxsize=maxsize or Config.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=ttl or Config.RESPONSE_CACHE_TTL
+        )
+        # 0 desactiva el refresco en segundo plano (la etiqueta solo cambia con update_tag)
+        self.tag_refresh = Config.RESPONSE_CACHE_TAG_REFRESH if tag_refresh is None else tag_refresh
+        self._s3_service = None
+        self._tag = None
+        self._tag_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.tag_refreshes = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+
+    @staticmethod
+    def normalize(prompt):
+        """Normalizar el prompt: mayúsculas, espacios y signos de puntuación de los extremos"""
+        text = unicodedata.normalize('NFKC', prompt or '').casefold()
+        text = re.sub(r'\s+', ' ', text)
+        return text.strip(' ¿?¡!.,;:')
+
+    # --- Etiqueta de la Knowledge Base ---
+
+    def _ensure_started(self):
+        if self.tag_refresh <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='response-cache-tag', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_tag()
+            except Exception as e:
+                logger.warning(f"Error refrescando la etiqueta de la caché de respuestas: {e}")
+            time.sleep(self.tag_refresh)
+
+    def refresh_tag(self):
+        """Consultar los jobs de ingestión y actualizar la etiqueta (se conserva si falla)"""
+        if self._s3_service is None:
+            from app.services.s3_service import S3Service
+            self._s3_service = S3Service()
+
+        jobs_result = self._s3_service.list_recent_ingestion_jobs()
+        self.tag_refreshes += 1
+        if jobs_result.get('success'):
+            self.update_tag(completed_job_tag(jobs_result['jobs']))
+
+    def update_tag(self, tag):
+        """Fijar el último job COMPLETE; si cambia se vacía la caché"""
+        with self._tag_lock:
+            if tag == self._tag:
+                return
+            if self._tag is not None:
+                self.cache.clear()
+                self.invalidations += 1
+            self._tag = tag
+
+    # --- Entradas ---
+
+    def get(self, prompt):
+        """
+        Devuelve (respuesta cacheada o None, etiqueta vigente). La etiqueta se
+        pasa después a set() para no guardar una respuesta de una KB anterior.
+        """
+        tag = self._tag
+        key = self.normalize(prompt)
+        if not key:
+            return None, tag
+        self._ensure_started()
+        entry = self.cache.get(key)
+        if entry is None:
+            return None, tag
+        if entry['tag'] != tag:
+            self.cache.delete(key)
+            return None, tag
+        return entry['result'], tag
+
+    def set(self, prompt, result, tag):
+        """
+        Guardar una respuesta exitosa junto con sus citaciones. Si la etiqueta
+        cambió mientras se generaba (terminó una ingestión) se descarta.
+        """
+        key = self.normalize(prompt)
+        if not key or not result.get('success'):
+            return
+        with self._tag_lock:
+            if tag != self._tag:
+                self.stale_writes += 1
+                return
+            self.cache.set(key, {
+                'tag': tag,
+                'result': {
+                    'success': True,
+                    'response': result['response'],
+                    'citations': result.get('citations', []),
+                    'has_citations': result.get('has_citations', False)
+                }
+            })
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['kb_tag'] = self._tag
+        stats['tag_refreshes'] = self.tag_refreshes
+        stats['invalidations'] = self.invalidations
+        stats['stale_writes'] = self.stale_writes
+        return stats
+
+
+response_cache = ResponseCache()
@@ -1,36 +1,109 @@
-import boto3
+import hashlib
+import logging
+import threading
 import uuid
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError, NoCredentialsError
 from config import Config
+from app.services.aws_clients import get_client
+from app.services.cache import TTLCache, SingleFlight
+from app.services.metrics import metrics
+from app.services.tracing import tracer
+from concurrent.futures import ThreadPoolExecutor
 import os
-import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Progreso de las subidas en curso, consultable por upload_id
+upload_progress = TTLCache(maxsize=1000, ttl=3600)
+
+# Respuestas del plano de control de la Knowledge Base (data sources y jobs de
+# ingestión), compartidas por todas las pestañas y servicios del proceso
+kb_status_cache = TTLCache(maxsize=64, ttl=Config.KB_STATUS_CACHE_TTL)
+kb_status_calls = SingleFlight()
+
+
+class _HashingReader:
+    """
+    Envoltura de solo lectura que cuenta los bytes y calcula el SHA-256 al vuelo.
+    No expone seek/tell, así s3transfer lee el stream una única vez y en orden.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        if data:
+            self._sha256.update(data)
+            self.size += len(data)
+        return data
+
+    @property
+    def checksum(self):
+        return self._sha256.hexdigest()
+
+
+class _UploadProgress:
+    """Callback de s3transfer que acumula los bytes enviados (llamado desde varios hilos)"""
+
+    def __init__(self, upload_id, total=None):
+        self.upload_id = upload_id
+        self.total = total or None
+        self.transferred = 0
+        self._lock = threading.Lock()
+        self._publish()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.transferred += bytes_amount
+            self._publish()
+
+    def _publish(self):
+        if self.upload_id:
+            upload_progress.set(self.upload_id, {
+                'transferred': self.transferred,
+                'total': self.total,
+                'done': False
+            })
+
+    def finish(self, size):
+        if self.upload_id:
+            upload_progress.set(self.upload_id, {'transferred': size, 'total': size, 'done': True})
+
 
 class S3Service:
     def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-            region_name=Config.AWS_REGION
-        )
+        # No se hacen llamadas a AWS al construir; el bucket se crea con bootstrap.py
         self.bucket_name = Config.S3_BUCKET_NAME
-        self.ensure_bucket_exists()
-        
-        self.bedrock_agent_client = boto3.client(
-            'bedrock-agent',
-            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-            region_name=Config.AWS_REGION
-        )
-        
         self.knowledge_base_id = os.environ.get('BEDROCK_KNOWLEDGE_BASE_ID')
-        self.ensure_bucket_exists()
+
+    @property
+    def s3_client(self):
+        return get_client('s3')
+
+    @property
+    def bedrock_agent_client(self):
+        return get_client('bedrock-agent')
+
+    @property
+    def transfer_config(self):
+        """Configuración multiparte: umbral, tamaño de parte y concurrencia"""
+        return TransferConfig(
+            multipart_threshold=Config.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=Config.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=Config.S3_MAX_CONCURRENCY,
+            use_threads=True
+        )
 
     def ensure_bucket_exists(self):
         """Verificar que el bucket S3 existe, si no crearlo"""
         try:
             self.s3_client.head_bucket(Bucket=self.bucket_name)
-            print(f"Bucket S3 '{self.bucket_name}' existe y está accesible")
+            logger.debug("Bucket S3 '%s' existe y está accesible", self.bucket_name)
         except ClientError as e:
             error_code = e.response['Error']['Code']
             if error_code == '404':
@@ -43,54 +116,146 @@ class S3Service:
                             Bucket=self.bucket_name,
                             CreateBucketConfiguration={'LocationConstraint': Config.AWS_REGION}
                         )
-                    print(f"Bucket S3 '{self.bucket_name}' creado exitosamente")
+                    logger.info(f"Bucket S3 '{self.bucket_name}' creado exitosamente")
                 except ClientError as create_error:
-                    print(f"Error creando bucket S3: {create_error}")
+                    logger.error(f"Error creando bucket S3: {create_error}")
             else:
-                print(f"Error accediendo a bucket S3: {e}")
+                logger.error(f"Error accediendo a bucket S3: {e}")
 
-    def upload_file(self, file, folder=None, user_id=None):
-        """Subir archivo a S3"""
+    def build_upload_key(self, filename, folder=None, user_id=None):
+        """Generar nombre único y key S3: uploads/<categoría>/<user_id>/<uuid><ext>"""
+        file_extension = os.path.splitext(filename)[1].lower()
+        unique_filename = f"{uuid.uuid4()}{file_extension}"
+        
+        # Construir la ruta en S3
+        s3_path_parts = [Config.S3_UPLOAD_FOLDER]
+        if folder:
+            s3_path_parts.append(folder)
+        if user_id:
+            s3_path_parts.append(user_id)
+        s3_path_parts.append(unique_filename)
+        
+        return unique_filename, "/".join(s3_path_parts)
+
+    def get_public_url(self, s3_key):
+        return f"https://{self.bucket_name}.s3.{Config.AWS_REGION}.amazonaws.com/{s3_key}"
+
+    def create_presigned_upload(self, filename, content_type, folder=None, user_id=None, expires_in=None):
+        """
+        Generar un POST firmado para que el navegador suba el archivo directamente a S3.
+        La política fija la key, el Content-Type, el nombre original y el tamaño máximo.
+        """
         try:
-            # Generar nombre único para el archivo
-            file_extension = os.path.splitext(file.filename)[1].lower()
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            
-            # Construir la ruta en S3
-            s3_path_parts = [Config.S3_UPLOAD_FOLDER]
-            if folder:
-                s3_path_parts.append(folder)
-            if user_id:
-                s3_path_parts.append(user_id)
-            s3_path_parts.append(unique_filename)
-            
-            s3_key = "/".join(s3_path_parts)
-            
-            # Subir archivo
-            self.s3_client.upload_fileobj(
-                file,
-                self.bucket_name,
-                s3_key,
-                ExtraArgs={
-                    'ContentType': file.content_type,
-                    'Metadata': {
-                        'original_filename': file.filename
-                    }
+            unique_filename, s3_key = self.build_upload_key(filename, folder, user_id)
+            content_type = content_type or 'application/octet-stream'
+            fields = {
+                'Content-Type': content_type,
+                'x-amz-meta-original_filename': filename
+            }
+            conditions = [
+                {'Content-Type': content_type},
+                {'x-amz-meta-original_filename': filename},
+                ['content-length-range', 1, Config.S3_DIRECT_UPLOAD_MAX_SIZE]
+            ]
+            presigned = self.s3_client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Fields=fields,
+                Conditions=conditions,
+                ExpiresIn=expires_in or Config.S3_PRESIGNED_POST_EXPIRES
+            )
+            return {
+                'success': True,
+                'url': presigned['url'],
+                'fields': presigned['fields'],
+                's3_key': s3_key,
+                'filename': unique_filename
+            }
+        except ClientError as e:
+            return {'success': False, 'error': f"Error generando subida firmada: {e}"}
+
+    def get_object_info(self, s3_key):
+        """Validar que un objeto existe y obtener sus metadatos con head_object"""
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return {
+                'success': True,
+                'size': response['ContentLength'],
+                'content_type': response.get('ContentType'),
+                'metadata': response.get('Metadata', {}),
+                'etag': response.get('ETag', '').strip('"'),
+                'last_modified': response.get('LastModified')
+            }
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return {'success': False, 'error': 'El archivo no existe en S3'}
+            return {'success': False, 'error': f"Error consultando archivo: {e}"}
+
+    def ensure_bucket_cors(self, origins):
+        """Permitir subidas POST directas desde el navegador para los orígenes indicados"""
+        try:
+            self.s3_client.put_bucket_cors(
+                Bucket=self.bucket_name,
+                CORSConfiguration={
+                    'CORSRules': [{
+                        'AllowedOrigins': origins,
+                        'AllowedMethods': ['POST'],
+                        'AllowedHeaders': ['*'],
+                        'ExposeHeaders': ['ETag'],
+                        'MaxAgeSeconds': 3600
+                    }]
                 }
             )
+            logger.info(f"CORS del bucket '{self.bucket_name}' configurado para {', '.join(origins)}")
+        except ClientError as e:
+            logger.error(f"Error configurando CORS del bucket: {e}")
+
+    def upload_file(self, file, folder=None, user_id=None, upload_id=None):
+        """
+        Subir archivo a S3 en paralelo por partes, leyendo el stream una sola vez.
+        El tamaño real y el SHA-256 se calculan durante la transferencia; el
+        progreso se publica en upload_progress[upload_id] si se indica upload_id.
+        """
+        try:
+            unique_filename, s3_key = self.build_upload_key(file.filename, folder, user_id)
+            
+            # Subir archivo directamente desde el stream de la petición
+            reader = _HashingReader(getattr(file, 'stream', file))
+            progress = _UploadProgress(upload_id, total=getattr(file, 'content_length', None))
+            # Las partes se suben en hilos de s3transfer: aquí se mide la transferencia completa
+            with metrics.timed('s3_transfer'), tracer.span('s3.upload_fileobj', key=s3_key):
+                self.s3_client.upload_fileobj(
+                    reader,
+                    self.bucket_name,
+                    s3_key,
+                    ExtraArgs={
+                        'ContentType': file.content_type,
+                        'Metadata': {
+                            'original_filename': file.filename
+                        }
+                    },
+                    Callback=progress,
+                    Config=self.transfer_config
+                )
+            progress.finish(reader.size)
+            
+            # Solo un job que empiece después de terminar la subida incluye el archivo con
+            # seguridad (en multipart, LastModified es el inicio de la subida, no el final)
+            ingestion_since = datetime.now(timezone.utc).isoformat()
             
             # Generar URL del archivo
-            file_url = f"https://{self.bucket_name}.s3.{Config.AWS_REGION}.amazonaws.com/{s3_key}"
+            file_url = self.get_public_url(s3_key)
             
-            print("Archivo subido - La Lambda sincronizará automáticamente la KB")
-            time.sleep(2)
+            # La Lambda sincronizará la KB; el estado se sigue en segundo plano
             return {
                 'success': True,
+                'ingestion': {'status': 'PENDING', 'since': ingestion_since},
                 's3_key': s3_key,
                 'file_url': file_url,
                 'filename': unique_filename,
                 'original_filename': file.filename,
-                'file_size': file.content_length
+                'file_size': reader.size,
+                'checksum': reader.checksum
             }
             
         except NoCredentialsError:
@@ -104,9 +269,9 @@ class S3Service:
         """Eliminar archivo de S3"""
         try:
             self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
-            print("Archivo eliminado - La Lambda sincronizará automáticamente la KB")
-            time.sleep(2)
-            return {'success': True}
+            ingestion_since = datetime.now(timezone.utc).isoformat()
+            # La Lambda sincronizará la KB; el estado se sigue en segundo plano
+            return {'success': True, 'ingestion': {'status': 'PENDING', 'since': ingestion_since}}
         except ClientError as e:
             return {'success': False, 'error': f"Error eliminando archivo: {e}"}
 
@@ -144,26 +309,119 @@ class S3Service:
         except ClientError as e:
             return None
 
+    def _cached_kb_call(self, key, ttl, fn):
+        """
+        Resultado cacheado de una consulta a la KB. Las peticiones concurrentes
+        con la misma clave comparten una única llamada; solo se cachean los éxitos.
+        """
+        result = kb_status_cache.get(key)
+        if result is not None:
+            return result
+
+        def load():
+            result = fn()
+            if result.get('success'):
+                kb_status_cache.set(key, result, ttl=ttl)
+            return result
+
+        return kb_status_calls.do(key, load)
+
+    def list_data_sources(self):
+        """Data sources de la KB (respuesta de list_data_sources cacheada)"""
+        if not self.knowledge_base_id:
+            return {'success': False, 'error': 'Knowledge Base ID no configurado'}
+
+        def load():
+            try:
+                response = self.bedrock_agent_client.list_data_sources(
+                    knowledgeBaseId=self.knowledge_base_id
+                )
+                data_sources = response.get('dataSourceSummaries', [])
+                logger.debug("Data sources encontrados: %d", len(data_sources))
+                return {'success': True, 'data_sources': data_sources}
+            except Exception as ds_error:
+                logger.error(f"Error obteniendo data sources: {ds_error}")
+                return {'success': False, 'error': f"No se pudieron obtener los data sources: {str(ds_error)}"}
+
+        return self._cached_kb_call(
+            ('data_sources', self.knowledge_base_id), Config.KB_DATA_SOURCES_CACHE_TTL, load
+        )
+
+    def _list_data_source_jobs(self, data_source, max_results):
+        """Jobs de ingestión de un data source (lista vacía si falla)"""
+        data_source_id = data_source.get('dataSourceId')
+        data_source_name = data_source.get('name', 'N/A')
+        if not data_source_id:
+            logger.debug("Data source sin ID, saltando...")
+            return []
+
+        try:
+            jobs_response = self.bedrock_agent_client.list_ingestion_jobs(
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=data_source_id,
+                maxResults=max_results  # Obtenemos varios para encontrar el más reciente
+            )
+        except Exception as ds_error:
+            logger.warning(f"Error obteniendo jobs para {data_source_name}: {ds_error}")
+            return []
+
+        jobs = []
+        for job in jobs_response.get('ingestionJobSummaries', []):
+            started_at = job.get('startedAt')
+            jobs.append({
+                'job_id': job.get('ingestionJobId', 'N/A'),
+                'status': job.get('status', 'UNKNOWN'),
+                'data_source_id': data_source_id,
+                'data_source_name': data_source_name,
+                'started_at': started_at,
+                'last_modified_at': job.get('lastModifiedAt', 'N/A'),
+                'started_at_iso': started_at.isoformat() if started_at else 'N/A'
+            })
+        return jobs
+
+    def list_recent_ingestion_jobs(self, max_results=10):
+        """
+        Obtener los jobs de ingestión recientes de todos los data sources de la KB,
+        consultando los data sources en paralelo. El resultado se cachea
+        KB_STATUS_CACHE_TTL segundos. Las fechas se devuelven como datetime.
+        """
+        if not self.knowledge_base_id:
+            return {'success': False, 'error': 'Knowledge Base ID no configurado'}
+
+        def load():
+            data_sources_result = self.list_data_sources()
+            if not data_sources_result['success']:
+                return data_sources_result
+            data_sources = data_sources_result['data_sources']
+
+            jobs = []
+            if data_sources:
+                workers = min(len(data_sources), Config.KB_STATUS_MAX_WORKERS)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for source_jobs in executor.map(
+                        tracer.wrap(lambda ds: self._list_data_source_jobs(ds, max_results)), data_sources
+                    ):
+                        jobs.extend(source_jobs)
+
+            return {'success': True, 'data_sources': data_sources, 'jobs': jobs}
+
+        return self._cached_kb_call(
+            ('ingestion_jobs', self.knowledge_base_id, max_results), Config.KB_STATUS_CACHE_TTL, load
+        )
+
     def get_sync_status(self):
         """Obtener solo el último estado de sincronización - Versión corregida"""
         try:
             if not self.knowledge_base_id:
                 return {'success': False, 'error': 'Knowledge Base ID no configurado'}
             
-            print(f"🔍 Consultando último sync status para KB: {self.knowledge_base_id}")
+            logger.debug("Consultando último sync status para KB: %s", self.knowledge_base_id)
             
-            # Primero obtener todos los data sources
-            try:
-                data_sources_response = self.bedrock_agent_client.list_data_sources(
-                    knowledgeBaseId=self.knowledge_base_id
-                )
-                data_sources = data_sources_response.get('dataSourceSummaries', [])
-                print(f"Data sources encontrados: {len(data_sources)}")
-                
-            except Exception as ds_error:
-                print(f"Error obteniendo data sources: {ds_error}")
-                return {'success': False, 'error': f"No se pudieron obtener los data sources: {str(ds_error)}"}
+            jobs_result = self.list_recent_ingestion_jobs()
+            if not jobs_result['success']:
+                return jobs_result
             
+            data_sources = jobs_result['data_sources']
             if not data_sources:
                 return {
                     'success': True,
@@ -174,70 +432,31 @@ class S3Service:
             
             latest_job = None
             
-            # Para cada data source, obtener sus jobs de ingestión
-            for data_source in data_sources:
-                data_source_id = data_source.get('dataSourceId')
-                data_source_name = data_source.get('name', 'N/A')
-                data_source_status = data_source.get('status', 'UNKNOWN')
-                
-                print(f"🔍 Revisando data source: {data_source_name} (Status: {data_source_status})")
-                
-                if not data_source_id:
-                    print(f"Data source sin ID, saltando...")
-                    continue
+            for job_info in jobs_result['jobs']:
+                started_at = job_info['started_at']
                 
-                try:
-                    # Obtener jobs de ingestión para este data source
-                    jobs_response = self.bedrock_agent_client.list_ingestion_jobs(
-                        knowledgeBaseId=self.knowledge_base_id,
-                        dataSourceId=data_source_id,
-                        maxResults=10  # Obtenemos varios para encontrar el más reciente
-                    )
-                    
-                    jobs = jobs_response.get('ingestionJobSummaries', [])
-                    print(f"Jobs encontrados para {data_source_name}: {len(jobs)}")
-                    
-                    for job in jobs:
-                        job_status = job.get('status', 'UNKNOWN')
-                        started_at = job.get('startedAt')
-                        
-                        print(f"  - Job {job.get('ingestionJobId', 'N/A')}: {job_status}")
-                        
-                        # Solo considerar jobs completados o en progreso
-                        if job_status in ['COMPLETE', 'IN_PROGRESS', 'STARTING']:
-                            job_info = {
-                                'job_id': job.get('ingestionJobId', 'N/A'),
-                                'status': job_status,
-                                'data_source_id': data_source_id,
-                                'data_source_name': data_source_name,
-                                'started_at': started_at,
-                                'last_modified_at': job.get('lastModifiedAt', 'N/A'),
-                                'started_at_iso': started_at.isoformat() if started_at else 'N/A'
-                            }
-                            
-                            # Comparar objetos datetime, no strings
-                            if latest_job is None:
-                                latest_job = job_info
-                            elif started_at and latest_job.get('started_at'):
-                                # Ambos son objetos datetime, podemos comparar
-                                if started_at > latest_job['started_at']:
-                                    latest_job = job_info
-                            # Si latest_job no tiene started_at válido, usar el nuevo
-                            elif started_at and not latest_job.get('started_at'):
-                                latest_job = job_info
-                            
-                except Exception as ds_error:
-                    print(f"⚠️ Error obteniendo jobs para {data_source_name}: {ds_error}")
-                    continue
+                # Solo considerar jobs completados o en progreso
+                if job_info['status'] in ['COMPLETE', 'IN_PROGRESS', 'STARTING']:
+                    # Comparar objetos datetime, no strings
+                    if latest_job is None:
+                        latest_job = job_info
+                    elif started_at and latest_job.get('started_at'):
+                        # Ambos son objetos datetime, podemos comparar
+                        if started_at > latest_job['started_at']:
+                            latest_job = job_info
+                    # Si latest_job no tiene started_at válido, usar el nuevo
+                    elif started_at and not latest_job.get('started_at'):
+                        latest_job = job_info
             
             if latest_job:
+                latest_job = dict(latest_job)
                 # Formatear las fechas para la respuesta final
                 if latest_job.get('started_at'):
                     latest_job['started_at'] = latest_job['started_at'].isoformat()
                 if latest_job.get('last_modified_at') and hasattr(latest_job['last_modified_at'], 'isoformat'):
                     latest_job['last_modified_at'] = latest_job['last_modified_at'].isoformat()
                 
-                print(f"Último job encontrado: {latest_job['job_id']} - {latest_job['status']}")
+                logger.debug("Último job encontrado: %s - %s", latest_job['job_id'], latest_job['status'])
                 return {
                     'success': True,
                     'last_sync_job': latest_job,
@@ -245,7 +464,7 @@ class S3Service:
                     'message': 'Última sincronización encontrada'
                 }
             else:
-                print("No se encontraron jobs de sincronización recientes")
+                logger.debug("No se encontraron jobs de sincronización recientes")
                 return {
                     'success': True,
                     'last_sync_job': None,
@@ -255,23 +474,20 @@ class S3Service:
                 
         except Exception as e:
             error_msg = f"Error obteniendo último estado de sync: {str(e)}"
-            print(f" {error_msg}")
+            logger.error(error_msg)
             return {'success': False, 'error': error_msg}
     
     
     def get_data_source_info(self):
         """Obtener información del data source - Versión segura"""
         try:
-            if not self.knowledge_base_id:
-                return {'success': False, 'error': 'Knowledge Base ID no configurado'}
-            
-            response = self.bedrock_agent_client.list_data_sources(
-                knowledgeBaseId=self.knowledge_base_id
-            )
+            data_sources_result = self.list_data_sources()
+            if not data_sources_result['success']:
+                return data_sources_result
             
             data_sources = []
             
-            for data_source in response['dataSourceSummaries']:
+            for data_source in data_sources_result['data_sources']:
                 # Información básica con valores por defecto seguros
                 ds_info = {
                     'data_source_id': data_source.get('dataSourceId', 'N/A'),
@@ -0,0 +1,139 @@
+import json
+import logging
+import queue
+import threading
+
+from config import Config
+from app.services.response_cache import response_cache, completed_job_tag
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATES = ('STARTING', 'IN_PROGRESS')
+
+
+class SyncStatusWatcher:
+    """
+    Vigilante único por proceso del estado de sincronización de la Knowledge Base.
+
+    Un hilo en segundo plano consulta los jobs de ingestión solo mientras haya
+    páginas suscritas y publica el estado cuando cambia algún job. Con jobs en
+    STARTING/IN_PROGRESS consulta cada SYNC_WATCH_ACTIVE_INTERVAL segundos; si no,
+    el intervalo se duplica hasta SYNC_WATCH_IDLE_MAX_INTERVAL. Las llamadas a AWS
+    no dependen del número de administradores conectados.
+    """
+
+    def __init__(self, s3_service=None, active_interval=None, idle_max_interval=None):
+        self._s3_service = s3_service
+        self.active_interval = active_interval or Config.SYNC_WATCH_ACTIVE_INTERVAL
+        self.idle_max_interval = idle_max_interval or Config.SYNC_WATCH_IDLE_MAX_INTERVAL
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._signature = None
+        self.snapshot = None
+        self.version = 0
+        self.polls = 0
+        self.interval = self.active_interval
+
+    @property
+    def s3_service(self):
+        if self._s3_service is None:
+            from app.services.s3_service import S3Service
+            self._s3_service = S3Service()
+        return self._s3_service
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='sync-status-watcher', daemon=True)
+            self._thread.start()
+
+    def subscribe(self):
+        """Registrar una página conectada; devuelve la cola donde llegan los cambios"""
+        subscriber = queue.Queue(maxsize=10)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        self._ensure_started()
+        self.wake()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def wake(self):
+        """Consultar de inmediato (p. ej. al conectarse alguien o tras una subida)"""
+        self.interval = self.active_interval
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                has_subscribers = bool(self._subscribers)
+            if not has_subscribers:
+                # Nadie mirando: no se hacen llamadas a AWS
+                self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error vigilando estado de sincronización: {e}")
+            self._wakeup.wait(self.interval)
+
+    def poll(self):
+        """Consultar los jobs una vez y publicar el estado si ha cambiado"""
+        self.polls += 1
+        jobs_result = self.s3_service.list_recent_ingestion_jobs()
+        if not jobs_result['success']:
+            self._publish(jobs_result, signature=('error', jobs_result.get('error')))
+            return
+
+        jobs = jobs_result['jobs']
+        # Ya con los jobs a mano, la caché de respuestas se entera sin esperar a su refresco
+        response_cache.update_tag(completed_job_tag(jobs))
+        if any(job['status'] in ACTIVE_JOB_STATES for job in jobs):
+            self.interval = self.active_interval
+        else:
+            self.interval = min(self.interval * 2, self.idle_max_interval)
+
+        signature = tuple(sorted((job['job_id'], job['status']) for job in jobs))
+        if signature != self._signature:
+            self._publish(self.s3_service.get_sync_status(), signature)
+
+    def _publish(self, status, signature):
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self.version += 1
+        self.snapshot = dict(status, version=self.version)
+        message = json.dumps(self.snapshot, default=str)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass  # Cliente lento: recibirá el siguiente cambio
+
+    def current(self):
+        """Último estado publicado (JSON) o None si aún no se ha consultado"""
+        if self.snapshot is None:
+            return None
+        return json.dumps(self.snapshot, default=str)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {
+            'subscribers': subscribers,
+            'version': self.version,
+            'polls': self.polls,
+            'interval': self.interval
+        }
+
+
+sync_watcher = SyncStatusWatcher()
@@ -0,0 +1,346 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from config import Config
+from app.services.logging_config import async_handler
+
+# Límite de spans guardados por traza (las trazas muy largas se truncan)
+MAX_SPANS_PER_TRACE = 512
+
+_current = contextvars.ContextVar('current_span', default=None)
+_INHERIT = object()
+
+logger = logging.getLogger(__name__)
+
+
+def _new_id(bits):
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+class _Trace:
+    """Spans de una traza en curso; la decisión de muestreo se toma al cerrar la raíz"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or _new_id(128)
+        self.head_sampled = random.random() < Config.TRACE_SAMPLE_RATE
+        self.spans = []
+        self.dropped_spans = 0
+        self.closed = False
+        self.kept = None
+        self.lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, tracer, name, trace, parent_id=None, attributes=None, links=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.links = list({link.span_id: link for link in (links or [])
+                           if link is not None and link.recording}.values())
+        self.events = []
+        self.error = None
+        self.start_time = time.time()
+        self._started_at = time.perf_counter()
+        self.duration = None
+
+    recording = True
+
+    @property
+    def trace_id(self):
+        return self.trace.trace_id
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append({
+            'name': name,
+            'offset_ms': round((time.perf_counter() - self._started_at) * 1000, 3),
+            'attributes': attributes
+        })
+
+    def record_error(self, error):
+        self.error = error if isinstance(error, str) else f'{type(error).__name__}: {error}'
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started_at
+            self.tracer._on_end(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': datetime.fromtimestamp(self.start_time, timezone.utc).isoformat(),
+            'duration_ms': round(self.duration * 1000, 3),
+            'status': 'error' if self.error else 'ok',
+            'error': self.error,
+            'attributes': self.attributes,
+            'events': self.events,
+            'links': [{'trace_id': link.trace_id, 'span_id': link.span_id} for link in self.links]
+        }
+
+
+class _NoopSpan:
+    """Span devuelto con el trazado desactivado: todas las operaciones son no-op"""
+
+    recording = False
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Trazado ligero por spans. Cada petición abre un span raíz; las llamadas a
+    AWS (hooks de botocore), el stream de Bedrock y el trabajo en segundo plano
+    cuelgan de él. Al cerrar la raíz se decide si la traza se guarda: siempre
+    si es lenta (>= TRACE_SLOW_SECONDS) o tiene errores, y si no con
+    probabilidad TRACE_SAMPLE_RATE. Las trazas guardadas se escriben en
+    TRACE_FILE (JSONL, un span por línea, con rotación por tamaño).
+    """
+
+    def __init__(self):
+        self.enabled = Config.TRACE_ENABLED
+        self._exporter = None
+        self._lock = threading.Lock()
+        self.traces = 0
+        self.kept = 0
+        self.spans_exported = 0
+
+    # --- Contexto ---
+
+    def current(self):
+        """Span activo en este contexto (para propagarlo a otro hilo), o None"""
+        return _current.get()
+
+    def start_span(self, name, parent=_INHERIT, attributes=None, links=None):
+        """Crear un span sin activarlo; hay que cerrarlo con end()"""
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is _INHERIT:
+            parent = _current.get()
+        if parent is not None and parent.recording:
+            return Span(self, name, parent.trace, parent.span_id, attributes, links)
+        return Span(self, name, _Trace(), None, attributes, links)
+
+    @contextmanager
+    def span(self, name, parent=_INHERIT, links=None, **attributes):
+        """Span activo durante el bloque; registra la excepción si la hay"""
+        span = self.start_span(name, parent, attributes, links)
+        if not span.recording:
+            yield span
+            return
+        token = _current.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    @contextmanager
+    def use(self, span):
+        """Activar un span ya creado durante el bloque (sin cerrarlo)"""
+        token = _current.set(span if span.recording else _current.get())
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+
+    def wrap(self, fn):
+        """Ejecutar fn en otro hilo (p. ej. un ThreadPoolExecutor) bajo el span actual"""
+        parent = _current.get()
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            token = _current.set(parent)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current.reset(token)
+        return run
+
+    # --- Muestreo y exportación ---
+
+    def _on_end(self, span):
+        trace = span.trace
+        with trace.lock:
+            if trace.closed:
+                # Span tardío (trabajo en segundo plano tras cerrar la raíz)
+                export = [span] if trace.kept or span.error else []
+            else:
+                if len(trace.spans) < MAX_SPANS_PER_TRACE:
+                    trace.spans.append(span)
+                else:
+                    trace.dropped_spans += 1
+                if span.parent_id is not None:
+                    return
+                trace.closed = True
+                trace.kept = (
+                    trace.head_sampled
+                    or span.duration >= Config.TRACE_SLOW_SECONDS
+                    or any(s.error for s in trace.spans)
+                    or any(link.trace.kept for link in span.links)
+                )
+                if trace.dropped_spans:
+                    span.set_attribute('dropped_spans', trace.dropped_spans)
+                export = trace.spans if trace.kept else []
+                trace.spans = []
+        if span.parent_id is None:
+            self.traces += 1
+            if export:
+                self.kept += 1
+        if export:
+            self._export(export)
+
+    def _get_exporter(self):
+        if self._exporter is None:
+            with self._lock:
+                if self._exporter is None:
+                    directory = os.path.dirname(Config.TRACE_FILE)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    handler = RotatingFileHandler(Config.TRACE_FILE, maxBytes=Config.TRACE_MAX_BYTES,
+                                                  backupCount=Config.TRACE_BACKUP_COUNT, encoding='utf-8')
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    exporter = logging.getLogger('bmc.traces')
+                    exporter.setLevel(logging.INFO)
+                    exporter.propagate = False
+                    # La escritura al fichero ocurre en el hilo del listener, no en la petición
+                    exporter.addHandler(async_handler(handler))
+                    self._exporter = exporter
+        return self._exporter
+
+    def _export(self, spans):
+        try:
+            exporter = self._get_exporter()
+            exporter.info('\n'.join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) for s in spans))
+            self.spans_exported += len(spans)
+        except Exception as e:
+            logger.error(f"Error exportando trazas: {e}")
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'traces': self.traces,
+            'kept': self.kept,
+            'spans_exported': self.spans_exported,
+            'sample_rate': Config.TRACE_SAMPLE_RATE,
+            'slow_seconds': Config.TRACE_SLOW_SECONDS,
+            'file': Config.TRACE_FILE
+        }
+
+    # --- Eventos de botocore ---
+
+    def instrument_session(self, session):
+        """Un span hijo por operación de AWS hecha dentro de una traza"""
+        session.events.register('before-call', self._before_call, unique_id='bmc-tracing-before')
+        session.events.register('after-call', self._after_call, unique_id='bmc-tracing-after')
+        session.events.register('after-call-error', self._after_call_error, unique_id='bmc-tracing-error')
+
+    def _before_call(self, model, params, context, **kwargs):
+        parent = _current.get()
+        if parent is None or not self.enabled:
+            return
+        context['trace_span'] = self.start_span(
+            f'{model.service_model.service_name}.{model.name}', parent,
+            {'aws.service': model.service_model.service_name, 'aws.operation': model.name}
+        )
+
+    def _after_call(self, http_response, parsed, context, **kwargs):
+        span = context.pop('trace_span', None)
+        if span is None:
+            return
+        metadata = parsed.get('ResponseMetadata', {}) if isinstance(parsed, dict) else {}
+        span.set_attribute('http.status_code', http_response.status_code)
+        span.set_attribute('aws.request_id', metadata.get('RequestId'))
+        span.set_attribute('aws.retries', metadata.get('RetryAttempts', 0))
+        if http_response.status_code >= 300:
+            span.record_error(parsed.get('Error', {}).get('Code', 'HTTP error'))
+        span.end()
+
+    def _after_call_error(self, exception, context, **kwargs):
+        span = context.pop('trace_span', None)
+        if span is not None:
+            span.record_error(exception)
+            span.end()
+
+    # --- Peticiones de Flask ---
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        from flask import g, request
+
+        @app.before_request
+        def _start_request_span():
+            rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            span = self.start_span(f'{request.method} {rule}', parent=None, attributes={
+                'http.method': request.method,
+                'http.route': rule,
+                'http.path': request.path
+            })
+            g.trace_span = span
+            g.trace_token = _current.set(span)
+
+        @app.after_request
+        def _tag_request_span(response):
+            span = g.get('trace_span')
+            if span is not None:
+                span.set_attribute('http.status_code', response.status_code)
+                if response.status_code >= 500:
+                    span.record_error(f'HTTP {response.status_code}')
+                # Si se cargó el usuario en la petición, asociarlo a la traza
+                user = g.get('_login_user')
+                if user is not None and getattr(user, 'is_authenticated', False):
+                    span.set_attribute('user.id', user.id)
+                response.headers['X-Trace-Id'] = span.trace_id
+            return response
+
+        @app.teardown_request
+        def _end_request_span(exc):
+            span = g.pop('trace_span', None)
+            token = g.pop('trace_token', None)
+            if span is None:
+                return
+            if exc is not None:
+                span.record_error(exc)
+            try:
+                _current.reset(token)
+            except ValueError:
+                _current.set(None)
+            span.end()
+
+
+tracer = Tracer()
@@ -0,0 +1,6 @@
+"""
+Benchmarks sin conexión: la aplicación completa contra sustitutos en memoria
+de DynamoDB, S3 y Bedrock (ver fakes.py). Se ejecutan con:
+
+    python -m benchmarks.run --help
+"""
@@ -0,0 +1,612 @@
+"""
+Sustitutos en memoria de DynamoDB, S3, bedrock-agent y bedrock-agent-runtime.
+
+Implementan solo las operaciones (y las expresiones) que usa la aplicación,
+con la misma forma de respuesta y los mismos códigos de error que boto3, para
+poder ejecutar la aplicación completa sin AWS. Se instalan con install().
+"""
+
+import copy
+import hashlib
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+
+# boto3.resource('dynamodb') importa este submódulo; los modelos lo usan como boto3.dynamodb.conditions
+import boto3.dynamodb.conditions  # noqa: F401
+from botocore.exceptions import ClientError
+
+
+def _error(code, operation, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message or code}}, operation)
+
+
+def _to_dynamo(value):
+    """Los números se guardan como Decimal, igual que devuelve el recurso de boto3"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: _to_dynamo(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_dynamo(v) for v in value]
+    return value
+
+
+# DynamoDB
+
+class _FakeTableData:
+    def __init__(self, name, key_schema, indexes):
+        self.name = name
+        self.hash_key, self.range_key = self._keys(key_schema)
+        self.indexes = {
+            index['IndexName']: self._keys(index['KeySchema']) for index in indexes
+        }
+        self.items = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _keys(key_schema):
+        hash_key = next(k['AttributeName'] for k in key_schema if k['KeyType'] == 'HASH')
+        range_key = next((k['AttributeName'] for k in key_schema if k['KeyType'] == 'RANGE'), None)
+        return hash_key, range_key
+
+    def key_of(self, item):
+        if self.range_key:
+            return (item[self.hash_key], item[self.range_key])
+        return (item[self.hash_key],)
+
+    def key_dict(self, item):
+        key = {self.hash_key: item[self.hash_key]}
+        if self.range_key:
+            key[self.range_key] = item[self.range_key]
+        return key
+
+
+class _Condition:
+    """
+    Evaluación de ConditionExpression: attribute_exists / attribute_not_exists,
+    comparaciones (= <> < <= > >=) entre atributos y valores, AND, OR y paréntesis.
+    """
+
+    TOKEN = re.compile(r'\s*(attribute_not_exists|attribute_exists|AND|OR|<>|<=|>=|[()=<>]|[#:]?\w+)')
+
+    @classmethod
+    def check(cls, expression, names, item, operation, values=None):
+        if not expression:
+            return
+        tokens = cls.TOKEN.findall(expression)
+        position, result = cls._or(tokens, 0, names, values or {}, item or {})
+        if position != len(tokens):
+            raise NotImplementedError(f'Expresión no soportada en el sustituto: {expression}')
+        if not result:
+            raise _error('ConditionalCheckFailedException', operation,
+                         'The conditional request failed')
+
+    @classmethod
+    def _or(cls, tokens, position, names, values, item):
+        position, result = cls._and(tokens, position, names, values, item)
+        while position < len(tokens) and tokens[position] == 'OR':
+            position, other = cls._and(tokens, position + 1, names, values, item)
+            result = result or other
+        return position, result
+
+    @classmethod
+    def _and(cls, tokens, position, names, values, item):
+        position, result = cls._term(tokens, position, names, values, item)
+        while position < len(tokens) and tokens[position] == 'AND':
+            position, other = cls._term(tokens, position + 1, names, values, item)
+            result = result and other
+        return position, result
+
+    @classmethod
+    def _term(cls, tokens, position, names, values, item):
+        token = tokens[position]
+        if token == '(':
+            position, result = cls._or(tokens, position + 1, names, values, item)
+            return position + 1, result
+        if token in ('attribute_exists', 'attribute_not_exists'):
+            name = names.get(tokens[position + 2], tokens[position + 2])
+            return position + 4, (name in item) == (token == 'attribute_exists')
+        left = cls._operand(token, names, values, item)
+        operator = tokens[position + 1]
+        right = cls._operand(tokens[position + 2], names, values, item)
+        if left is None or right is None:
+            return position + 3, operator == '<>' and (left is None) != (right is None)
+        return position + 3, {
+            '=': left == right, '<>': left != right, '<': left < right,
+            '<=': left <= right, '>': left > right, '>=': left >= right
+        }[operator]
+
+    @staticmethod
+    def _operand(token, names, values, item):
+        if token.startswith(':'):
+            return values[token]
+        return item.get(names.get(token, token))
+
+
+def _key_condition_matches(condition, item):
+    """Evaluar un KeyConditionExpression de boto3.dynamodb.conditions"""
+    expression = condition.get_expression()
+    operator = expression['operator']
+    values = expression['values']
+    if operator == 'AND':
+        return all(_key_condition_matches(value, item) for value in values)
+    actual = item.get(values[0].name)
+    if actual is None:
+        return False
+    if operator == '=':
+        return actual == values[1]
+    if operator == '<':
+        return actual < values[1]
+    if operator == '<=':
+        return actual <= values[1]
+    if operator == '>':
+        return actual > values[1]
+    if operator == '>=':
+        return actual >= values[1]
+    if operator == 'begins_with':
+        return actual.startswith(values[1])
+    if operator == 'BETWEEN':
+        return values[1] <= actual <= values[2]
+    raise NotImplementedError(f'Operador no soportado en el sustituto: {operator}')
+
+
+def _key_condition_attributes(condition):
+    expression = condition.get_expression()
+    if expression['operator'] == 'AND':
+        names = set()
+        for value in expression['values']:
+            names |= _key_condition_attributes(value)
+        return names
+    return {expression['values'][0].name}
+
+
+def _project(item, projection, names):
+    if not projection:
+        return item
+    attributes = [names.get(a.strip(), a.strip()) for a in projection.split(',')]
+    return {a: item[a] for a in attributes if a in item}
+
+
+class FakeTable:
+    """Equivalente en memoria de dynamodb.Table (interfaz del recurso de boto3)"""
+
+    def __init__(self, dynamodb, name):
+        self._dynamodb = dynamodb
+        self.name = name
+
+    @property
+    def _data(self):
+        data = self._dynamodb._tables.get(self.name)
+        if data is None:
+            raise _error('ResourceNotFoundException', 'DescribeTable',
+                         f'Requested resource not found: Table: {self.name} not found')
+        return data
+
+    @property
+    def table_status(self):
+        self._data
+        return 'ACTIVE'
+
+    def wait_until_exists(self):
+        self._data
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        data = self._data
+        item = _to_dynamo(copy.deepcopy(Item))
+        key = data.key_of(item)
+        with data.lock:
+            old = data.items.get(key)
+            _Condition.check(ConditionExpression, ExpressionAttributeNames or {}, old, 'PutItem',
+                             _to_dynamo(ExpressionAttributeValues or {}))
+            data.items[key] = item
+        response = {}
+        if ReturnValues == 'ALL_OLD' and old is not None:
+            response['Attributes'] = copy.deepcopy(old)
+        return response
+
+    def get_item(self, Key, **kwargs):
+        data = self._data
+        with data.lock:
+            item = data.items.get(data.key_of(Key))
+        return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None, **kwargs):
+        data = self._data
+        with data.lock:
+            old = data.items.get(data.key_of(Key))
+            _Condition.check(ConditionExpression, ExpressionAttributeNames or {}, old, 'DeleteItem',
+                             _to_dynamo(ExpressionAttributeValues or {}))
+            data.items.pop(data.key_of(Key), None)
+        response = {}
+        if ReturnValues == 'ALL_OLD' and old is not None:
+            response['Attributes'] = old
+        return response
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ReturnValues=None, **kwargs):
+        data = self._data
+        names = ExpressionAttributeNames or {}
+        values = _to_dynamo(ExpressionAttributeValues or {})
+        with data.lock:
+            old = data.items.get(data.key_of(Key))
+            _Condition.check(ConditionExpression, names, old, 'UpdateItem', values)
+            item = copy.deepcopy(old) if old is not None else _to_dynamo(dict(Key))
+            updated = set()
+            for action, body in re.findall(r'(SET|ADD|REMOVE)\s+(.*?)(?=\s+(?:SET|ADD|REMOVE)\s|$)',
+                                           UpdateExpression):
+                for part in (p.strip() for p in body.split(',')):
+                    if action == 'SET':
+                        name, value = (s.strip() for s in part.split('='))
+                        name = names.get(name, name)
+                        item[name] = copy.deepcopy(values[value])
+                    elif action == 'ADD':
+                        name, value = part.split()
+                        name = names.get(name, name)
+                        item[name] = item.get(name, Decimal(0)) + values[value]
+                    else:
+                        name = names.get(part, part)
+                        item.pop(name, None)
+                    updated.add(name)
+            data.items[data.key_of(item)] = item
+        response = {}
+        if ReturnValues == 'ALL_NEW':
+            response['Attributes'] = copy.deepcopy(item)
+        elif ReturnValues == 'UPDATED_NEW':
+            response['Attributes'] = {k: copy.deepcopy(item[k]) for k in updated if k in item}
+        elif ReturnValues == 'ALL_OLD' and old is not None:
+            response['Attributes'] = old
+        return response
+
+    def _ordered(self, items, index_name=None):
+        data = self._data
+        primary = [data.hash_key] + ([data.range_key] if data.range_key else [])
+        index_range = data.indexes[index_name][1] if index_name else data.range_key
+
+        def sort_key(item):
+            return ((item.get(index_range) or '') if index_range else '',
+                    tuple(str(item.get(k)) for k in primary))
+        return sorted(items, key=sort_key), sort_key
+
+    def _page(self, items, sort_key, limit, start_key, forward, index_name, names, projection):
+        data = self._data
+        if start_key:
+            start = sort_key(start_key)
+            items = [i for i in items if (sort_key(i) > start if forward else sort_key(i) < start)]
+        response = {}
+        if limit is not None and len(items) > limit:
+            last = items[limit - 1]
+            key = data.key_dict(last)
+            if index_name:
+                for attribute in data.indexes[index_name]:
+                    if attribute:
+                        key[attribute] = last[attribute]
+            response['LastEvaluatedKey'] = key
+            items = items[:limit]
+        response['Items'] = [copy.deepcopy(_project(i, projection, names)) for i in items]
+        response['Count'] = len(items)
+        return response
+
+    def query(self, KeyConditionExpression, IndexName=None, Limit=None, ScanIndexForward=True,
+              ExclusiveStartKey=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+              **kwargs):
+        data = self._data
+        with data.lock:
+            items = [i for i in data.items.values() if _key_condition_matches(KeyConditionExpression, i)]
+        items, sort_key = self._ordered(items, IndexName)
+        if not ScanIndexForward:
+            items.reverse()
+        return self._page(items, sort_key, Limit, ExclusiveStartKey, ScanIndexForward,
+                          IndexName, ExpressionAttributeNames or {}, ProjectionExpression)
+
+    def scan(self, Segment=None, TotalSegments=None, Limit=None, ExclusiveStartKey=None,
+             ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        data = self._data
+        with data.lock:
+            items = list(data.items.values())
+        if TotalSegments:
+            items = [
+                i for i in items
+                if zlib.crc32(repr(data.key_of(i)).encode()) % TotalSegments == Segment
+            ]
+        items, sort_key = self._ordered(items)
+        return self._page(items, sort_key, Limit, ExclusiveStartKey, True,
+                          None, ExpressionAttributeNames or {}, ProjectionExpression)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return _FakeBatchWriter(self)
+
+
+class _FakeBatchWriter:
+    def __init__(self, table):
+        self._table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self._table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self._table.delete_item(Key=Key)
+
+
+class _FakeDynamoDBClient:
+    """Parte del cliente accesible como recurso.meta.client"""
+
+    def update_time_to_live(self, TableName, TimeToLiveSpecification):
+        return {'TimeToLiveSpecification': TimeToLiveSpecification}
+
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeDynamoDB:
+    """Equivalente en memoria de boto3.resource('dynamodb')"""
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.meta = _Meta(_FakeDynamoDBClient())
+
+    def create_table(self, TableName, KeySchema, GlobalSecondaryIndexes=None, **kwargs):
+        with self._lock:
+            if TableName in self._tables:
+                raise _error('ResourceInUseException', 'CreateTable', f'Table already exists: {TableName}')
+            self._tables[TableName] = _FakeTableData(TableName, KeySchema, GlobalSecondaryIndexes or [])
+        return FakeTable(self, TableName)
+
+    def Table(self, name):
+        return FakeTable(self, name)
+
+    def batch_write_item(self, RequestItems):
+        for table_name, requests in RequestItems.items():
+            table = self.Table(table_name)
+            for request in requests:
+                if 'PutRequest' in request:
+                    table.put_item(Item=request['PutRequest']['Item'])
+                else:
+                    table.delete_item(Key=request['DeleteRequest']['Key'])
+        return {'UnprocessedItems': {}}
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self.Table(table_name)
+            responses[table_name] = [
+                found['Item'] for found in (table.get_item(Key=key) for key in request['Keys'])
+                if 'Item' in found
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+
+# S3
+
+class FakeS3:
+    """Equivalente en memoria del cliente de S3 (solo metadatos y tamaño de los objetos)"""
+
+    def __init__(self, region='us-east-1'):
+        self.region = region
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, bucket, operation):
+        objects = self.buckets.get(bucket)
+        if objects is None:
+            raise _error('NoSuchBucket', operation, f'The specified bucket does not exist: {bucket}')
+        return objects
+
+    def head_bucket(self, Bucket):
+        if Bucket not in self.buckets:
+            raise _error('404', 'HeadBucket', 'Not Found')
+        return {}
+
+    def create_bucket(self, Bucket, **kwargs):
+        with self._lock:
+            self.buckets.setdefault(Bucket, {})
+        return {'Location': f'/{Bucket}'}
+
+    def put_bucket_cors(self, Bucket, CORSConfiguration):
+        self._bucket(Bucket, 'PutBucketCors')
+        return {}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        objects = self._bucket(Bucket, 'PutObject')
+        chunk_size = getattr(Config, 'multipart_chunksize', 8 * 1024 * 1024)
+        sha256 = hashlib.sha256()
+        size = 0
+        while True:
+            chunk = Fileobj.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            size += len(chunk)
+            if Callback:
+                Callback(len(chunk))
+        extra = ExtraArgs or {}
+        with self._lock:
+            objects[Key] = {
+                'ContentLength': size,
+                'ContentType': extra.get('ContentType', 'binary/octet-stream'),
+                'Metadata': extra.get('Metadata', {}),
+                'ETag': f'"{sha256.hexdigest()[:32]}"',
+                'LastModified': datetime.now(timezone.utc)
+            }
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        objects = self._bucket(Bucket, 'PutObject')
+        body = Body.encode() if isinstance(Body, str) else Body
+        with self._lock:
+            objects[Key] = {
+                'ContentLength': len(body),
+                'ContentType': kwargs.get('ContentType', 'binary/octet-stream'),
+                'Metadata': kwargs.get('Metadata', {}),
+                'ETag': f'"{hashlib.md5(body).hexdigest()}"',
+                'LastModified': datetime.now(timezone.utc)
+            }
+        return {'ETag': objects[Key]['ETag']}
+
+    def head_object(self, Bucket, Key):
+        obj = self._bucket(Bucket, 'HeadObject').get(Key)
+        if obj is None:
+            raise _error('404', 'HeadObject', 'Not Found')
+        return dict(obj)
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self._bucket(Bucket, 'DeleteObject').pop(Key, None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        objects = self._bucket(Bucket, 'ListObjectsV2')
+        contents = [
+            {'Key': key, 'Size': obj['ContentLength'], 'LastModified': obj['LastModified'], 'ETag': obj['ETag']}
+            for key, obj in sorted(objects.items()) if key.startswith(Prefix)
+        ]
+        return {'Contents': contents, 'KeyCount': len(contents)} if contents else {'KeyCount': 0}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        return f"https://{params.get('Bucket')}.s3.{self.region}.amazonaws.com/{params.get('Key')}?X-Amz-Expires={ExpiresIn}"
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        return {
+            'url': f'https://{Bucket}.s3.{self.region}.amazonaws.com/',
+            'fields': dict(Fields or {}, key=Key, policy='fake', **{'x-amz-signature': 'fake'})
+        }
+
+
+# Bedrock
+
+class FakeBedrockAgent:
+    """Plano de control de Bedrock Agents: agente, alias, data sources y jobs de ingestión"""
+
+    def __init__(self, data_sources=1, latency=0.0):
+        self.latency = latency
+        started_at = datetime.now(timezone.utc)
+        self.data_sources = [
+            {'dataSourceId': f'DS{index:08d}', 'name': f'fake-data-source-{index}', 'status': 'AVAILABLE'}
+            for index in range(data_sources)
+        ]
+        self.jobs = {
+            ds['dataSourceId']: [{
+                'ingestionJobId': uuid.uuid4().hex[:10].upper(),
+                'status': 'COMPLETE',
+                'startedAt': started_at,
+                'updatedAt': started_at
+            }]
+            for ds in self.data_sources
+        }
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_agent(self, agentId):
+        self._wait()
+        return {'agent': {'agentId': agentId, 'agentName': 'fake-agent', 'agentStatus': 'PREPARED'}}
+
+    def get_agent_alias(self, agentId, agentAliasId):
+        self._wait()
+        return {'agentAlias': {'agentAliasId': agentAliasId, 'agentAliasName': 'fake-alias'}}
+
+    def list_data_sources(self, knowledgeBaseId, **kwargs):
+        self._wait()
+        return {'dataSourceSummaries': copy.deepcopy(self.data_sources)}
+
+    def list_ingestion_jobs(self, knowledgeBaseId, dataSourceId, maxResults=10, **kwargs):
+        self._wait()
+        jobs = self.jobs.get(dataSourceId, [])
+        return {'ingestionJobSummaries': [dict(job, lastModifiedAt=job['updatedAt']) for job in jobs[:maxResults]]}
+
+
+class FakeBedrockAgentRuntime:
+    """
+    invoke_agent en streaming con latencias configurables:
+    ttft (segundos hasta el primer fragmento), token_rate (fragmentos por
+    segundo), tokens (fragmentos por respuesta), error_rate (fracción de
+    invocaciones que fallan con ThrottlingException) y citation_rate.
+    """
+
+    WORDS = ('el', 'proceso', 'disciplinario', 'según', 'la', 'documentación', 'establece', 'que')
+
+    def __init__(self, ttft=0.5, token_rate=50.0, tokens=40, error_rate=0.0, citation_rate=0.5, seed=None):
+        self.ttft = ttft
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.citation_rate = citation_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.invocations = 0
+        self.errors = 0
+
+    def _roll(self):
+        with self._lock:
+            return self._random.random()
+
+    def invoke_agent(self, agentId, agentAliasId, sessionId, inputText, **kwargs):
+        with self._lock:
+            self.invocations += 1
+        if self._roll() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise _error('ThrottlingException', 'InvokeAgent', 'Rate exceeded')
+        return {
+            'completion': self._completion(with_citation=self._roll() < self.citation_rate),
+            'sessionId': sessionId,
+            'contentType': 'application/json'
+        }
+
+    def _completion(self, with_citation):
+        time.sleep(self.ttft)
+        interval = 1.0 / self.token_rate if self.token_rate else 0.0
+        for index in range(self.tokens):
+            if index:
+                time.sleep(interval)
+            word = self.WORDS[index % len(self.WORDS)]
+            yield {'chunk': {'bytes': f'{word} '.encode('utf-8')}}
+        if with_citation:
+            yield {'citation': {
+                'generatedResponsePart': {'text': 'fragmento citado'},
+                'retrievedReferences': [{'location': {'s3Location': {'uri': 's3://fake/doc.pdf'}}}]
+            }}
+
+    def retrieve_and_generate(self, input, retrieveAndGenerateConfiguration, **kwargs):
+        time.sleep(self.ttft)
+        return {'output': {'text': ' '.join(self.WORDS)}, 'citations': []}
+
+
+def install(runtime=None, agent=None, s3=None, dynamodb=None):
+    """
+    Registrar los sustitutos en app.services.aws_clients para que toda la
+    aplicación los use. Devuelve los objetos instalados.
+    """
+    from app.services import aws_clients
+
+    fakes = {
+        'bedrock-agent-runtime': runtime or FakeBedrockAgentRuntime(),
+        'bedrock-agent': agent or FakeBedrockAgent(),
+        's3': s3 or FakeS3(),
+        'dynamodb': dynamodb or FakeDynamoDB()
+    }
+    aws_clients.reset()
+    for name in ('bedrock-agent-runtime', 'bedrock-agent', 's3'):
+        aws_clients.register(name, client=fakes[name])
+    aws_clients.register('dynamodb', resource=fakes['dynamodb'])
+    return fakes
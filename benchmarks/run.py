@@ -0,0 +1,298 @@
+"""
+Driver de carga: mide latencia (p50/p95/p99) y peticiones por segundo de los
+endpoints principales contra los sustitutos en memoria, y guarda el resultado
+en JSON para comparar versiones.
+
+    python -m benchmarks.run --duration 10 --concurrency 8 --ttft 0.3
+    python -m benchmarks.run --scenarios chat_send,chat_history --output out.json
+
+Las peticiones se hacen con el cliente de pruebas de Flask (en proceso): se mide
+la aplicación y sus dependencias simuladas, no la red ni el servidor WSGI.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config exige credenciales al importarse: se usan valores ficticios, nunca se llama a AWS.
+# Los límites por usuario se relajan para medir el servicio y no el rate limiting.
+BENCH_ENV = {
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'AWS_REGION': 'us-east-1',
+    'BEDROCK_AGENT_ID': 'BENCHAGENT',
+    'BEDROCK_KNOWLEDGE_BASE_ID': 'BENCHKB',
+    'S3_BUCKET_NAME': 'benchmark-bucket',
+    'AGENT_RATE_PER_MINUTE': '1000000',
+    'AGENT_RATE_BURST': '1000000'
+}
+for name, value in BENCH_ENV.items():
+    os.environ.setdefault(name, value)
+
+SCENARIOS = ('login', 'chat_send', 'chat_stream', 'chat_history', 'admin_upload')
+PASSWORD = 'benchmark-password'
+
+
+def percentile(values, pct):
+    """Percentil por rango más cercano (None si no hay valores)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, errors, elapsed):
+    summary = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / (len(samples) + errors), 4) if samples or errors else 0.0,
+        'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0
+    }
+    for pct in (50, 95, 99):
+        value = percentile(samples, pct)
+        summary[f'p{pct}_ms'] = round(value * 1000, 2) if value is not None else None
+    return summary
+
+
+class Environment:
+    """Sustitutos instalados, tablas creadas, usuarios sembrados y aplicación lista"""
+
+    def __init__(self, args):
+        from benchmarks import fakes
+
+        self.fakes = fakes.install(
+            runtime=fakes.FakeBedrockAgentRuntime(
+                ttft=args.ttft, token_rate=args.token_rate, tokens=args.tokens,
+                error_rate=args.error_rate, seed=args.seed
+            ),
+            agent=fakes.FakeBedrockAgent(latency=args.control_plane_latency)
+        )
+
+        from werkzeug.security import generate_password_hash
+        from bootstrap import provision_tables, provision_bucket
+        from app import create_app
+        from app.models import DynamoDB, User, ChatMessage
+        from app.services.s3_service import S3Service
+
+        self.db = DynamoDB()
+        provision_tables(self.db)
+        provision_bucket(S3Service())
+
+        password_hash = generate_password_hash(PASSWORD)
+        self.users = []
+        for index in range(args.concurrency):
+            user = User(str(uuid.uuid4()), f'bench-user-{index}@example.com', password_hash)
+            self.db.create_user(user)
+            self.users.append(user)
+            conversation_id = self.db.get_conversation_id(user.id)
+            self.db.batch_save_chat_messages([
+                ChatMessage(str(uuid.uuid4()), user.id, 'user' if n % 2 == 0 else 'assistant',
+                            f'mensaje de historial {n}', conversation_id=conversation_id)
+                for n in range(args.history)
+            ])
+        self.admin = User(str(uuid.uuid4()), 'bench-admin@example.com', password_hash, role='admin')
+        self.db.create_user(self.admin)
+
+        self.app = create_app()
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.upload_size = args.upload_size
+
+    def client(self, user=None):
+        client = self.app.test_client()
+        if user is not None:
+            with client.session_transaction() as session:
+                session['_user_id'] = user.id
+                session['_fresh'] = True
+        return client
+
+
+def _login(env, worker, counter):
+    user = env.users[worker]
+    response = env.client().post('/auth/login', data={'email': user.email, 'password': PASSWORD})
+    return response.status_code == 302, None
+
+
+def _chat_send(env, worker, counter):
+    client = env.clients[worker]
+    response = client.post('/api/chat/send', json={'message': f'pregunta send {worker}-{counter}'})
+    return response.status_code == 200 and response.get_json().get('success'), None
+
+
+def _chat_stream(env, worker, counter):
+    client = env.clients[worker]
+    started_at = time.perf_counter()
+    response = client.post('/api/chat/stream', json={'message': f'pregunta stream {worker}-{counter}'},
+                           buffered=False)
+    first_chunk = None
+    ok = False
+    for data in response.response:
+        if first_chunk is None and b'event: chunk' in data:
+            first_chunk = time.perf_counter() - started_at
+        if b'event: done' in data:
+            ok = True
+    response.close()
+    return ok and response.status_code == 200, first_chunk
+
+
+def _chat_history(env, worker, counter):
+    client = env.clients[worker]
+    response = client.get('/api/chat/history')
+    return response.status_code == 200 and response.get_json().get('success'), None
+
+
+def _admin_upload(env, worker, counter):
+    client = env.admin_clients[worker]
+    payload = io.BytesIO(b'%PDF-1.4 ' + os.urandom(max(env.upload_size - 9, 0)))
+    response = client.post('/admin/upload', data={
+        'document': (payload, f'bench-{worker}-{counter}.pdf'),
+        'description': 'benchmark',
+        'category': 'manuales'
+    }, content_type='multipart/form-data')
+    return response.status_code in (200, 302), None
+
+
+HANDLERS = {
+    'login': _login,
+    'chat_send': _chat_send,
+    'chat_stream': _chat_stream,
+    'chat_history': _chat_history,
+    'admin_upload': _admin_upload
+}
+
+
+def run_scenario(env, name, concurrency, duration):
+    handler = HANDLERS[name]
+    samples = []
+    first_chunks = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        counter = 0
+        while time.perf_counter() < deadline:
+            counter += 1
+            started_at = time.perf_counter()
+            try:
+                ok, first_chunk = handler(env, index, counter)
+            except Exception as e:
+                print(f"  {name}: {e}")
+                ok, first_chunk = False, None
+            latency = time.perf_counter() - started_at
+            with lock:
+                if ok:
+                    samples.append(latency)
+                    if first_chunk is not None:
+                        first_chunks.append(first_chunk)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    result = summarize(samples, errors[0], elapsed)
+    if first_chunks:
+        result['ttft_p50_ms'] = round(percentile(first_chunks, 50) * 1000, 2)
+        result['ttft_p95_ms'] = round(percentile(first_chunks, 95) * 1000, 2)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark sin conexión de la aplicación')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"Lista separada por comas ({', '.join(SCENARIOS)})")
+    parser.add_argument('--duration', type=float, default=10.0, help='Segundos por escenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Clientes simultáneos')
+    parser.add_argument('--ttft', type=float, default=0.3, help='Segundos hasta el primer fragmento del agente')
+    parser.add_argument('--token-rate', type=float, default=50.0, help='Fragmentos por segundo del agente')
+    parser.add_argument('--tokens', type=int, default=40, help='Fragmentos por respuesta')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de invocaciones que fallan')
+    parser.add_argument('--control-plane-latency', type=float, default=0.05,
+                        help='Latencia de las llamadas a bedrock-agent')
+    parser.add_argument('--history', type=int, default=100, help='Mensajes de historial por usuario')
+    parser.add_argument('--upload-size', type=int, default=256 * 1024, help='Bytes por documento subido')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Fichero JSON de resultados (por defecto benchmarks/results/)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in HANDLERS]
+    if unknown:
+        print(f"Escenarios desconocidos: {', '.join(unknown)}")
+        return 1
+
+    print("PREPARANDO ENTORNO DE BENCHMARK")
+    print("=" * 40)
+    env = Environment(args)
+    env.clients = [env.client(user) for user in env.users]
+    env.admin_clients = [env.client(env.admin) for _ in env.users]
+
+    results = {}
+    for name in scenarios:
+        print(f"Escenario {name}: {args.concurrency} clientes durante {args.duration}s")
+        results[name] = run_scenario(env, name, args.concurrency, args.duration)
+        print(f"  {json.dumps(results[name])}")
+
+    from app.services.chat_writer import chat_writer
+    chat_writer.flush(timeout=10)
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'bedrock_runtime': {
+            'invocations': env.fakes['bedrock-agent-runtime'].invocations,
+            'errors': env.fakes['bedrock-agent-runtime'].errors
+        },
+        'results': results
+    }
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(ROOT, 'benchmarks', 'results')
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("-" * 40)
+    print(f"{'endpoint':<14}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errores':>9}")
+    for name, result in results.items():
+        print(f"{name:<14}{result['rps']:>9}{result['p50_ms'] or '-':>10}{result['p95_ms'] or '-':>10}"
+              f"{result['p99_ms'] or '-':>10}{result['errors']:>9}")
+    print(f"Resultados guardados en {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
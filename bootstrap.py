@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Aprovisionar la infraestructura AWS (tablas DynamoDB y bucket S3).
+
+Se ejecuta una vez por despliegue, antes de arrancar la aplicación:
+
+    python bootstrap.py
+
+Con --rebuild-stats recalcula además las estadísticas del dashboard a partir
+de los datos existentes (necesario la primera vez).
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from app.models import DynamoDB
+from app.services.s3_service import S3Service
+from app.services.logging_config import configure_logging
+
+def provision_tables(db):
+    print("Tablas DynamoDB")
+    db._ensure_table_exists()
+    db.create_documents_table()
+    db.create_chat_table()
+    db.enable_chat_ttl()
+    db.create_stats_table()
+    db.create_coordination_table()
+
+def rebuild_stats(db):
+    print("Estadísticas materializadas")
+    stats = db.rebuild_stats()
+    print(f"Recalculadas: {stats['users_total']} usuarios, {stats['documents_total']} documentos, "
+          f"{stats['messages_total']} mensajes")
+
+def provision_bucket(s3_service):
+    print("Bucket S3")
+    s3_service.ensure_bucket_exists()
+    s3_service.ensure_bucket_cors(Config.S3_CORS_ORIGINS)
+
+def bootstrap(with_stats=False):
+    configure_logging(fmt='text')
+    print("APROVISIONANDO INFRAESTRUCTURA")
+    print("=" * 40)
+    started_at = time.perf_counter()
+    
+    db = DynamoDB()
+    s3_service = S3Service()
+    
+    steps = [
+        lambda: provision_tables(db),
+        lambda: provision_bucket(s3_service),
+    ]
+    if with_stats:
+        steps.append(lambda: rebuild_stats(db))
+    
+    ok = True
+    for step in steps:
+        try:
+            step()
+        except Exception as e:
+            ok = False
+            print(f"Error: {e}")
+    
+    print("-" * 40)
+    print(f"Completado en {time.perf_counter() - started_at:.2f}s")
+    return ok
+
+if __name__ == '__main__':
+    sys.exit(0 if bootstrap(with_stats='--rebuild-stats' in sys.argv) else 1)
@@ -5,8 +5,10 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.models import DynamoDB
+from app.services.logging_config import configure_logging
 
 def init_chat_table():
+    configure_logging(fmt='text')
     print("INICIALIZANDO TABLA DE CHAT")
     print("=" * 40)
     
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,12 +15,119 @@ class Config:
     # S3 Configuration
     S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME') or 'bmc-documents'
     S3_UPLOAD_FOLDER = 'uploads'
+    S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD') or 8 * 1024 * 1024)
+    S3_MULTIPART_CHUNKSIZE = int(os.environ.get('S3_MULTIPART_CHUNKSIZE') or 8 * 1024 * 1024)
+    S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY') or 8)
+    
+    BULK_UPLOAD_MAX_WORKERS = int(os.environ.get('BULK_UPLOAD_MAX_WORKERS') or 4)
+    
+    # Subidas directas del navegador a S3 (POST firmado)
+    S3_DIRECT_UPLOAD_MAX_SIZE = int(os.environ.get('S3_DIRECT_UPLOAD_MAX_SIZE') or 500 * 1024 * 1024)
+    S3_PRESIGNED_POST_EXPIRES = int(os.environ.get('S3_PRESIGNED_POST_EXPIRES') or 900)
+    S3_CORS_ORIGINS = [o.strip() for o in (os.environ.get('S3_CORS_ORIGINS') or 'http://localhost:5000').split(',') if o.strip()]
     
     # Bedrock Agent Configuration
     BEDROCK_AGENT_ID = os.environ.get('BEDROCK_AGENT_ID')
     BEDROCK_AGENT_ALIAS_ID = os.environ.get('BEDROCK_AGENT_ALIAS_ID') or 'TSTALIASID'
     BEDROCK_KNOWLEDGE_BASE_ID = os.environ.get('BEDROCK_KNOWLEDGE_BASE_ID')
     
+    # Caché de respuestas del agente
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES') or 500)
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL') or 3600)
+    RESPONSE_CACHE_TAG_REFRESH = int(os.environ.get('RESPONSE_CACHE_TAG_REFRESH') or 60)
+    
+    # Metadatos del agente de Bedrock (nombre, estado, alias)
+    AGENT_INFO_CACHE_TTL = float(os.environ.get('AGENT_INFO_CACHE_TTL') or 300)
+    AGENT_INFO_ERROR_TTL = float(os.environ.get('AGENT_INFO_ERROR_TTL') or 30)
+    
+    # Control de admisión de invocaciones al agente
+    AGENT_MAX_CONCURRENCY = int(os.environ.get('AGENT_MAX_CONCURRENCY') or 16)
+    AGENT_MAX_QUEUE = int(os.environ.get('AGENT_MAX_QUEUE') or 32)
+    AGENT_QUEUE_TIMEOUT = float(os.environ.get('AGENT_QUEUE_TIMEOUT') or 30)
+    AGENT_RATE_PER_MINUTE = float(os.environ.get('AGENT_RATE_PER_MINUTE') or 10)
+    AGENT_RATE_BURST = int(os.environ.get('AGENT_RATE_BURST') or 5)
+    AGENT_RETRY_AFTER = float(os.environ.get('AGENT_RETRY_AFTER') or 5)
+    
+    # Idempotency-Key en el envío de mensajes (tabla de coordinación compartida por los workers)
+    IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL') or 600)
+    
+    # Historial de chat (tabla ordenada por usuario y timestamp)
+    CHAT_TABLE_NAME = os.environ.get('CHAT_TABLE_NAME') or 'chat_history'
+    CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE') or 50)
+    CHAT_PURGE_MAX_WORKERS = int(os.environ.get('CHAT_PURGE_MAX_WORKERS') or 4)
+    # Retención opcional: días hasta que el TTL de DynamoDB elimina cualquier mensaje (0 = desactivado)
+    CHAT_MESSAGE_TTL_DAYS = int(os.environ.get('CHAT_MESSAGE_TTL_DAYS') or 0)
+    
+    # Escritura diferida de mensajes de chat
+    CHAT_WRITE_QUEUE_SIZE = int(os.environ.get('CHAT_WRITE_QUEUE_SIZE') or 5000)
+    CHAT_WRITE_FLUSH_INTERVAL = float(os.environ.get('CHAT_WRITE_FLUSH_INTERVAL') or 0.2)
+    # Mensajes que no se pudieron guardar tras los reintentos (JSONL, un elemento de la tabla por línea)
+    CHAT_DEAD_LETTER_FILE = os.environ.get('CHAT_DEAD_LETTER_FILE') or os.path.join(tempfile.gettempdir(), 'bmc-chat-dead-letter.jsonl')
+    
+    # Paginación de DynamoDB
+    DYNAMODB_SCAN_SEGMENTS = int(os.environ.get('DYNAMODB_SCAN_SEGMENTS') or 4)
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE') or 50)
+    
+    # Caché de usuarios (Flask-Login)
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES') or 10000)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 300)
+    USER_CACHE_NEGATIVE_TTL = int(os.environ.get('USER_CACHE_NEGATIVE_TTL') or 30)
+    
+    # Clientes AWS compartidos (pool de conexiones y timeouts)
+    AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS') or 50)
+    AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT') or 5)
+    AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT') or 30)
+    AWS_TCP_KEEPALIVE = (os.environ.get('AWS_TCP_KEEPALIVE') or 'true').lower() == 'true'
+    AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS') or 3)
+    BEDROCK_READ_TIMEOUT = float(os.environ.get('BEDROCK_READ_TIMEOUT') or 120)
+    
+    # Estado de la Knowledge Base (sync status): caché compartida y consultas en paralelo
+    KB_STATUS_CACHE_TTL = float(os.environ.get('KB_STATUS_CACHE_TTL') or 5)
+    KB_DATA_SOURCES_CACHE_TTL = float(os.environ.get('KB_DATA_SOURCES_CACHE_TTL') or 60)
+    KB_STATUS_MAX_WORKERS = int(os.environ.get('KB_STATUS_MAX_WORKERS') or 8)
+    SYNC_WATCH_ACTIVE_INTERVAL = float(os.environ.get('SYNC_WATCH_ACTIVE_INTERVAL') or 5)
+    SYNC_WATCH_IDLE_MAX_INTERVAL = float(os.environ.get('SYNC_WATCH_IDLE_MAX_INTERVAL') or 60)
+    SYNC_WATCH_KEEPALIVE = float(os.environ.get('SYNC_WATCH_KEEPALIVE') or 20)
+    
+    # Seguimiento de la indexación en la Knowledge Base
+    INGESTION_POLL_INTERVAL = float(os.environ.get('INGESTION_POLL_INTERVAL') or 15)
+    INGESTION_TRACK_TIMEOUT = float(os.environ.get('INGESTION_TRACK_TIMEOUT') or 1800)
+    
+    # Servidor de producción (gunicorn, workers gthread): ver gunicorn.conf.py
+    WEB_BIND = os.environ.get('WEB_BIND') or f"0.0.0.0:{os.environ.get('PORT') or 5000}"
+    WEB_WORKERS = int(os.environ.get('WEB_WORKERS') or os.cpu_count() or 1)
+    # Cada chat ocupa un hilo mientras espera a Bedrock: admitidos + en cola + margen
+    WEB_THREADS = int(os.environ.get('WEB_THREADS') or AGENT_MAX_CONCURRENCY + AGENT_MAX_QUEUE + 16)
+    WEB_GRACEFUL_TIMEOUT = float(os.environ.get('WEB_GRACEFUL_TIMEOUT') or BEDROCK_READ_TIMEOUT)
+    WEB_KEEPALIVE = int(os.environ.get('WEB_KEEPALIVE') or 5)
+    
+    # Perfilador por muestreo bajo demanda (/admin/profiler)
+    PROFILER_DIR = os.environ.get('PROFILER_DIR') or os.path.join(tempfile.gettempdir(), 'bmc-profiles')
+    PROFILER_SAMPLE_INTERVAL = float(os.environ.get('PROFILER_SAMPLE_INTERVAL') or 0.005)
+    PROFILER_MAX_SECONDS = float(os.environ.get('PROFILER_MAX_SECONDS') or 600)
+    
+    # Trazado por spans: se guardan las trazas lentas o con error y una muestra del resto
+    TRACE_ENABLED = (os.environ.get('TRACE_ENABLED') or 'true').lower() == 'true'
+    TRACE_FILE = os.environ.get('TRACE_FILE') or os.path.join(tempfile.gettempdir(), 'bmc-traces.jsonl')
+    TRACE_MAX_BYTES = int(os.environ.get('TRACE_MAX_BYTES') or 10 * 1024 * 1024)
+    TRACE_BACKUP_COUNT = int(os.environ.get('TRACE_BACKUP_COUNT') or 5)
+    TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE') or 0.05)
+    TRACE_SLOW_SECONDS = float(os.environ.get('TRACE_SLOW_SECONDS') or 10)
+    
+    # Logging estructurado asíncrono: LOG_LEVELS ajusta módulos ('app.models=DEBUG,botocore=WARNING')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_LEVELS = os.environ.get('LOG_LEVELS') or ''
+    LOG_FORMAT = os.environ.get('LOG_FORMAT') or 'json'
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE') or 10000)
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE') or 0.01)
+    LOG_FILE = os.environ.get('LOG_FILE')
+    LOG_FILE_MAX_BYTES = int(os.environ.get('LOG_FILE_MAX_BYTES') or 10 * 1024 * 1024)
+    LOG_FILE_BACKUP_COUNT = int(os.environ.get('LOG_FILE_BACKUP_COUNT') or 5)
+    
+    # /metrics (Prometheus): el scraper envía 'Authorization: Bearer <token>'.
+    # Sin token configurado el endpoint solo responde a sesiones de administrador.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
     # Validar credenciales
     if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
         raise ValueError("AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY must be set in environment variables")
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""
+Configuración de gunicorn para producción (valores derivados de Config):
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Las peticiones de chat pasan segundos esperando a Bedrock (E/S de red), así
+que cada worker usa hilos (gthread): un hilo por chat en curso, incluidos los
+streams SSE. Al recibir SIGTERM cada worker deja de aceptar conexiones, espera
+a que terminen las generaciones en curso (hasta WEB_GRACEFUL_TIMEOUT) y escribe
+los mensajes de chat pendientes antes de salir.
+"""
+
+from config import Config
+
+bind = Config.WEB_BIND
+worker_class = 'gthread'
+workers = Config.WEB_WORKERS
+threads = Config.WEB_THREADS
+# Con gthread el timeout vigila el latido del worker, no la duración de cada petición
+timeout = int(Config.BEDROCK_READ_TIMEOUT + 30)
+graceful_timeout = int(Config.WEB_GRACEFUL_TIMEOUT)
+keepalive = Config.WEB_KEEPALIVE
+# Sin preload: cada worker crea sus propios clientes boto3 e hilos de fondo
+preload_app = False
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # Por si la aplicación se cargó en el maestro: no compartir conexiones tras el fork
+    from app.services.aws_clients import reset
+    reset()
+
+
+def worker_exit(server, worker):
+    from app.services.chat_writer import chat_writer
+    pending = chat_writer.stats()['queue_depth']
+    chat_writer.shutdown(timeout=Config.WEB_GRACEFUL_TIMEOUT)
+    server.log.info(f"Worker {worker.pid}: {pending} mensajes de chat pendientes escritos al salir")
+    # Vaciar la cola de logging y de trazas antes de que el worker termine
+    from app.services.logging_config import shutdown_logging
+    shutdown_logging()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Migrar el historial de chat de la tabla antigua 'chat_messages' (clave
+message_id + índice user-id-index) a la tabla ordenada por usuario y tiempo
+(Config.CHAT_TABLE_NAME).
+
+    python migrate_chat_history.py [--source chat_messages]
+
+Es idempotente: cada mensaje conserva su message_id y timestamp, así que
+volver a ejecutarlo sobrescribe los mismos elementos.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import DynamoDB, ChatMessage, CHAT_TABLE
+from app.services.logging_config import configure_logging
+
+LEGACY_CHAT_TABLE = 'chat_messages'
+
+def migrate(source=LEGACY_CHAT_TABLE):
+    configure_logging(fmt='text')
+    print("MIGRANDO HISTORIAL DE CHAT")
+    print("=" * 40)
+    started_at = time.perf_counter()
+
+    db = DynamoDB()
+    db.create_chat_table()
+
+    items = db.parallel_scan(source)
+    print(f"Leídos {len(items)} mensajes de '{source}'")
+
+    migrated = 0
+    skipped = 0
+    with db.dynamodb.Table(CHAT_TABLE).batch_writer(overwrite_by_pkeys=['user_id', 'sort_key']) as batch:
+        for item in items:
+            if not item.get('user_id') or not item.get('timestamp'):
+                skipped += 1
+                continue
+            migrated_item = ChatMessage.from_dict(item).to_dict()
+            # Sin TTL: un mensaje antiguo no debe caducar nada más migrarse
+            migrated_item.pop('expires_at', None)
+            batch.put_item(Item=migrated_item)
+            migrated += 1
+
+    print("-" * 40)
+    print(f"Migrados {migrated} mensajes a '{CHAT_TABLE}' ({skipped} omitidos) "
+          f"en {time.perf_counter() - started_at:.2f}s")
+    return True
+
+if __name__ == '__main__':
+    source = LEGACY_CHAT_TABLE
+    if '--source' in sys.argv:
+        source = sys.argv[sys.argv.index('--source') + 1]
+    sys.exit(0 if migrate(source) else 1)
@@ -6,5 +6,6 @@ if __name__ == '__main__':
     print("Rutas registradas:")
     for rule in app.url_map.iter_rules():
         print(f"  {rule.endpoint}: {rule.rule}")
-    print("\nIniciando servidor...")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    print(f"\nArranque en frío: {app.config['STARTUP_SECONDS']}s")
+    print("Iniciando servidor de desarrollo (producción: gunicorn -c gunicorn.conf.py wsgi:app)...")
+    app.run(debug=True, threaded=True, host='0.0.0.0', port=5000)
\ No newline at end of file
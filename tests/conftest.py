@@ -0,0 +1,102 @@
+"""
+Fixtures comunes: la aplicación completa sobre los sustitutos en memoria de
+benchmarks/fakes.py (ninguna prueba llama a AWS).
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config valida las credenciales al importarse: valores ficticios antes de cargar la aplicación
+TEST_ENV = {
+    'AWS_ACCESS_KEY_ID': 'test',
+    'AWS_SECRET_ACCESS_KEY': 'test',
+    'AWS_REGION': 'us-east-1',
+    'BEDROCK_AGENT_ID': 'TESTAGENT',
+    'BEDROCK_KNOWLEDGE_BASE_ID': 'TESTKB',
+    'S3_BUCKET_NAME': 'test-bucket',
+    'TRACE_ENABLED': 'false',
+    'LOG_FORMAT': 'text',
+    'RESPONSE_CACHE_TAG_REFRESH': '0',
+    'CHAT_DEAD_LETTER_FILE': os.path.join(tempfile.gettempdir(), 'bmc-chat-dead-letter-tests.jsonl')
+}
+os.environ.update(TEST_ENV)
+
+
+@pytest.fixture
+def aws():
+    """Sustitutos de AWS recién instalados, con las tablas y el bucket creados"""
+    from benchmarks import fakes
+    from bootstrap import provision_tables, provision_bucket
+    from app.models import DynamoDB, pending_chat_stats
+    from app.services.s3_service import S3Service
+    from app.services.response_cache import response_cache
+
+    installed = fakes.install(runtime=fakes.FakeBedrockAgentRuntime(
+        ttft=0, token_rate=0, tokens=3, citation_rate=0, seed=1
+    ))
+    provision_tables(DynamoDB())
+    provision_bucket(S3Service())
+    response_cache.clear()
+    # Contadores acumulados por pruebas anteriores (de otras tablas en memoria)
+    pending_chat_stats.drain()
+    yield installed
+
+    # Los mensajes pendientes no deben escribirse sobre los sustitutos de la siguiente prueba
+    from app.services.chat_writer import chat_writer
+    chat_writer.flush(timeout=5)
+
+
+@pytest.fixture
+def db(aws):
+    from app.models import DynamoDB
+    return DynamoDB()
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture
+def user(db):
+    from app.models import User
+    user = User(str(uuid.uuid4()), f'{uuid.uuid4().hex[:8]}@example.com', 'hash')
+    db.create_user(user)
+    return user
+
+
+def _logged_in(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = user.id
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def client(app, user):
+    """Cliente con la sesión de `user` ya iniciada"""
+    return _logged_in(app, user)
+
+
+@pytest.fixture
+def admin(db):
+    from app.models import User
+    admin = User(str(uuid.uuid4()), f'{uuid.uuid4().hex[:8]}@example.com', 'hash', role='admin')
+    db.create_user(admin)
+    return admin
+
+
+@pytest.fixture
+def admin_client(app, admin):
+    """Cliente con la sesión de un administrador"""
+    return _logged_in(app, admin)
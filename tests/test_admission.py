@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from app.routes import chat as chat_routes
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def _controller(**kwargs):
+    options = dict(max_concurrency=1, max_queue=1, queue_timeout=0.2, rate_per_minute=600, burst=10)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def _rejection(controller, user_id, session_id):
+    with pytest.raises(AdmissionRejected) as info:
+        controller.acquire(user_id, session_id)
+    return info.value
+
+
+def test_rate_limited_after_the_burst(db):
+    controller = _controller(rate_per_minute=60, burst=1)
+    controller.acquire('u1', 's1').release()
+
+    error = _rejection(controller, 'u1', 's1')
+    assert error.reason == 'rate_limited'
+    assert error.retry_after >= 1
+    assert controller.stats()['rejected'] == {'rate_limited': 1}
+
+
+def test_second_turn_on_a_busy_session_fails_fast(db):
+    controller = _controller(max_concurrency=2)
+    ticket = controller.acquire('u1', 's1')
+
+    started_at = time.monotonic()
+    error = _rejection(controller, 'u1', 's1')
+    assert error.reason == 'session_busy'
+    assert time.monotonic() - started_at < 0.1
+
+    ticket.release()
+    controller.acquire('u1', 's1').release()
+    assert controller.stats()['sessions'] == 0
+
+
+def test_overloaded_when_the_queue_is_full(db):
+    controller = _controller(max_queue=0)
+    ticket = controller.acquire('u1', 's1')
+
+    assert _rejection(controller, 'u2', 's2').reason == 'overloaded'
+    ticket.release()
+
+
+def test_queue_timeout_when_no_slot_frees(db):
+    controller = _controller(queue_timeout=0.1)
+    ticket = controller.acquire('u1', 's1')
+
+    error = _rejection(controller, 'u2', 's2')
+    assert error.reason == 'queue_timeout'
+    assert error.retry_after >= 1
+    ticket.release()
+
+
+def test_waiter_is_admitted_when_a_slot_frees(db):
+    controller = _controller(queue_timeout=2)
+    ticket = controller.acquire('u1', 's1')
+    threading.Timer(0.05, ticket.release).start()
+
+    controller.acquire('u2', 's2').release()
+    stats = controller.stats()
+    assert stats['admitted'] == 2
+    assert stats['active'] == 0
+
+
+def test_route_answers_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(chat_routes, 'admission', _controller(rate_per_minute=60, burst=1))
+
+    assert client.post('/api/chat/send', json={'message': 'primera'}).get_json()['success']
+
+    response = client.post('/api/chat/send', json={'message': 'segunda'})
+    assert response.status_code == 429
+    assert response.get_json()['reason'] == 'rate_limited'
+    assert int(response.headers['Retry-After']) >= 1
+
+    response = client.post('/api/chat/stream', json={'message': 'tercera'})
+    assert response.status_code == 429
+    assert response.get_json()['reason'] == 'rate_limited'
+
+
+def test_rate_limit_and_sessions_are_shared_between_workers(db):
+    # Dos controladores hacen de dos procesos de gunicorn
+    worker_a = _controller(rate_per_minute=60, burst=2, max_concurrency=2)
+    worker_b = _controller(rate_per_minute=60, burst=2, max_concurrency=2)
+
+    ticket = worker_a.acquire('u1', 's1')
+    assert _rejection(worker_b, 'u1', 's1').reason == 'session_busy'
+    assert _rejection(worker_b, 'u1', 's2').reason == 'rate_limited'
+
+    ticket.release()
+    assert worker_b.stats()['sessions'] == 0
+    worker_b.acquire('u2', 's1').release()
+
+
+def test_stream_releases_the_ticket_when_saving_fails(client, monkeypatch):
+    controller = _controller()
+    monkeypatch.setattr(chat_routes, 'admission', controller)
+    monkeypatch.setattr(chat_routes.chat_writer, 'save', lambda message: 1 / 0)
+
+    response = client.post('/api/chat/stream', json={'message': 'hola'}, headers={'Idempotency-Key': 'clave'})
+    assert response.status_code == 500
+    assert controller.stats()['active'] == 0
+    assert controller.stats()['sessions'] == 0
+
+    monkeypatch.undo()
+    monkeypatch.setattr(chat_routes, 'admission', controller)
+    response = client.post('/api/chat/stream', json={'message': 'hola'}, headers={'Idempotency-Key': 'clave'})
+    assert 'event: done' in response.get_data(as_text=True)
@@ -0,0 +1,38 @@
+import io
+import time
+from datetime import datetime, timezone
+
+from app.routes import admin as admin_routes
+
+
+def test_each_file_is_tracked_from_the_end_of_its_own_upload(admin_client, admin, db, aws, monkeypatch):
+    s3 = aws['s3']
+    upload_fileobj = s3.upload_fileobj
+    finished = {}
+
+    def upload_fileobj_with_delay(Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        filename = ExtraArgs['Metadata']['original_filename']
+        time.sleep(0.2 if filename == 'lento.pdf' else 0)
+        upload_fileobj(Fileobj, Bucket, Key, ExtraArgs=ExtraArgs, **kwargs)
+        finished[filename] = datetime.now(timezone.utc)
+
+    tracked = []
+    monkeypatch.setattr(s3, 'upload_fileobj', upload_fileobj_with_delay)
+    monkeypatch.setattr(admin_routes.ingestion_tracker, 'track',
+                        lambda since, document_id=None: tracked.append((document_id, since)))
+
+    response = admin_client.post('/admin/upload/bulk', data={
+        'documents': [(io.BytesIO(b'rapido'), 'rapido.pdf'), (io.BytesIO(b'lento'), 'lento.pdf')],
+        'description': 'Lote de prueba',
+        'category': 'manuales'
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+
+    documents = {doc.original_filename: doc for doc in db.get_user_documents(admin.id)}
+    assert set(documents) == {'rapido.pdf', 'lento.pdf'}
+    for filename, document in documents.items():
+        assert datetime.fromisoformat(document.ingestion_since) >= finished[filename]
+
+    # Un job que empiece mientras sube el archivo lento no puede dar por indexado a este
+    assert documents['rapido.pdf'].ingestion_since < documents['lento.pdf'].ingestion_since
+    assert sorted(tracked) == sorted((doc.document_id, doc.ingestion_since) for doc in documents.values())
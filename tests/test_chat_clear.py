@@ -0,0 +1,80 @@
+import time
+import uuid
+
+from config import Config
+from app.models import ChatMessage
+from app.services.chat_purger import chat_purger
+from app.services.chat_writer import chat_writer
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'tiempo de espera agotado'
+        time.sleep(0.01)
+
+
+def _send(client, message):
+    response = client.post('/api/chat/send', json={'message': message})
+    assert response.get_json()['success']
+    chat_writer.flush(timeout=5)
+
+
+def _history(client):
+    return client.get('/api/chat/history').get_json()['history']
+
+
+def test_clear_starts_a_new_conversation_and_purges_the_old_one(client, db, user):
+    _send(client, 'primera pregunta')
+    assert len(_history(client)) == 2
+
+    completed = chat_purger.completed
+    assert client.post('/api/chat/clear').get_json()['success']
+    assert _history(client) == []
+
+    _send(client, 'segunda pregunta')
+    _wait_for(lambda: chat_purger.completed > completed)
+
+    assert db.get_user_chat_history(user.id, conversation_id='000000')[0] == []
+    current, _ = db.get_user_chat_history(user.id, conversation_id=db.get_conversation_id(user.id))
+    assert [message.content for message in current][0] == 'segunda pregunta'
+    assert len(current) == 2
+
+
+def test_clear_from_another_process_is_seen_immediately(client, db, user):
+    # El usuario queda en la caché del proceso; otro worker limpia el historial
+    db.get_user_by_id(user.id)
+    conversation_id = db.start_new_conversation(user.id)
+
+    _send(client, 'pregunta tras limpiar')
+    current, _ = db.get_user_chat_history(user.id, conversation_id=conversation_id)
+    assert len(current) == 2
+    assert db.get_user_chat_history(user.id, conversation_id='000000')[0] == []
+
+
+def test_purge_keeps_the_current_conversation(db):
+    old = [ChatMessage(str(uuid.uuid4()), 'u1', 'user', f'antiguo {n}', conversation_id='000000')
+           for n in range(30)]
+    current = [ChatMessage(str(uuid.uuid4()), 'u1', 'user', f'actual {n}', conversation_id='000001')
+               for n in range(3)]
+    assert db.batch_save_chat_messages(old + current) == []
+
+    assert db.purge_chat_history('u1', '000001') == (30, 0)
+    assert db.get_user_chat_history('u1', conversation_id='000000')[0] == []
+    assert len(db.get_user_chat_history('u1', conversation_id='000001')[0]) == 3
+
+
+def test_message_ttl_is_opt_in(db, aws, monkeypatch):
+    client = aws['dynamodb'].meta.client
+    calls = []
+    monkeypatch.setattr(client, 'update_time_to_live', lambda **kwargs: calls.append(kwargs))
+
+    monkeypatch.setattr(Config, 'CHAT_MESSAGE_TTL_DAYS', 0)
+    db.enable_chat_ttl()
+    assert calls == []
+    assert 'expires_at' not in ChatMessage(str(uuid.uuid4()), 'u1', 'user', 'hola').to_dict()
+
+    monkeypatch.setattr(Config, 'CHAT_MESSAGE_TTL_DAYS', 30)
+    db.enable_chat_ttl()
+    assert [call['TimeToLiveSpecification']['AttributeName'] for call in calls] == ['expires_at']
+    assert 'expires_at' in ChatMessage(str(uuid.uuid4()), 'u1', 'user', 'hola').to_dict()
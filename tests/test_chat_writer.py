@@ -0,0 +1,72 @@
+import json
+import uuid
+
+from app import models
+from app.models import ChatMessage, CHAT_TABLE
+from app.services.chat_writer import ChatMessageWriter
+
+
+def _messages(count, user_id='u1'):
+    return [ChatMessage(str(uuid.uuid4()), user_id, 'user', f'mensaje {n}') for n in range(count)]
+
+
+def _unprocessed(RequestItems):
+    return {'UnprocessedItems': RequestItems}
+
+
+def test_messages_are_written_in_batches_of_25(db, aws, monkeypatch):
+    dynamodb = aws['dynamodb']
+    sizes = []
+    batch_write_item = dynamodb.batch_write_item
+
+    def recording_batch_write_item(RequestItems):
+        sizes.append(len(RequestItems[CHAT_TABLE]))
+        return batch_write_item(RequestItems=RequestItems)
+
+    monkeypatch.setattr(dynamodb, 'batch_write_item', recording_batch_write_item)
+    stats_before = db.get_stats()['messages_total']
+
+    writer = ChatMessageWriter(db=db, flush_interval=0.5)
+    for message in _messages(60):
+        assert writer.save(message)
+    writer.flush(timeout=5)
+    writer.shutdown()
+
+    assert sizes == [25, 25, 10]
+    assert writer.stats()['written'] == 60
+    assert writer.stats()['failed'] == 0
+    assert len(db.get_user_chat_history('u1', limit=100)[0]) == 60
+    # Los contadores se escriben agrupados tras cada lote
+    assert db.get_stats()['messages_total'] == stats_before + 60
+
+
+def test_unprocessed_messages_are_rescued_one_by_one(db, aws, monkeypatch):
+    monkeypatch.setattr(aws['dynamodb'], 'batch_write_item', _unprocessed)
+    monkeypatch.setattr(models.time, 'sleep', lambda seconds: None)
+
+    writer = ChatMessageWriter(db=db, flush_interval=0)
+    for message in _messages(3):
+        writer.save(message)
+    writer.shutdown()
+
+    stats = writer.stats()
+    assert stats['rescued'] == 3
+    assert stats['failed'] == 0
+    assert len(db.get_user_chat_history('u1')[0]) == 3
+
+
+def test_lost_messages_go_to_the_dead_letter_file(db, aws, monkeypatch, tmp_path):
+    monkeypatch.setattr(aws['dynamodb'], 'batch_write_item', _unprocessed)
+    monkeypatch.setattr(models.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(db, 'save_chat_message', lambda message: False)
+    dead_letter_file = tmp_path / 'dead-letter.jsonl'
+
+    writer = ChatMessageWriter(db=db, flush_interval=0, dead_letter_file=str(dead_letter_file))
+    messages = _messages(2)
+    for message in messages:
+        writer.save(message)
+    writer.shutdown()
+
+    assert writer.stats()['failed'] == 2
+    lines = [json.loads(line) for line in dead_letter_file.read_text(encoding='utf-8').splitlines()]
+    assert [line['message_id'] for line in lines] == [message.message_id for message in messages]
@@ -0,0 +1,50 @@
+def _presign(client, **overrides):
+    payload = dict(filename='manual.pdf', content_type='application/pdf', category='manuales')
+    payload.update(overrides)
+    return client.post('/admin/api/uploads/presign', json=payload)
+
+
+def _complete(client, s3_key, description='Manual de procesos'):
+    return client.post('/admin/api/uploads/complete',
+                       json={'s3_key': s3_key, 'category': 'manuales', 'description': description})
+
+
+def test_presign_returns_a_post_for_the_admins_own_key(admin_client, admin):
+    response = _presign(admin_client)
+    assert response.status_code == 200
+    presigned = response.get_json()
+    assert presigned['success']
+    assert presigned['s3_key'].startswith(f'uploads/manuales/{admin.id}/')
+    assert presigned['fields']['key'] == presigned['s3_key']
+    assert presigned['max_size'] > 0
+
+
+def test_presign_validates_role_extension_and_category(client, admin_client):
+    assert _presign(client).status_code == 403
+    assert _presign(admin_client, filename='script.exe').status_code == 400
+    assert _presign(admin_client, category='desconocida').status_code == 400
+
+
+def test_complete_registers_the_uploaded_object_once(admin_client, admin, db, aws):
+    s3_key = _presign(admin_client).get_json()['s3_key']
+
+    # Todavía no se ha subido nada a S3
+    assert _complete(admin_client, s3_key).status_code == 404
+
+    aws['s3'].put_object(Bucket='test-bucket', Key=s3_key, Body=b'contenido',
+                         ContentType='application/pdf', Metadata={'original_filename': 'manual.pdf'})
+    first = _complete(admin_client, s3_key).get_json()
+    second = _complete(admin_client, s3_key).get_json()
+
+    assert first['success'] and second['success']
+    assert first['document_id'] == second['document_id']
+    assert first['original_filename'] == 'manual.pdf'
+    assert first['file_size'] == len(b'contenido')
+    assert [doc.s3_key for doc in db.get_user_documents(admin.id)] == [s3_key]
+
+
+def test_complete_rejects_keys_outside_the_admins_prefix(admin_client):
+    assert _complete(admin_client, 'uploads/manuales/otro-usuario/x.pdf').status_code == 400
+    assert _complete(admin_client, 'uploads/manuales/../x.pdf').status_code == 400
+    response = _complete(admin_client, 'uploads/manuales/x.pdf', description='  ')
+    assert response.status_code == 400
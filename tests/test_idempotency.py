@@ -0,0 +1,88 @@
+from app.services.chat_writer import chat_writer
+from app.services.idempotency import IdempotencyStore, CLAIMED, REPLAY, MISMATCH, IN_PROGRESS
+
+
+def test_send_with_the_same_key_is_replayed(client, db, user, aws):
+    runtime = aws['bedrock-agent-runtime']
+    headers = {'Idempotency-Key': 'clave-send'}
+
+    first = client.post('/api/chat/send', json={'message': 'pregunta idempotente'}, headers=headers)
+    second = client.post('/api/chat/send', json={'message': 'pregunta idempotente'}, headers=headers)
+
+    assert first.get_json()['success']
+    assert second.get_json() == first.get_json()
+    assert 'Idempotent-Replayed' not in first.headers
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert runtime.invocations == 1
+
+    chat_writer.flush(timeout=5)
+    assert len(db.get_user_chat_history(user.id)[0]) == 2
+
+
+def test_stream_with_a_completed_key_is_replayed(client, aws):
+    runtime = aws['bedrock-agent-runtime']
+    headers = {'Idempotency-Key': 'clave-stream'}
+
+    first = client.post('/api/chat/stream', json={'message': 'pregunta en streaming'}, headers=headers)
+    assert 'event: done' in first.get_data(as_text=True)
+
+    second = client.post('/api/chat/stream', json={'message': 'pregunta en streaming'}, headers=headers)
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert 'event: done' in second.get_data(as_text=True)
+    assert runtime.invocations == 1
+
+
+def test_failed_send_can_be_retried_with_the_same_key(client, aws):
+    runtime = aws['bedrock-agent-runtime']
+    headers = {'Idempotency-Key': 'clave-error'}
+
+    runtime.error_rate = 1.0
+    failed = client.post('/api/chat/send', json={'message': 'pregunta que falla'}, headers=headers)
+    assert not failed.get_json()['success']
+
+    runtime.error_rate = 0.0
+    retried = client.post('/api/chat/send', json={'message': 'pregunta que falla'}, headers=headers)
+    assert retried.get_json()['success']
+    assert 'Idempotent-Replayed' not in retried.headers
+    assert runtime.invocations == 2
+
+
+def test_same_key_with_another_message_is_rejected(client, aws):
+    headers = {'Idempotency-Key': 'clave-reutilizada'}
+    assert client.post('/api/chat/send', json={'message': 'primera'}, headers=headers).get_json()['success']
+
+    for endpoint in ('/api/chat/send', '/api/chat/stream'):
+        response = client.post(endpoint, json={'message': 'otra distinta'}, headers=headers)
+        assert response.status_code == 422
+    assert aws['bedrock-agent-runtime'].invocations == 1
+
+
+def test_key_used_on_send_is_replayed_on_stream(client, aws):
+    headers = {'Idempotency-Key': 'clave-compartida'}
+    sent = client.post('/api/chat/send', json={'message': 'misma pregunta'}, headers=headers).get_json()
+
+    streamed = client.post('/api/chat/stream', json={'message': 'misma pregunta'}, headers=headers)
+    assert streamed.headers['Idempotent-Replayed'] == 'true'
+    assert sent['message_id'] in streamed.get_data(as_text=True)
+    assert aws['bedrock-agent-runtime'].invocations == 1
+
+
+def test_keys_are_shared_between_workers(db):
+    # Dos instancias del almacén hacen de dos procesos de gunicorn
+    worker_a, worker_b = IdempotencyStore(), IdempotencyStore()
+
+    assert worker_a.claim('u1', 'clave', 'hola') == (CLAIMED, None)
+    assert worker_b.claim('u1', 'clave', 'hola') == (IN_PROGRESS, None)
+    assert worker_b.claim('u1', 'clave', 'adiós')[0] == MISMATCH
+
+    worker_a.complete('u1', 'clave', {'success': True, 'response': 'respuesta'})
+    assert worker_b.claim('u1', 'clave', 'hola') == (REPLAY, {'success': True, 'response': 'respuesta'})
+    # La misma clave de otro usuario es independiente
+    assert worker_b.claim('u2', 'clave', 'hola') == (CLAIMED, None)
+
+
+def test_failed_claim_is_released_for_another_worker(db):
+    worker_a, worker_b = IdempotencyStore(), IdempotencyStore()
+    assert worker_a.claim('u1', 'clave', 'hola')[0] == CLAIMED
+    worker_a.complete('u1', 'clave', {'success': False, 'error': 'fallo'})
+    assert worker_b.claim('u1', 'clave', 'hola')[0] == CLAIMED
@@ -0,0 +1,91 @@
+import io
+import time
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.datastructures import FileStorage
+
+from app.services import ingestion_tracker as tracking
+from app.services.ingestion_tracker import IngestionTracker
+from app.services.s3_service import S3Service
+
+SINCE = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class _Jobs:
+    def __init__(self, *jobs):
+        self.jobs = list(jobs)
+
+    def list_recent_ingestion_jobs(self):
+        return {'success': True, 'jobs': self.jobs}
+
+
+class _Documents:
+    def __init__(self):
+        self.updates = []
+
+    def update_document_ingestion(self, document_id, status, job_id):
+        self.updates.append((document_id, status, job_id))
+
+
+def _job(job_id, status, seconds):
+    return {'job_id': job_id, 'status': status, 'started_at': SINCE + timedelta(seconds=seconds)}
+
+
+def _tracker(monkeypatch, *jobs, timeout=60):
+    tracker = IngestionTracker(s3_service=_Jobs(*jobs), db=_Documents(), poll_interval=1, timeout=timeout)
+    # Las pruebas llaman a poll() directamente
+    monkeypatch.setattr(tracker, '_ensure_started', lambda: None)
+    return tracker
+
+
+def test_job_started_before_the_change_does_not_resolve_it(monkeypatch):
+    tracker = _tracker(monkeypatch, _job('antes', 'COMPLETE', -1))
+    tracker.track(SINCE, document_id='doc-1')
+    tracker.poll()
+    assert tracker.describe('doc-1')['status'] == tracking.PENDING
+    assert tracker.db.updates == []
+
+
+def test_complete_job_after_the_change_indexes_the_document(monkeypatch):
+    tracker = _tracker(monkeypatch, _job('antes', 'COMPLETE', -1), _job('despues', 'COMPLETE', 5))
+    tracker.track(SINCE.isoformat(), document_id='doc-1')
+    tracker.poll()
+    assert tracker.describe('doc-1')['status'] == tracking.INDEXED
+    assert tracker.db.updates == [('doc-1', tracking.INDEXED, 'despues')]
+
+
+def test_running_and_failed_jobs(monkeypatch):
+    tracker = _tracker(monkeypatch, _job('en-curso', 'IN_PROGRESS', 5))
+    tracker.track(SINCE, document_id='doc-1')
+    tracker.poll()
+    assert tracker.describe('doc-1')['status'] == tracking.INDEXING
+
+    tracker.s3_service.jobs = [_job('en-curso', 'FAILED', 5)]
+    tracker.poll()
+    assert tracker.describe('doc-1')['status'] == tracking.FAILED
+
+
+def test_unconfirmed_after_the_timeout(monkeypatch):
+    tracker = _tracker(monkeypatch, timeout=0.01)
+    tracker.track(SINCE, document_id='doc-1')
+    time.sleep(0.02)
+    tracker.poll()
+    assert tracker.describe('doc-1')['status'] == tracking.UNCONFIRMED
+
+
+def test_upload_since_is_taken_after_the_transfer(aws, monkeypatch):
+    s3 = aws['s3']
+    upload_fileobj = s3.upload_fileobj
+    finished = []
+
+    def slow_upload_fileobj(*args, **kwargs):
+        time.sleep(0.05)
+        upload_fileobj(*args, **kwargs)
+        finished.append(datetime.now(timezone.utc))
+
+    monkeypatch.setattr(s3, 'upload_fileobj', slow_upload_fileobj)
+    file = FileStorage(stream=io.BytesIO(b'contenido'), filename='manual.pdf', content_type='application/pdf')
+
+    result = S3Service().upload_file(file, folder='manuales', user_id='u1')
+    assert result['success']
+    assert datetime.fromisoformat(result['ingestion']['since']) >= finished[0]
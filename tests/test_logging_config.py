@@ -0,0 +1,62 @@
+import logging
+
+import pytest
+
+from config import Config
+from app.services import logging_config
+from app.services.logging_config import DebugSampler, SAMPLED_DEBUG_LOGGERS, configure_logging
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """configure_logging con la configuración indicada, restaurando el logging de pytest al final"""
+    root = logging.getLogger()
+    saved_root = (list(root.handlers), root.level)
+    saved_queues = list(logging_config._queues)
+    saved = {name: (list(logging.getLogger(name).filters), logging.getLogger(name).level)
+             for name in SAMPLED_DEBUG_LOGGERS}
+
+    def run(**settings):
+        for key, value in settings.items():
+            monkeypatch.setattr(Config, key, value)
+        monkeypatch.setattr(logging_config, '_configured_pid', None)
+        configure_logging(fmt='text')
+
+    yield run
+
+    for handler, listener in logging_config._queues:
+        if (handler, listener) not in saved_queues:
+            listener.stop()
+    logging_config._queues[:] = saved_queues
+    root.handlers[:] = saved_root[0]
+    root.setLevel(saved_root[1])
+    for name, (filters, level) in saved.items():
+        logger = logging.getLogger(name)
+        logger.filters[:] = filters
+        logger.setLevel(level)
+
+
+def _sampled(name):
+    return any(isinstance(f, DebugSampler) for f in logging.getLogger(name).filters)
+
+
+def test_service_loggers_are_sampled_by_default(configure):
+    configure(LOG_LEVEL='INFO', LOG_LEVELS='', LOG_DEBUG_SAMPLE_RATE=0.01)
+    for name in SAMPLED_DEBUG_LOGGERS:
+        assert _sampled(name)
+        assert logging.getLogger(name).level == logging.DEBUG
+
+
+def test_explicit_levels_are_not_sampled(configure):
+    configure(LOG_LEVEL='INFO', LOG_DEBUG_SAMPLE_RATE=0.01,
+              LOG_LEVELS='app.models=DEBUG,app.services=WARNING')
+
+    models = logging.getLogger('app.models')
+    assert not _sampled('app.models')
+    assert models.level == logging.DEBUG
+    assert models.filter(logging.makeLogRecord({'name': 'app.models', 'levelno': logging.DEBUG}))
+
+    # Un padre con nivel explícito también desactiva el muestreo de sus hijos
+    s3 = logging.getLogger('app.services.s3_service')
+    assert not _sampled('app.services.s3_service')
+    assert s3.getEffectiveLevel() == logging.WARNING
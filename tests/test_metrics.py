@@ -0,0 +1,21 @@
+from config import Config
+
+
+def test_metrics_without_token_are_admin_only(app, client, admin_client, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_TOKEN', None)
+
+    assert app.test_client().get('/metrics').status_code == 401
+    assert client.get('/metrics').status_code == 401
+    assert admin_client.get('/metrics').status_code == 200
+
+
+def test_metrics_with_token_require_the_bearer(app, admin_client, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_TOKEN', 'secreto')
+    anonymous = app.test_client()
+
+    assert anonymous.get('/metrics').status_code == 401
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer otro'}).status_code == 401
+    response = anonymous.get('/metrics', headers={'Authorization': 'Bearer secreto'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert admin_client.get('/metrics').status_code == 200
@@ -0,0 +1,43 @@
+import hashlib
+import io
+
+from werkzeug.datastructures import FileStorage
+
+from app.services.s3_service import S3Service, _HashingReader, upload_progress
+
+
+def test_hashing_reader_counts_and_hashes_every_chunk():
+    data = b'0123456789' * 1000
+    reader = _HashingReader(io.BytesIO(data))
+
+    chunks = []
+    while True:
+        chunk = reader.read(333)
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+    assert b''.join(chunks) == data
+    assert reader.size == len(data)
+    assert reader.checksum == hashlib.sha256(data).hexdigest()
+
+
+def test_hashing_reader_does_not_expose_seek():
+    # Sin seek/tell s3transfer no puede volver a leer el stream
+    reader = _HashingReader(io.BytesIO(b'datos'))
+    assert not hasattr(reader, 'seek')
+    assert not hasattr(reader, 'tell')
+
+
+def test_upload_reports_real_size_checksum_and_progress(aws):
+    data = b'x' * (3 * 1024 * 1024 + 7)
+    file = FileStorage(stream=io.BytesIO(data), filename='grande.pdf', content_type='application/pdf')
+
+    result = S3Service().upload_file(file, folder='manuales', user_id='u1', upload_id='subida-1')
+
+    assert result['success']
+    assert result['file_size'] == len(data)
+    assert result['checksum'] == hashlib.sha256(data).hexdigest()
+    assert upload_progress.get('subida-1') == {'transferred': len(data), 'total': len(data), 'done': True}
+    stored = aws['s3'].head_object(Bucket='test-bucket', Key=result['s3_key'])
+    assert stored['ContentLength'] == len(data)
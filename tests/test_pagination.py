@@ -0,0 +1,108 @@
+import base64
+import uuid
+from datetime import datetime, timedelta
+
+from app.models import DynamoDB, ChatMessage, User
+
+
+def _seed(db, user_id, numbers, conversation_id=None):
+    base = datetime(2024, 1, 1)
+    messages = [
+        ChatMessage(str(uuid.uuid4()), user_id, 'user', f'mensaje {n}',
+                    timestamp=(base + timedelta(seconds=n)).isoformat(),
+                    conversation_id=conversation_id)
+        for n in numbers
+    ]
+    assert db.batch_save_chat_messages(messages) == []
+
+
+def _contents(messages):
+    return [message.content for message in messages]
+
+
+def test_before_cursor_pages_back_to_the_first_message(db):
+    _seed(db, 'u1', range(7))
+
+    page, cursors = db.get_user_chat_history('u1', limit=3)
+    assert _contents(page) == ['mensaje 4', 'mensaje 5', 'mensaje 6']
+
+    page, cursors = db.get_user_chat_history('u1', limit=3, before=cursors['before'])
+    assert _contents(page) == ['mensaje 1', 'mensaje 2', 'mensaje 3']
+
+    page, cursors = db.get_user_chat_history('u1', limit=3, before=cursors['before'])
+    assert _contents(page) == ['mensaje 0']
+    assert cursors['before'] is None
+
+
+def test_after_cursor_returns_only_new_messages(db):
+    _seed(db, 'u1', range(3))
+    page, cursors = db.get_user_chat_history('u1', limit=10)
+    assert len(page) == 3
+    assert cursors['before'] is None
+
+    _seed(db, 'u1', range(3, 5))
+    page, new_cursors = db.get_user_chat_history('u1', limit=10, after=cursors['after'])
+    assert _contents(page) == ['mensaje 3', 'mensaje 4']
+
+    page, last_cursors = db.get_user_chat_history('u1', limit=10, after=new_cursors['after'])
+    assert page == []
+    assert last_cursors['after'] == new_cursors['after']
+
+
+def test_cursor_from_another_conversation_is_ignored(db):
+    _seed(db, 'u1', range(3), conversation_id='000000')
+    _seed(db, 'u1', range(3, 6), conversation_id='000001')
+
+    _, cursors = db.get_user_chat_history('u1', limit=2, conversation_id='000000')
+    page, other = db.get_user_chat_history('u1', limit=2, before=cursors['before'],
+                                           conversation_id='000001')
+    assert page == []
+    assert other['before'] is None
+
+
+def test_invalid_cursor_is_rejected():
+    assert DynamoDB.decode_cursor('no es un cursor') is None
+    assert DynamoDB.decode_cursor(None) is None
+    # JSON válido que no es una clave: lista, número, objeto vacío o con otros tipos
+    for raw in (b'[1]', b'123', b'{}', b'{"user_id": 1}'):
+        assert DynamoDB.decode_cursor(base64.urlsafe_b64encode(raw).decode('ascii')) is None
+    assert DynamoDB.decode_cursor(DynamoDB.encode_cursor({'otro': 'x'}), ('user_id',)) is None
+
+    cursor = DynamoDB.encode_cursor({'sort_key': '000000#2024-01-01T00:00:00#x'})
+    assert DynamoDB.decode_cursor(cursor, ('sort_key',)) == {'sort_key': '000000#2024-01-01T00:00:00#x'}
+
+
+def test_routes_ignore_malformed_cursors(client, admin_client):
+    for cursor in ('WzFd', 'MTIz', 'no-es-base64!'):
+        assert admin_client.get(f'/admin/users?cursor={cursor}').status_code == 200
+        assert admin_client.get(f'/admin/documents?cursor={cursor}').status_code == 200
+        for direction in ('before', 'after'):
+            payload = client.get(f'/api/chat/history?{direction}={cursor}').get_json()
+            assert payload['success']
+            assert payload['history'] == []
+
+
+def test_admin_dashboard_renders_from_the_main_dashboard(admin_client, client):
+    response = admin_client.get('/dashboard')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin/dashboard')
+    assert admin_client.get('/dashboard', follow_redirects=True).status_code == 200
+    assert client.get('/dashboard').status_code == 200
+
+
+def test_user_listing_walks_every_page(db):
+    created = set()
+    for _ in range(5):
+        user = User(str(uuid.uuid4()), f'{uuid.uuid4().hex[:8]}@example.com', 'hash')
+        db.create_user(user)
+        created.add(user.id)
+
+    seen = []
+    cursor = None
+    while True:
+        users, cursor = db.list_users_page(limit=2, cursor=cursor)
+        assert len(users) <= 2
+        seen.extend(user.id for user in users)
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(created)
@@ -0,0 +1,22 @@
+import pytest
+
+from app.routes.admin import _positive_number
+from app.services.profiler import profiler
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', '0', '-1', 'abc'])
+def test_positive_number_rejects_non_finite_and_non_positive(value):
+    with pytest.raises(ValueError):
+        _positive_number(value, float)
+
+
+def test_positive_number_accepts_positive_values():
+    assert _positive_number(' 2.5 ', float) == 2.5
+    assert _positive_number('3', int) == 3
+    assert _positive_number('', float) is None
+
+
+def test_profiler_is_not_armed_with_nan_seconds(admin_client):
+    response = admin_client.post('/admin/profiler', data={'pattern': '/api/chat', 'seconds': 'nan'})
+    assert response.status_code == 302
+    assert profiler.status() is None
@@ -0,0 +1,113 @@
+import uuid
+
+from app.models import User
+from app.services.chat_writer import chat_writer
+from app.services.response_cache import ResponseCache, completed_job_tag
+
+ANSWER = {'success': True, 'response': 'respuesta', 'citations': [], 'has_citations': False}
+
+
+def test_hit_ignores_case_spacing_and_punctuation():
+    cache = ResponseCache(tag_refresh=0)
+    _, tag = cache.get('¿Qué es un proceso disciplinario?')
+    cache.set('¿Qué es un proceso disciplinario?', ANSWER, tag)
+
+    cached, _ = cache.get('  qué es un   PROCESO disciplinario ')
+    assert cached['response'] == 'respuesta'
+
+
+def test_new_ingestion_job_invalidates_every_answer():
+    cache = ResponseCache(tag_refresh=0)
+    cache.update_tag('job-1')
+    _, tag = cache.get('pregunta')
+    cache.set('pregunta', ANSWER, tag)
+    assert cache.get('pregunta')[0] is not None
+
+    cache.update_tag('job-2')
+    assert cache.get('pregunta') == (None, 'job-2')
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_answer_generated_before_an_ingestion_is_not_stored():
+    cache = ResponseCache(tag_refresh=0)
+    cache.update_tag('job-1')
+    _, tag = cache.get('pregunta')
+
+    # Termina una ingestión mientras el agente genera la respuesta
+    cache.update_tag('job-2')
+    cache.set('pregunta', ANSWER, tag)
+
+    assert cache.get('pregunta')[0] is None
+    assert cache.stats()['stale_writes'] == 1
+
+
+def test_failed_answers_are_not_cached():
+    cache = ResponseCache(tag_refresh=0)
+    _, tag = cache.get('pregunta')
+    cache.set('pregunta', {'success': False, 'error': 'fallo'}, tag)
+    assert cache.get('pregunta')[0] is None
+
+
+def test_completed_job_tag_uses_the_latest_complete_job():
+    jobs = [
+        {'job_id': 'a', 'status': 'COMPLETE', 'started_at': 1},
+        {'job_id': 'b', 'status': 'COMPLETE', 'started_at': 3},
+        {'job_id': 'c', 'status': 'IN_PROGRESS', 'started_at': 5}
+    ]
+    assert completed_job_tag(jobs) == 'b'
+    assert completed_job_tag([{'job_id': 'c', 'status': 'FAILED', 'started_at': 5}]) is None
+
+
+def _login(app, db):
+    user = User(str(uuid.uuid4()), f'{uuid.uuid4().hex[:8]}@example.com', 'hash')
+    db.create_user(user)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = user.id
+        session['_fresh'] = True
+    return client
+
+
+def _recording(runtime, monkeypatch):
+    requests = []
+    invoke_agent = runtime.invoke_agent
+
+    def recording_invoke_agent(**kwargs):
+        requests.append(kwargs)
+        return invoke_agent(**kwargs)
+
+    monkeypatch.setattr(runtime, 'invoke_agent', recording_invoke_agent)
+    return requests
+
+
+def test_first_turn_is_shared_and_seeds_the_session_on_follow_up(app, db, aws, monkeypatch):
+    requests = _recording(aws['bedrock-agent-runtime'], monkeypatch)
+    first, second = _login(app, db), _login(app, db)
+
+    answer = first.post('/api/chat/send', json={'message': 'Pregunta frecuente'}).get_json()
+    cached = second.post('/api/chat/send', json={'message': 'pregunta frecuente'}).get_json()
+    assert cached['response'] == answer['response']
+    assert len(requests) == 1
+    chat_writer.flush(timeout=5)
+
+    # El seguimiento no se cachea y lleva a Bedrock el turno que no vio
+    assert second.post('/api/chat/send', json={'message': 'Pregunta frecuente'}).get_json()['success']
+    assert len(requests) == 2
+    seeded = requests[1]['sessionState']['conversationHistory']['messages']
+    assert [message['role'] for message in seeded] == ['user', 'assistant']
+    assert seeded[0]['content'] == [{'text': 'pregunta frecuente'}]
+    chat_writer.flush(timeout=5)
+
+    second.post('/api/chat/send', json={'message': 'tercera pregunta'})
+    assert 'sessionState' not in requests[2]
+
+
+def test_first_turn_answered_by_bedrock_is_not_seeded_again(client, aws, monkeypatch):
+    requests = _recording(aws['bedrock-agent-runtime'], monkeypatch)
+
+    client.post('/api/chat/stream', json={'message': 'pregunta única'}).get_data()
+    chat_writer.flush(timeout=5)
+    client.post('/api/chat/stream', json={'message': 'seguimiento'}).get_data()
+
+    assert len(requests) == 2
+    assert 'sessionState' not in requests[1]
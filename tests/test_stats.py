@@ -0,0 +1,74 @@
+import uuid
+
+from app.models import ChatMessage, Document, User, pending_chat_stats
+
+
+def _document(size, category='manuales', document_id=None):
+    document_id = document_id or str(uuid.uuid4())
+    return Document(document_id, f'{document_id}.pdf', 'manual.pdf', f'uploads/{category}/{document_id}.pdf',
+                    'https://example.com', size, 'application/pdf', 'u1', category=category)
+
+
+def test_user_counters_follow_creation_and_role_changes(db):
+    user = User(str(uuid.uuid4()), 'persona@example.com', 'hash')
+    db.create_user(user)
+    db.create_user(User(str(uuid.uuid4()), 'admin@example.com', 'hash', role='admin'))
+    stats = db.get_stats()
+    assert (stats['users_total'], stats['users_user'], stats['users_admin']) == (2, 1, 1)
+
+    db.update_user_role(user.id, 'admin')
+    stats = db.get_stats()
+    assert (stats['users_total'], stats['users_user'], stats['users_admin']) == (2, 0, 2)
+
+
+def test_document_counters_handle_overwrites_and_deletes(db):
+    document = _document(1000)
+    assert db.save_document(document)
+    assert db.save_documents_batch([_document(500, category='reportes')])
+    # Guardar de nuevo el mismo documento no lo cuenta dos veces
+    assert db.save_document(_document(1500, document_id=document.document_id))
+
+    stats = db.get_stats()
+    assert stats['documents_total'] == 2
+    assert stats['documents_bytes'] == 2000
+    assert stats['documents_by_category'] == {'manuales': 1, 'reportes': 1}
+
+    db.delete_document(document.document_id)
+    stats = db.get_stats()
+    assert (stats['documents_total'], stats['documents_bytes']) == (1, 500)
+    assert stats['documents_by_category'] == {'reportes': 1}
+
+
+def test_message_counters_are_batched_until_flushed(db):
+    messages = [ChatMessage(str(uuid.uuid4()), 'u1', 'user', f'mensaje {n}') for n in range(30)]
+    assert db.batch_save_chat_messages(messages) == []
+    assert db.get_stats()['messages_total'] == 0
+
+    db.flush_chat_stats()
+    stats = db.get_stats()
+    assert stats['messages_total'] == 30
+    assert stats['messages_per_day'][-1] == {'day': messages[0].timestamp[:10], 'count': 30}
+
+
+def test_failed_flush_keeps_the_counters(db, monkeypatch):
+    db.batch_save_chat_messages([ChatMessage(str(uuid.uuid4()), 'u1', 'user', 'hola')])
+
+    monkeypatch.setattr(db, '_increment_stats', lambda stat_id, counters: False)
+    db.flush_chat_stats()
+    assert pending_chat_stats.stats()['pending_items'] == 2
+
+    monkeypatch.undo()
+    db.flush_chat_stats()
+    assert pending_chat_stats.stats()['pending_items'] == 0
+    assert db.get_stats()['messages_total'] == 1
+
+
+def test_rebuild_matches_the_incremental_counters(db):
+    db.create_user(User(str(uuid.uuid4()), 'persona@example.com', 'hash'))
+    db.save_document(_document(700))
+    db.batch_save_chat_messages([ChatMessage(str(uuid.uuid4()), 'u1', 'user', 'hola')])
+    db.flush_chat_stats()
+    incremental = db.get_stats()
+
+    db.rebuild_stats()
+    assert db.get_stats() == incremental
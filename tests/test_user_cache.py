@@ -0,0 +1,60 @@
+import threading
+import uuid
+
+from app.models import User, UserCache, user_cache
+
+
+def _reads():
+    return user_cache.stats()['dynamodb_reads']
+
+
+def test_user_is_read_from_dynamodb_once(db, user):
+    user_cache.invalidate(user_id=user.id, email=user.email)
+    reads = _reads()
+
+    assert db.get_user_by_id(user.id).email == user.email
+    assert db.get_user_by_id(user.id).email == user.email
+    assert db.get_user_by_email(user.email).id == user.id
+    assert _reads() == reads + 1
+
+
+def test_unknown_user_is_cached_as_missing(db):
+    user_id = str(uuid.uuid4())
+    reads = _reads()
+
+    assert db.get_user_by_id(user_id) is None
+    assert db.get_user_by_id(user_id) is None
+    assert _reads() == reads + 1
+
+    # Crear el usuario invalida la entrada negativa
+    db.create_user(User(user_id, f'{uuid.uuid4().hex[:8]}@example.com', 'hash'))
+    assert db.get_user_by_id(user_id) is not None
+
+
+def test_role_change_is_visible_immediately(db, user):
+    assert db.get_user_by_id(user.id).role == 'user'
+    assert db.update_user_role(user.id, 'admin')
+    assert db.get_user_by_id(user.id).role == 'admin'
+
+
+def test_logged_in_requests_reuse_the_cached_user(client, user):
+    client.get('/api/chat/history')
+    reads = _reads()
+    for _ in range(3):
+        assert client.get('/api/chat/history').status_code == 200
+    assert _reads() == reads
+
+
+def test_read_counter_is_exact_across_threads():
+    cache = UserCache()
+
+    def record():
+        for _ in range(500):
+            cache.record_read('id')
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()['dynamodb_reads'] == 4000